@@ -3,14 +3,28 @@ from flask import Flask, render_template, request, redirect, url_for, flash, ses
 # from flask_wtf.csrf import CSRFProtect
 import os
 import json 
+import click
 from datetime import datetime
 from dotenv import load_dotenv
 from extensions import db, init_extensions
 from models import *
-from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from models import UserRole
 from flask_migrate import Migrate
+from orders import patients_with_order, order_rows_as_dicts, rebuild_patient_orders
+from loading import with_loading
+from catalog_cache import get_catalog, invalidate_catalog
+from passwords import hash_password, verify_and_upgrade, PasswordHasherBusy
+from patient_import import import_patients
+from patient_search import warm_patient_search, prune_patient_changes
+from queue_allocator import allocate_queue_number, reallocate_if_moved, release_queue_number
+from availability import appointment_changed
+from stock import rebuild_supply_totals, inventory_summary, rebuild_inventory_summary
+from dashboard_stats import dashboard_stats, reconcile_dashboard_stats
+from patient_portal import link_patient, dashboard_appointments, time_remaining
+from instrumentation import endpoint_stats
+from slow_queries import recent_slow_queries
+from metrics import init_metrics, render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
 from config import config
 
 # Initialize Flask ap
@@ -21,8 +35,11 @@ def create_app(config_name='default'):
 
 # Load configuration
     app.config.from_object(config[config_name])
+    # FLASK_* environment variables override it, e.g. FLASK_SQLALCHEMY_DATABASE_URI
+    app.config.from_prefixed_env()
     
     # Initialize Extensions
+    init_metrics(app)
     init_extensions(app)
     
     # Initialize Flask-Migrate
@@ -61,6 +78,7 @@ from routes import (
     users_bp,
     appointments_bp,
     auth_bp,
+    catalog_bp,
 )
 
 app.register_blueprint(patients_bp)
@@ -73,11 +91,53 @@ app.register_blueprint(pharmacy_bp)
 app.register_blueprint(users_bp)
 app.register_blueprint(appointments_bp)
 app.register_blueprint(auth_bp)
+app.register_blueprint(catalog_bp)
 
 
 # Create Tables
 with app.app_context():
     db.create_all()
+    # Patient search index, so the first searches do not wait for it
+    warm_patient_search()
+
+# Backfill Patient_Orders for patients created before the table existed
+@app.cli.command('rebuild-orders')
+def rebuild_orders_command():
+    count = rebuild_patient_orders()
+    print(f"Rebuilt doctor orders for {count} patients")
+
+# Bulk patient import: flask import-patients clinic.csv
+@app.cli.command('import-patients')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None)
+@click.option('--batch-size', default=5000)
+def import_patients_command(path, fmt, batch_size):
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'ndjson')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        report = import_patients(f, fmt, batch_size=batch_size)
+    print(json.dumps(report, indent=2))
+
+# Remove old patient search change log entries; run daily
+@app.cli.command('prune-patient-changes')
+def prune_patient_changes_command():
+    count = prune_patient_changes()
+    print(f"Removed {count} patient change log entries")
+
+@app.cli.command('rebuild-supply-totals')
+def rebuild_supply_totals_command():
+    count = rebuild_supply_totals()
+    print(f"Rebuilt usage totals for {count} supplies")
+
+@app.cli.command('rebuild-inventory-summary')
+def rebuild_inventory_summary_command():
+    names = rebuild_inventory_summary()
+    print(f"Rebuilt inventory summaries: {', '.join(names)}")
+
+# Recount today's dashboard figures; run from cron, e.g. hourly
+@app.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    counts = reconcile_dashboard_stats()
+    print(json.dumps(counts, indent=2))
 
 # Routes
 # Update the index route to handle the Patient role
@@ -109,53 +169,27 @@ def index():
 @app.route('/patient/dashboard')
 @role_required('Patient')
 def patient_dashboard():
-    # Get the current user's patient record
-    user_id = session.get('user_id')
-    user = Users.query.get(user_id)
-    
-    # Find the patient record associated with this user
-    patient = Patients.query.filter_by(Email=user.Email).first()
+    # The patient id is kept in the session at login; older sessions link it once
+    patient_id = session.get('patient_id')
+    if patient_id is None:
+        user = db.session.get(Users, session.get('user_id'))
+        patient_id = link_patient(user) if user else None
+        session['patient_id'] = patient_id
+    patient = db.session.get(Patients, patient_id) if patient_id else None
     
     if not patient:
         flash('Patient record not found', 'danger')
         return redirect(url_for('index'))
     
-    # Get appointments for this patient
-    appointments = Appointments.query.filter_by(PatientID=patient.PatientID).all()
-    
-    # Calculate time remaining for each appointment
+    # Recent and upcoming appointments only, with the status bucket from SQL
     now = datetime.now()
     current_date = now.strftime('%Y-%m-%d %H:%M')
     
-    for appointment in appointments:
-        if appointment.AppointmentDate and appointment.AppointmentDate > now:
-            # Calculate time difference
-            time_diff = appointment.AppointmentDate - now
-            
-            # Format the time difference
-            days = time_diff.days
-            hours, remainder = divmod(time_diff.seconds, 3600)
-            minutes, seconds = divmod(remainder, 60)
-            
-            if days > 0:
-                appointment.time_remaining = f"{days} days, {hours} hours"
-            elif hours > 0:
-                appointment.time_remaining = f"{hours} hours, {minutes} minutes"
-            else:
-                appointment.time_remaining = f"{minutes} minutes"
-                
-            # Update status based on time remaining
-            if days > 0:
-                appointment.Status = "Upcoming"
-            elif hours > 0:
-                appointment.Status = "Soon"
-            else:
-                appointment.Status = "Imminent"
-        elif appointment.AppointmentDate and appointment.AppointmentDate <= now:
-            appointment.time_remaining = "Passed"
-            appointment.Status = "Completed"
-        else:
-            appointment.time_remaining = "Unknown"
+    appointments = []
+    for appointment, status in dashboard_appointments(patient.PatientID, now):
+        appointment.Status = status
+        appointment.time_remaining = time_remaining(appointment.AppointmentDate, now)
+        appointments.append(appointment)
     
     # If patient.Report is None, set it to an empty string to avoid template errors
     if patient.Report is None:
@@ -174,7 +208,16 @@ def login():
         password = request.form.get('password')
         user = Users.query.filter_by(Email=email).first()
         
-        if user and check_password_hash(user.PasswordHash, password):
+        try:
+            valid = user is not None and verify_and_upgrade(user, password)
+        except PasswordHasherBusy as e:
+            flash(str(e), 'danger')
+            return render_template('login.html'), 503
+        
+        if valid:
+            # Save the upgraded hash if the KDF parameters changed
+            db.session.commit()
+            
             # Store user information in session
             session['user_id'] = user.UserID
             
@@ -185,6 +228,7 @@ def login():
                 session['user_role'] = user.Role  # For string values
                 
             session['user_name'] = user.Name
+            session['patient_id'] = user.PatientID
             
             flash('Login successful!', 'success')
             
@@ -241,7 +285,7 @@ def register():
 
         try:
             # Hash the password for security
-            password_hash = generate_password_hash(password)
+            password_hash = hash_password(password)
             
             # Create new user with role directly as string
             # This matches what's in the database enum
@@ -269,6 +313,7 @@ def logout():
     session.pop('user_id', None)
     session.pop('user_role', None)
     session.pop('user_name', None)
+    session.pop('patient_id', None)
     flash('You have been logged out!', 'success')
     return redirect(url_for('login'))
 
@@ -276,42 +321,64 @@ def logout():
 @app.route('/admin/dashboard')
 @role_required('Admin')
 def admin_dashboard():
-    return render_template('admin_dashboard.html')
+    return render_template('admin_dashboard.html', stats=dashboard_stats())
+
+@app.route('/admin/endpoint-stats')
+@role_required('Admin')
+def admin_endpoint_stats():
+    # Timings of this worker only, over the rolling window
+    return jsonify(endpoint_stats())
+
+@app.route('/admin/slow-queries')
+@role_required('Admin')
+def admin_slow_queries():
+    # Latest entries of this worker; the log (SLOW_QUERY_LOG_PATH) has all of them
+    return jsonify(recent_slow_queries())
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus scrape target, merged across gunicorn workers via METRICS_DIR
+    token = app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'message': 'Unauthorized'}), 401
+    return render_metrics(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
 
 @app.route('/doctor/dashboard')
 @role_required('Doctor')
 def doctor_dashboard():
-    return render_template('doctor_dashboard.html')
+    return render_template('doctor_dashboard.html', stats=dashboard_stats())
 
 @app.route('/nurse/dashboard')
 @role_required('Nurse')
 def nurse_dashboard():
-    return render_template('nurse_dashboard.html')
+    return render_template('nurse_dashboard.html', stats=dashboard_stats())
 
 @app.route('/receptionist/dashboard')
 @role_required('Receptionist')
 def receptionist_dashboard():
-    return render_template('receptionist_dashboard.html')
+    return render_template('receptionist_dashboard.html', stats=dashboard_stats())
 
 @app.route('/laboratory/dashboard')
 @role_required('Chemist')
 def laboratory_dashboard():
-    return render_template('laboratory_dashboard.html')
+    return render_template('laboratory_dashboard.html', stats=dashboard_stats())
 
 @app.route('/radiology/dashboard')
 @role_required('Radiologist')
 def radiology_dashboard():
-    return render_template('radiology_dashboard.html')
+    return render_template('radiology_dashboard.html', stats=dashboard_stats())
 
 @app.route('/pharmacy/dashboard')
 @role_required('Pharmacist')
 def pharmacy_dashboard():
-    return render_template('pharmacy_dashboard.html')
+    return render_template('pharmacy_dashboard.html', summary=inventory_summary('pharmacy'),
+                           stats=dashboard_stats())
 
 @app.route('/supplies/dashboard')
 @role_required('Admin')
 def supplies_dashboard():
-    return render_template('supplies_dashboard.html')
+    return render_template('supplies_dashboard.html', summary=inventory_summary('supplies'),
+                           stats=dashboard_stats())
 
 # User management routes (Admin only)
 @app.route('/users')
@@ -402,7 +469,7 @@ def delete_patient(id):
 @app.route('/appointments')
 @role_required('Admin', 'Receptionist', 'Doctor')
 def get_appointments():
-    appointments = Appointments.query.all()
+    appointments = with_loading(Appointments.query, 'appointments.html').all()
     return render_template('appointments.html', appointments=appointments)
 
 @app.route('/appointments/<int:id>')
@@ -419,11 +486,13 @@ def add_appointment():
             new_appointment = Appointments(
                 PatientID=request.form.get('patient_id'),
                 DoctorID=request.form.get('doctor_id'),
-                AppointmentDate=datetime.strptime(request.form.get('date'), '%Y-%m-%d %H:%M'),
-                QueueNumber=request.form.get('queue_number'),
-                AvailableSlots=request.form.get('available_slots')
+                AppointmentDate=datetime.strptime(request.form.get('date'), '%Y-%m-%d %H:%M')
             )
+            # Queue number and remaining slots are assigned by the server
+            new_appointment.QueueNumber, new_appointment.AvailableSlots = allocate_queue_number(
+                new_appointment.DoctorID, new_appointment.AppointmentDate)
             db.session.add(new_appointment)
+            appointment_changed(new_doctor_id=new_appointment.DoctorID, new_date=new_appointment.AppointmentDate)
             db.session.commit()
             flash('Appointment added successfully', 'success')
             return redirect(url_for('get_appointments'))
@@ -431,22 +500,23 @@ def add_appointment():
             db.session.rollback()
             flash(f'Error adding appointment: {str(e)}', 'danger')
     
-    patients = Patients.query.all()
-    doctors = Doctors.query.all()
+    patients = with_loading(Patients.query, 'patients.dropdown').all()
+    doctors = get_catalog('doctors')
     return render_template('add_appointment.html', patients=patients, doctors=doctors)
 
 @app.route('/appointments/edit/<int:id>', methods=['GET', 'POST'])
 @role_required('Admin', 'Receptionist', 'Doctor')
 def edit_appointment(id):
     appointment = Appointments.query.get_or_404(id)
+    old_doctor_id, old_date = appointment.DoctorID, appointment.AppointmentDate
     
     if request.method == 'POST':
         try:
             appointment.PatientID = request.form.get('patient_id')
             appointment.DoctorID = request.form.get('doctor_id')
             appointment.AppointmentDate = datetime.strptime(request.form.get('date'), '%Y-%m-%d %H:%M')
-            appointment.QueueNumber = request.form.get('queue_number')
-            appointment.AvailableSlots = request.form.get('available_slots')
+            reallocate_if_moved(appointment, old_doctor_id, old_date)
+            appointment_changed(old_doctor_id, old_date, appointment.DoctorID, appointment.AppointmentDate)
             
             db.session.commit()
             flash('Appointment updated successfully', 'success')
@@ -455,8 +525,8 @@ def edit_appointment(id):
             db.session.rollback()
             flash(f'Error updating appointment: {str(e)}', 'danger')
     
-    patients = Patients.query.all()
-    doctors = Doctors.query.all()
+    patients = with_loading(Patients.query, 'patients.dropdown').all()
+    doctors = get_catalog('doctors')
     return render_template('edit_appointment.html', appointment=appointment, patients=patients, doctors=doctors)
 
 @app.route('/appointments/delete/<int:id>', methods=['POST'])
@@ -464,6 +534,8 @@ def edit_appointment(id):
 def delete_appointment(id):
     appointment = Appointments.query.get_or_404(id)
     db.session.delete(appointment)
+    release_queue_number(appointment.DoctorID, appointment.AppointmentDate, appointment.QueueNumber)
+    appointment_changed(old_doctor_id=appointment.DoctorID, old_date=appointment.AppointmentDate)
     db.session.commit()
     flash('Appointment deleted successfully', 'success')
     return redirect(url_for('get_appointments'))
@@ -493,6 +565,7 @@ def add_medicine():
                 Price=request.form.get('price')
             )
             db.session.add(new_medicine)
+            invalidate_catalog('pharmacy')
             db.session.commit()
             flash('Medicine added successfully', 'success')
             return redirect(url_for('get_pharmacy'))
@@ -514,6 +587,7 @@ def edit_medicine(id):
             medicine.Quantity = request.form.get('quantity')
             medicine.Price = request.form.get('price')
             
+            invalidate_catalog('pharmacy')
             db.session.commit()
             flash('Medicine updated successfully', 'success')
             return redirect(url_for('get_medicine', id=medicine.MedicineID))
@@ -528,6 +602,7 @@ def edit_medicine(id):
 def delete_medicine(id):
     medicine = Pharmacy.query.get_or_404(id)
     db.session.delete(medicine)
+    invalidate_catalog('pharmacy')
     db.session.commit()
     flash('Medicine deleted successfully', 'success')
     return redirect(url_for('get_pharmacy'))
@@ -539,45 +614,8 @@ def view_medicine_patients(medicine_id):
     medicine = Pharmacy.query.get_or_404(medicine_id)
     
     # Find all patients who have this medicine in their doctor orders
-    patients_with_medicine = []
-    all_patients = Patients.query.all()
-    
-    for patient in all_patients:
-        if patient.DoctorOrders:
-            try:
-                orders = json.loads(patient.DoctorOrders)
-                if 'medications' in orders and orders['medications']:
-                    # Check if this medicine is in the patient's medications
-                    for medication in orders['medications']:
-                        if str(medication.get('id')) == str(medicine_id):
-                            # Get doctor name
-                            doctor_name = "N/A"
-                            if patient.Doctor:
-                                doctor = Doctors.query.get(patient.Doctor)
-                                if doctor:
-                                    doctor_name = doctor.Name
-                            
-                            # Get prescription date (using admission date as an approximation)
-                            prescription_date = patient.Date_admission
-                            if prescription_date:
-                                prescription_date = prescription_date.strftime('%Y-%m-%d %H:%M')
-                            else:
-                                prescription_date = "N/A"
-                            
-                            # Add patient to the list with additional info
-                            patient_info = {
-                                'PatientID': patient.PatientID,
-                                'Name': patient.Name,
-                                'Gender': patient.Gender,
-                                'Age': patient.Age,
-                                'DoctorName': doctor_name,
-                                'PrescriptionDate': prescription_date
-                            }
-                            patients_with_medicine.append(patient_info)
-                            break
-            except json.JSONDecodeError:
-                # Skip patients with invalid JSON in DoctorOrders
-                continue
+    rows = patients_with_order('medicine', medicine_id)
+    patients_with_medicine = order_rows_as_dicts(rows, 'PrescriptionDate')
     
     return render_template('medicine_patients.html', medicine=medicine, patients=patients_with_medicine)    
 #_________________________________________________________
@@ -595,45 +633,8 @@ def view_test_patients(test_id):
     test = Laboratory.query.get_or_404(test_id)
     
     # Find all patients who have this test in their doctor orders
-    patients_with_test = []
-    all_patients = Patients.query.all()
-    
-    for patient in all_patients:
-        if patient.DoctorOrders:
-            try:
-                orders = json.loads(patient.DoctorOrders)
-                if 'labTests' in orders and orders['labTests']:
-                    # Check if this test is in the patient's lab tests
-                    for lab_test in orders['labTests']:
-                        if str(lab_test.get('id')) == str(test_id):
-                            # Get doctor name
-                            doctor_name = "N/A"
-                            if patient.Doctor:
-                                doctor = Doctors.query.get(patient.Doctor)
-                                if doctor:
-                                    doctor_name = doctor.Name
-                            
-                            # Get test date (using admission date as an approximation)
-                            test_date = patient.Date_admission
-                            if test_date:
-                                test_date = test_date.strftime('%Y-%m-%d %H:%M')
-                            else:
-                                test_date = "N/A"
-                            
-                            # Add patient to the list with additional info
-                            patient_info = {
-                                'PatientID': patient.PatientID,
-                                'Name': patient.Name,
-                                'Gender': patient.Gender,
-                                'Age': patient.Age,
-                                'DoctorName': doctor_name,
-                                'TestDate': test_date
-                            }
-                            patients_with_test.append(patient_info)
-                            break
-            except json.JSONDecodeError:
-                # Skip patients with invalid JSON in DoctorOrders
-                continue
+    rows = patients_with_order('labTest', test_id)
+    patients_with_test = order_rows_as_dicts(rows, 'TestDate')
     
     return render_template('test_patients.html', test=test, patients=patients_with_test)
 
@@ -669,45 +670,8 @@ def view_radiology_patients(test_id):
     test = Radiology.query.get_or_404(test_id)
     
     # Find all patients who have this test in their doctor orders
-    patients_with_test = []
-    all_patients = Patients.query.all()
-    
-    for patient in all_patients:
-        if patient.DoctorOrders:
-            try:
-                orders = json.loads(patient.DoctorOrders)
-                if 'radiologyTests' in orders and orders['radiologyTests']:
-                    # Check if this test is in the patient's radiology tests
-                    for rad_test in orders['radiologyTests']:
-                        if str(rad_test.get('id')) == str(test_id):
-                            # Get doctor name
-                            doctor_name = "N/A"
-                            if patient.Doctor:
-                                doctor = Doctors.query.get(patient.Doctor)
-                                if doctor:
-                                    doctor_name = doctor.Name
-                            
-                            # Get test date (using admission date as an approximation)
-                            test_date = patient.Date_admission
-                            if test_date:
-                                test_date = test_date.strftime('%Y-%m-%d %H:%M')
-                            else:
-                                test_date = "N/A"
-                            
-                            # Add patient to the list with additional info
-                            patient_info = {
-                                'PatientID': patient.PatientID,
-                                'Name': patient.Name,
-                                'Gender': patient.Gender,
-                                'Age': patient.Age,
-                                'DoctorName': doctor_name,
-                                'TestDate': test_date
-                            }
-                            patients_with_test.append(patient_info)
-                            break
-            except json.JSONDecodeError:
-                # Skip patients with invalid JSON in DoctorOrders
-                continue
+    rows = patients_with_order('radiologyTest', test_id)
+    patients_with_test = order_rows_as_dicts(rows, 'TestDate')
     
     return render_template('radiology_patients.html', test=test, patients=patients_with_test)    
 #____________________________________________________
@@ -724,6 +688,7 @@ def delete_radiology_test(test_id):
     try:
         test = Radiology.query.get_or_404(test_id)
         db.session.delete(test)
+        invalidate_catalog('radiology')
         db.session.commit()
         flash('Radiology test deleted successfully', 'success')
     except Exception as e:
@@ -755,6 +720,7 @@ def add_supply():
                 UnitPrice=request.form.get('UnitPrice')
             )
             db.session.add(new_supply)
+            invalidate_catalog('supplies')
             db.session.commit()
             flash('Supply added successfully', 'success')
             return redirect(url_for('get_supplies'))
@@ -775,6 +741,7 @@ def edit_supply(id):
             supply.Quantity = request.form.get('Quantity')
             supply.UnitPrice = request.form.get('UnitPrice')
             
+            invalidate_catalog('supplies')
             db.session.commit()
             flash('Supply updated successfully', 'success')
             return redirect(url_for('get_supply', id=supply.SupplyID))
@@ -789,6 +756,7 @@ def edit_supply(id):
 def delete_supply(id):
     supply = Supplies.query.get_or_404(id)
     db.session.delete(supply)
+    invalidate_catalog('supplies')
     db.session.commit()
     flash('Supply deleted successfully', 'success')
     return redirect(url_for('get_supplies'))
@@ -801,47 +769,18 @@ def view_supply_patients(supply_id):
     supply = Supplies.query.get_or_404(supply_id)
     
     # Find all patients who have this supply in their doctor orders
-    patients_with_supply = []
-    all_patients = Patients.query.all()
-    
-    for patient in all_patients:
-        if patient.DoctorOrders:
-            try:
-                orders = json.loads(patient.DoctorOrders)
-                if 'supplies' in orders and orders['supplies']:
-                    # Check if this supply is in the patient's supplies
-                    for item in orders['supplies']:
-                        if str(item.get('id')) == str(supply_id):
-                            # Get doctor name
-                            doctor_name = "N/A"
-                            if patient.Doctor:
-                                doctor = Doctors.query.get(patient.Doctor)
-                                if doctor:
-                                    doctor_name = doctor.Name
-                            
-                            # Get order date (using admission date as an approximation)
-                            order_date = patient.Date_admission
-                            if order_date:
-                                order_date = order_date.strftime('%Y-%m-%d %H:%M')
-                            else:
-                                order_date = "N/A"
-                            
-                            # Add patient to the list with additional info
-                            patient_info = {
-                                'PatientID': patient.PatientID,
-                                'Name': patient.Name,
-                                'Gender': patient.Gender,
-                                'Age': patient.Age,
-                                'DoctorName': doctor_name,
-                                'OrderDate': order_date
-                            }
-                            patients_with_supply.append(patient_info)
-                            break
-            except json.JSONDecodeError:
-                # Skip patients with invalid JSON in DoctorOrders
-                continue
-    
-    return render_template('supply_patients.html', supply=supply, patients=patients_with_supply)    
+    rows = patients_with_order('supply', supply_id)
+    patients_with_supply = order_rows_as_dicts(rows, 'OrderDate')
+    
+    # Quantities come from the running totals, not from summing the usage ledger
+    used = dict(db.session.query(Patient_Supplies.PatientID, Patient_Supplies.QuantityUsed)
+                .filter(Patient_Supplies.SupplyID == supply_id))
+    for patient in patients_with_supply:
+        patient['QuantityUsed'] = used.get(patient['PatientID'], 0)
+    totals = db.session.get(SupplyUsageTotals, supply_id)
+    
+    return render_template('supply_patients.html', supply=supply, patients=patients_with_supply,
+                           usage_totals=totals)    
 #_________________________________________
 @app.route('/users/view/<int:id>')
 @role_required('Admin')
@@ -871,7 +810,7 @@ def edit_user(id):
             # Update password if provided
             new_password = request.form.get('password')
             if new_password:
-                user.PasswordHash = generate_password_hash(new_password)
+                user.PasswordHash = hash_password(new_password)
             
             db.session.commit()
             flash('User updated successfully', 'success')
@@ -912,6 +851,7 @@ def create_department():
             
         new_department = Departments(DepartmentName=department_name)
         db.session.add(new_department)
+        invalidate_catalog('departments')
         db.session.commit()
         flash('Department added successfully', 'success')
     except Exception as e:
@@ -932,6 +872,7 @@ def update_department(department_id):
             return redirect(url_for('get_departments_page'))
             
         department.DepartmentName = department_name
+        invalidate_catalog('departments')
         db.session.commit()
         flash('Department updated successfully', 'success')
     except Exception as e:
@@ -947,6 +888,7 @@ def delete_department(department_id):
         
         department = Departments.query.get_or_404(department_id)
         db.session.delete(department)
+        invalidate_catalog('departments')
         db.session.commit()
         flash('Department deleted successfully', 'success')
     except Exception as e:
@@ -973,10 +915,13 @@ def delete_doctor_web(doctor_id):
         # For example, if there are appointments linked to this doctor
         appointments = Appointments.query.filter_by(DoctorID=doctor_id).all()
         for appointment in appointments:
+            release_queue_number(appointment.DoctorID, appointment.AppointmentDate, appointment.QueueNumber)
+            appointment_changed(old_doctor_id=appointment.DoctorID, old_date=appointment.AppointmentDate)
             db.session.delete(appointment)
         
         # Now delete the doctor
         db.session.delete(doctor)
+        invalidate_catalog('doctors')
         db.session.commit()
         flash('Doctor deleted successfully', 'success')
     except Exception as e:
@@ -0,0 +1,105 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+import jwt
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import UserRole, RevokedTokens
+
+ACCESS_TOKEN_MINUTES = 15
+REFRESH_TOKEN_DAYS = 7
+REVOCATION_CHECK_SECONDS = 5.0
+ALGORITHM = 'HS256'
+
+class TokenUser:
+    """The current user as described by a verified access token (no DB row behind it)"""
+    def __init__(self, claims):
+        self.UserID = int(claims['sub'])
+        self.Name = claims.get('name')
+        self.Email = claims.get('email')
+        self.Role = UserRole(claims['role'])
+        self.PatientID = claims.get('patient_id')
+
+def _secret():
+    return current_app.config.get('JWT_SECRET_KEY') or current_app.config['SECRET_KEY']
+
+def _encode(claims, lifetime):
+    now = datetime.utcnow()
+    claims = dict(claims, jti=uuid.uuid4().hex, iat=now, exp=now + lifetime)
+    return jwt.encode(claims, _secret(), algorithm=ALGORITHM)
+
+def create_tokens(user):
+    """Return (access_token, refresh_token) for a Users row"""
+    role = user.Role.value if hasattr(user.Role, 'value') else user.Role
+    claims = {'sub': str(user.UserID), 'role': role, 'name': user.Name, 'email': user.Email,
+              'patient_id': user.PatientID}
+    access_minutes = current_app.config.get('JWT_ACCESS_TOKEN_MINUTES', ACCESS_TOKEN_MINUTES)
+    refresh_days = current_app.config.get('JWT_REFRESH_TOKEN_DAYS', REFRESH_TOKEN_DAYS)
+    access = _encode(dict(claims, type='access'), timedelta(minutes=access_minutes))
+    refresh = _encode({'sub': claims['sub'], 'type': 'refresh'}, timedelta(days=refresh_days))
+    return access, refresh
+
+def decode_token(token, expected_type):
+    """Verify signature, expiry, type and revocation; raises jwt.InvalidTokenError"""
+    claims = jwt.decode(token, _secret(), algorithms=[ALGORITHM])
+    if claims.get('type') != expected_type:
+        raise jwt.InvalidTokenError(f'Wrong token type, expected {expected_type}')
+    if is_revoked(claims['jti']):
+        raise jwt.InvalidTokenError('Token has been revoked')
+    return claims
+
+# Revocation list: persisted in RevokedTokens, mirrored per worker and
+# re-read at most every REVOCATION_CHECK_SECONDS so verifying a token
+# normally costs no query.
+_lock = threading.Lock()
+_revoked = {}  # jti -> expiry
+_revoked_checked_at = 0.0
+
+def _refresh_revoked():
+    global _revoked_checked_at
+    ttl = current_app.config.get('JWT_REVOCATION_CHECK_SECONDS', REVOCATION_CHECK_SECONDS)
+    now = time.monotonic()
+    if now - _revoked_checked_at < ttl:
+        return
+    rows = (db.session.query(RevokedTokens.JTI, RevokedTokens.ExpiresAt)
+            .filter(RevokedTokens.ExpiresAt > datetime.utcnow())
+            .all())
+    _revoked.clear()
+    _revoked.update({jti: expires_at for jti, expires_at in rows})
+    _revoked_checked_at = now
+
+def is_revoked(jti):
+    with _lock:
+        _refresh_revoked()
+        return jti in _revoked
+
+def _insert_revoked(claims):
+    """Insert the token's jti and commit; IntegrityError if it is already there"""
+    expires_at = datetime.utcfromtimestamp(claims['exp'])
+    # Expired entries no longer need to be remembered
+    RevokedTokens.query.filter(RevokedTokens.ExpiresAt <= datetime.utcnow()).delete()
+    db.session.add(RevokedTokens(JTI=claims['jti'], ExpiresAt=expires_at))
+    try:
+        db.session.commit()
+    finally:
+        with _lock:
+            _revoked[claims['jti']] = expires_at
+
+def revoke_token(claims):
+    """Add a decoded token to the revocation list and commit"""
+    try:
+        _insert_revoked(claims)
+    except IntegrityError:
+        # Revoked by a concurrent request, which is just as good
+        db.session.rollback()
+
+def consume_token(claims):
+    """Revoke a single-use token; raises jwt.InvalidTokenError if it was already used"""
+    # The primary key decides between concurrent uses, whatever the cache says
+    try:
+        _insert_revoked(claims)
+    except IntegrityError:
+        db.session.rollback()
+        raise jwt.InvalidTokenError('Token has already been used')
@@ -0,0 +1,141 @@
+import bisect
+import threading
+from itertools import islice
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from catalog_cache import get_catalog, catalog_version
+from tracking import track_history, committed_value
+from models import Pharmacy, Supplies, Laboratory, Radiology
+
+# Typeahead over catalog names for the doctor-orders form.
+# Each worker keeps, per catalog, a sorted array of (key, word position, name,
+# id) where key is the lower-cased name from each word onwards, so "500"
+# finds "Paracetamol 500mg". Arrays follow the catalog's CatalogVersions row:
+# names changed by this worker's own commits are patched in with insort, a
+# change from another worker makes the next lookup rebuild from get_catalog().
+AUTOCOMPLETE_CATALOGS = {
+    'pharmacy': (Pharmacy, 'MedicineID', 'MedicineName'),
+    'supplies': (Supplies, 'SupplyID', 'ItemName'),
+    'laboratory': (Laboratory, 'TestID', 'TestName'),
+    'radiology': (Radiology, 'RadiologyID', 'TestName'),
+}
+_catalog_of = {spec[0]: name for name, spec in AUTOCOMPLETE_CATALOGS.items()}
+track_history(*[getattr(model, name_key) for model, _, name_key in AUTOCOMPLETE_CATALOGS.values()])
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+def _entries_for(item_id, name):
+    words = (name or '').lower().split()
+    return [(' '.join(words[i:]), i, name, item_id) for i in range(len(words))]
+
+class _Prefix:
+    def __init__(self, version, entries):
+        self.version = version
+        self.entries = sorted(entries)
+
+    def add(self, item_id, name):
+        for entry in _entries_for(item_id, name):
+            bisect.insort(self.entries, entry)
+
+    def remove(self, item_id, name):
+        for entry in _entries_for(item_id, name):
+            position = bisect.bisect_left(self.entries, entry)
+            if position < len(self.entries) and self.entries[position] == entry:
+                del self.entries[position]
+
+_lock = threading.Lock()
+_indexes = {}  # catalog -> _Prefix
+stats = {'hits': 0, 'misses': 0}
+
+def _get_index(catalog):
+    version = catalog_version(catalog)
+    with _lock:
+        index = _indexes.get(catalog)
+        if index is not None and index.version == version:
+            stats['hits'] += 1
+        else:
+            stats['misses'] += 1
+            _, id_key, name_key = AUTOCOMPLETE_CATALOGS[catalog]
+            entries = []
+            for row in get_catalog(catalog):
+                entries.extend(_entries_for(row[id_key], row[name_key]))
+            index = _indexes[catalog] = _Prefix(version, entries)
+        return index
+
+def suggest(catalog, q, limit=DEFAULT_LIMIT):
+    """Up to limit {id column: ..., name column: ...} dicts whose name has a word starting with q"""
+    prefix = ' '.join(q.lower().split())
+    if not prefix:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+    _, id_key, name_key = AUTOCOMPLETE_CATALOGS[catalog]
+    index = _get_index(catalog)
+
+    with _lock:
+        start = bisect.bisect_left(index.entries, (prefix,))
+        found = {}
+        # Look a bit past limit so names that start with q can outrank mid-name matches
+        for key, position, name, item_id in islice(index.entries, start, start + limit * 10):
+            if not key.startswith(prefix):
+                break
+            if item_id not in found or position < found[item_id][0]:
+                found[item_id] = (position, name)
+
+    ranked = sorted(found.items(), key=lambda item: (item[1][0] > 0, len(item[1][1]), item[1][1].lower()))
+    return [{id_key: item_id, name_key: name} for item_id, (_, name) in ranked[:limit]]
+
+def _changed_items(objects):
+    for obj in objects:
+        catalog = _catalog_of.get(type(obj))
+        if catalog is not None:
+            _, id_key, name_key = AUTOCOMPLETE_CATALOGS[catalog]
+            yield obj, catalog, id_key, name_key
+
+@event.listens_for(Session, 'before_flush')
+def _collect_name_changes(session, flush_context, instances):
+    # Old names must be read before the flush deletes or overwrites the rows
+    changes = session.info.setdefault('autocomplete_changes', [])
+    for obj, catalog, id_key, name_key in _changed_items(session.deleted):
+        changes.append((catalog, 'remove', getattr(obj, id_key), committed_value(obj, name_key)))
+    for obj, catalog, id_key, name_key in _changed_items(session.dirty):
+        if obj not in session.deleted and inspect(obj).attrs[name_key].history.has_changes():
+            changes.append((catalog, 'remove', getattr(obj, id_key), committed_value(obj, name_key)))
+            changes.append((catalog, 'add', getattr(obj, id_key), getattr(obj, name_key)))
+
+@event.listens_for(Session, 'after_flush')
+def _collect_new_items(session, flush_context):
+    # Ids of new rows are only known once they are inserted
+    changes = session.info.setdefault('autocomplete_changes', [])
+    for obj, catalog, id_key, name_key in _changed_items(session.new):
+        changes.append((catalog, 'add', getattr(obj, id_key), getattr(obj, name_key)))
+
+@event.listens_for(Session, 'after_commit')
+def _apply_name_changes(session):
+    # Savepoint commits fire this event too; wait for the real commit
+    if session.in_nested_transaction():
+        return
+    versions = session.info.pop('catalog_versions', {})
+    changes = session.info.pop('autocomplete_changes', None)
+    if not changes:
+        return
+    with _lock:
+        for catalog in {change[0] for change in changes}:
+            index = _indexes.get(catalog)
+            version = versions.get(catalog)
+            if index is None:
+                continue
+            if version is None or index.version != version - 1:
+                # Not bumped by this commit alone; rebuild on the next lookup
+                del _indexes[catalog]
+                continue
+            for changed_catalog, op, item_id, name in changes:
+                if changed_catalog == catalog:
+                    getattr(index, op)(item_id, name)
+            index.version = version
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_name_changes(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('catalog_versions', None)
+    session.info.pop('autocomplete_changes', None)
@@ -0,0 +1,221 @@
+import threading
+import time as clock
+from collections import Counter
+from datetime import datetime, date, time, timedelta
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from extensions import db
+from models import Appointments, CatalogVersions
+from catalog_cache import bump_version
+from queue_allocator import DEFAULT_DAILY_SLOTS
+
+# Free-slot search over a per-worker index of booked slots.
+# Each (day, doctor) is a bitmap with one bit per slot of the working day.
+# The working day is split into APPOINTMENT_DAILY_SLOTS slots, the size of a
+# doctor's daily queue (queue_allocator.py), and a doctor whose queue is full
+# has no free slots. Writers call appointment_changed() before committing;
+# that bumps the doctor's row for the day in CatalogVersions
+# ('slots:YYYY-MM-DD:doctor:N') and, once the commit succeeds, patches the
+# local bitmaps in place. Other workers see the new version within
+# AVAILABILITY_VERSION_CHECK_SECONDS and rebuild that day.
+DAY_START = time(8, 0)
+DAY_END = time(16, 0)
+DEFAULT_VERSION_CHECK_SECONDS = 2.0
+MAX_SEARCH_DAYS = 31
+
+class _Day:
+    def __init__(self, versions, checked_at):
+        self.versions = versions  # doctor_id -> version
+        self.checked_at = checked_at
+        self.bitmaps = {}  # doctor_id -> int
+        self.extra = Counter()  # (doctor_id, slot) -> bookings beyond the first
+        self.booked = Counter()  # doctor_id -> appointments that day, in working hours or not
+
+    def add(self, doctor_id, slot):
+        if slot is None:
+            return
+        bit = 1 << slot
+        bitmap = self.bitmaps.get(doctor_id, 0)
+        if bitmap & bit:
+            self.extra[(doctor_id, slot)] += 1
+        else:
+            self.bitmaps[doctor_id] = bitmap | bit
+
+    def remove(self, doctor_id, slot):
+        if slot is None:
+            return
+        if self.extra[(doctor_id, slot)]:
+            self.extra[(doctor_id, slot)] -= 1
+        else:
+            self.bitmaps[doctor_id] = self.bitmaps.get(doctor_id, 0) & ~(1 << slot)
+
+_lock = threading.Lock()
+_days = {}  # date -> _Day
+
+def _settings():
+    start = current_app.config.get('AVAILABILITY_DAY_START', DAY_START)
+    end = current_app.config.get('AVAILABILITY_DAY_END', DAY_END)
+    slots = current_app.config.get('APPOINTMENT_DAILY_SLOTS', DEFAULT_DAILY_SLOTS)
+    start_minute = start.hour * 60 + start.minute
+    minutes = max(1, (end.hour * 60 + end.minute - start_minute) // slots)
+    return start_minute, minutes, slots
+
+def slot_index(when, settings=None):
+    """Slot number of a datetime within its working day, or None outside working hours"""
+    start_minute, minutes, slots = settings or _settings()
+    offset = when.hour * 60 + when.minute - start_minute
+    if offset < 0 or offset >= slots * minutes:
+        return None
+    return offset // minutes
+
+def _version_name(day, doctor_id):
+    return f'slots:{day.isoformat()}:doctor:{doctor_id}'
+
+def _read_versions(days):
+    """{day: {doctor_id: version}} for the given days"""
+    first, last = min(days), max(days)
+    # ';' sorts right after ':', so this covers every doctor of the last day
+    rows = (db.session.query(CatalogVersions.Name, CatalogVersions.Version)
+            .filter(CatalogVersions.Name >= f'slots:{first.isoformat()}:',
+                    CatalogVersions.Name < f'slots:{last.isoformat()};'))
+    versions = {day: {} for day in days}
+    for name, version in rows:
+        _, day, _, doctor_id = name.split(':')
+        day = date.fromisoformat(day)
+        if day in versions:
+            versions[day][int(doctor_id)] = version
+    return versions
+
+def _load(days, versions, now):
+    settings = _settings()
+    first, last = min(days), max(days)
+    rows = (db.session.query(Appointments.DoctorID, Appointments.AppointmentDate)
+            .filter(Appointments.AppointmentDate >= datetime.combine(first, time.min),
+                    Appointments.AppointmentDate < datetime.combine(last + timedelta(days=1), time.min),
+                    Appointments.DoctorID.isnot(None))
+            .all())
+    fresh = {day: _Day(versions[day], now) for day in days}
+    for doctor_id, when in rows:
+        entry = fresh.get(when.date())
+        if entry is not None:
+            entry.booked[doctor_id] += 1
+            entry.add(doctor_id, slot_index(when, settings))
+    _days.update(fresh)
+
+def _get_days(days):
+    ttl = current_app.config.get('AVAILABILITY_VERSION_CHECK_SECONDS', DEFAULT_VERSION_CHECK_SECONDS)
+    now = clock.monotonic()
+    with _lock:
+        # Past days are never searched again
+        for day in [d for d in _days if d < date.today()]:
+            del _days[day]
+
+        to_check = [d for d in days if d not in _days or now - _days[d].checked_at >= ttl]
+        if to_check:
+            versions = _read_versions(to_check)
+            stale = []
+            for day in to_check:
+                entry = _days.get(day)
+                if entry and entry.versions == versions[day]:
+                    entry.checked_at = now
+                else:
+                    stale.append(day)
+            if stale:
+                _load(stale, versions, now)
+        return {day: _days[day] for day in days}
+
+def appointment_changed(old_doctor_id=None, old_date=None, new_doctor_id=None, new_date=None):
+    """Record that an appointment was created, moved or deleted; call before commit"""
+    ops = {}
+    if old_doctor_id and old_date:
+        ops.setdefault((old_date.date(), int(old_doctor_id)), []).append(('remove', old_date))
+    if new_doctor_id and new_date:
+        ops.setdefault((new_date.date(), int(new_doctor_id)), []).append(('add', new_date))
+
+    pending = db.session.info.setdefault('availability_changes', [])
+    # Sorted, so concurrent moves lock the version rows in the same order
+    for (day, doctor_id), doctor_ops in sorted(ops.items()):
+        pending.append((day, doctor_id, bump_version(_version_name(day, doctor_id)), doctor_ops))
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    # Savepoint commits fire this event too; wait for the real commit
+    if session.in_nested_transaction():
+        return
+    pending = session.info.pop('availability_changes', None)
+    if not pending:
+        return
+    settings = _settings()
+    with _lock:
+        for day, doctor_id, version, doctor_ops in pending:
+            entry = _days.get(day)
+            if entry is None:
+                continue
+            if entry.versions.get(doctor_id, 0) != version - 1:
+                # Someone else changed this doctor's day too; rebuild it on the next search
+                del _days[day]
+                continue
+            for op, when in doctor_ops:
+                entry.booked[doctor_id] += 1 if op == 'add' else -1
+                getattr(entry, op)(doctor_id, slot_index(when, settings))
+            entry.versions[doctor_id] = version
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('availability_changes', None)
+
+def find_free_slots(doctors, date_from, date_to, limit=10, now=None):
+    """Earliest free slots for the given doctor dicts between two dates (inclusive).
+
+    Returns up to limit dicts with DoctorID, DoctorName, Start and End, in time order.
+    A doctor offers no more slots on a day than their queue has room for.
+    """
+    now = now or datetime.now()
+    date_from = max(date_from, now.date())
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)][:MAX_SEARCH_DAYS]
+    if not days or not doctors:
+        return []
+
+    start_minute, minutes, slots = _settings()
+    full = (1 << slots) - 1
+    index = _get_days(days)
+
+    found = []
+    for day in days:
+        mask = full
+        if day == now.date():
+            # Drop slots that have already started
+            started = slot_index(now)
+            if started is None:
+                mask = 0 if now.hour * 60 + now.minute >= start_minute else full
+            else:
+                mask = full & ~((1 << (started + 1)) - 1)
+
+        entry = index[day]
+        for doctor in doctors:
+            free = ~entry.bitmaps.get(doctor['DoctorID'], 0) & mask
+            room = min(limit, slots - entry.booked[doctor['DoctorID']])
+            taken = 0
+            while free and taken < room:
+                lowest = free & -free
+                found.append((day, lowest.bit_length() - 1, doctor))
+                free ^= lowest
+                taken += 1
+        # Later days can only hold later slots
+        if len(found) >= limit:
+            break
+
+    found.sort(key=lambda item: (item[0], item[1], item[2]['DoctorID']))
+    result = []
+    for day, slot, doctor in found[:limit]:
+        start = datetime.combine(day, time.min) + timedelta(minutes=start_minute + slot * minutes)
+        result.append({
+            'DoctorID': doctor['DoctorID'],
+            'DoctorName': doctor['Name'],
+            'Start': start.isoformat(),
+            'End': (start + timedelta(minutes=minutes)).isoformat()
+        })
+    return result
@@ -0,0 +1,106 @@
+"""Parallel dispense benchmark for POST /api/pharmacy/dispense logic.
+
+Many threads dispense multi-item batches from the same few medicines at once.
+Checks that stock never goes negative, that the final stock equals the
+initial stock minus everything recorded in Patient_MedicineUsage, and that
+the incrementally maintained InventorySummary matches a full scan:
+    python benchmarks/dispense_bench.py --threads 16 --dispenses 2000
+    python benchmarks/dispense_bench.py --database-uri postgresql://localhost/hms_bench
+
+Exits with status 1 if the ledger and the stock disagree.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError, IntegrityError
+from extensions import db, init_extensions
+from models import Patients, Pharmacy, Patient_MedicineUsage
+from stock import dispense_medicines, InsufficientStock, inventory_summary, _summarize, _threshold
+
+def make_app(uri):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    if uri.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    init_extensions(app)
+    return app
+
+def dispense_once(app, patient_ids, medicine_ids, rng):
+    items = [{'MedicineID': m, 'Quantity': rng.randint(1, 3)}
+             for m in rng.sample(medicine_ids, rng.randint(1, min(3, len(medicine_ids))))]
+    with app.app_context():
+        for _ in range(50):
+            try:
+                dispense_medicines(rng.choice(patient_ids), None, items)
+                db.session.commit()
+                return 'ok'
+            except InsufficientStock:
+                db.session.rollback()
+                return 'out_of_stock'
+            except (OperationalError, IntegrityError):
+                # Lock timeout / deadlock victim / same-microsecond ledger key: retry
+                db.session.rollback()
+                time.sleep(0.005)
+        return 'error'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--dispenses', type=int, default=2000)
+    parser.add_argument('--medicines', type=int, default=5)
+    parser.add_argument('--stock', type=int, default=2000, help='initial quantity per medicine')
+    args = parser.parse_args()
+
+    uri = args.database_uri or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'dispense_bench.db')
+    app = make_app(uri)
+    with app.app_context():
+        db.create_all()
+        patients = [Patients(Name=f'Bench Patient {i}') for i in range(50)]
+        medicines = [Pharmacy(MedicineName=f'Bench Medicine {time.time_ns()}-{i}', Quantity=args.stock, UnitPrice=1.0)
+                     for i in range(args.medicines)]
+        db.session.add_all(patients + medicines)
+        db.session.commit()
+        patient_ids = [p.PatientID for p in patients]
+        medicine_ids = [m.MedicineID for m in medicines]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        outcomes = list(executor.map(
+            lambda i: dispense_once(app, patient_ids, medicine_ids, random.Random(i)),
+            range(args.dispenses)))
+    seconds = time.perf_counter() - started
+
+    print(f"{outcomes.count('ok')} dispensed, {outcomes.count('out_of_stock')} out of stock, "
+          f"{outcomes.count('error')} errors, {len(outcomes) / seconds:.1f} dispenses/sec")
+
+    failed = False
+    with app.app_context():
+        for medicine_id in medicine_ids:
+            stock = db.session.get(Pharmacy, medicine_id).Quantity
+            used = (db.session.query(func.coalesce(func.sum(Patient_MedicineUsage.QuantityUsed), 0))
+                    .filter_by(MedicineID=medicine_id).scalar())
+            if stock < 0 or stock + used != args.stock:
+                print(f'FAIL: medicine {medicine_id} stock={stock} used={used} initial={args.stock}')
+                failed = True
+        summary = inventory_summary('pharmacy')
+        expected = _summarize('pharmacy', _threshold())
+        for key in ('ItemCount', 'TotalQuantity', 'LowStockCount'):
+            if summary[key] != expected[key]:
+                print(f'FAIL: InventorySummary {key}={summary[key]}, table scan gives {expected[key]}')
+                failed = True
+    if not failed:
+        print('OK: stock never negative and matches the ledger and the summary')
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
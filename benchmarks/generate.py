@@ -0,0 +1,240 @@
+"""Synthetic hospital data at benchmark scale.
+
+Fills an empty SQLite or PostgreSQL database with departments, doctors,
+catalogs, patients (with DoctorOrders JSON), appointments and usage rows,
+then writes a dataset manifest that benchmarks/loadtest.py reads:
+    python benchmarks/generate.py --patients 100000 --output bench.json
+    python benchmarks/generate.py --database-uri postgresql://localhost/hms_bench --patients 1000000
+
+Patients go through the CSV/NDJSON importer, everything else through
+batched Core inserts; derived tables (supply totals, inventory summary,
+dashboard counters) are then rebuilt with the same functions as the flask
+CLI commands. The same options and --seed always produce the same data.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from sqlalchemy import func
+from extensions import db, init_extensions
+from models import (Departments, Doctors, Patients, Appointments, Pharmacy, Supplies, Laboratory, Radiology,
+                    Patient_MedicineUsage, Patient_Supplies, SupplyUsage, Patient_Laboratory, Patient_Radiology)
+from patient_import import import_patients
+from stock import rebuild_supply_totals, rebuild_inventory_summary
+from dashboard_stats import reconcile_dashboard_stats
+from seed import FIRST_NAMES, LAST_NAMES, SPECIALISTS, MEDICINE_NAMES, PASSWORD, seed_users
+
+BATCH_SIZE = 5000
+
+def make_app(uri):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SECRET_KEY'] = 'benchmark'
+    init_extensions(app)
+    return app
+
+def _insert(model, rows):
+    """Insert an iterable of row dicts in batches, one commit per batch"""
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(model.__table__.insert(), batch)
+            db.session.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(model.__table__.insert(), batch)
+        db.session.commit()
+        count += len(batch)
+    return count
+
+def _id_range(column):
+    low, high = db.session.query(func.min(column), func.max(column)).one()
+    return [low, high]
+
+def _ids(column):
+    low, high = _id_range(column)
+    return list(range(low, high + 1))
+
+def _patient_lines(rng, count, doctor_ids, catalogs, now):
+    for i in range(count):
+        admitted = now - timedelta(days=rng.randint(0, 365), hours=rng.randint(0, 23))
+        discharged = admitted + timedelta(days=rng.randint(1, 14)) if rng.random() < 0.8 else None
+        orders = {
+            'medicines': [{'id': rng.choice(catalogs['medicines'])} for _ in range(rng.randint(0, 3))],
+            'labTests': [{'id': rng.choice(catalogs['lab_tests'])} for _ in range(rng.randint(0, 2))],
+            'radiologyTests': [{'id': rng.choice(catalogs['radiology_tests'])} for _ in range(rng.randint(0, 1))],
+            'supplies': [{'id': rng.choice(catalogs['supplies'])} for _ in range(rng.randint(0, 2))],
+        }
+        yield json.dumps({
+            'Name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'NationalID': str(29000000000000 + i),
+            'Age': rng.randint(0, 95),
+            'Gender': rng.choice(('Male', 'Female')),
+            'Weight': rng.randint(3, 130),
+            'Height': rng.randint(50, 200),
+            'Address': f'{rng.randint(1, 200)} Street {rng.randint(1, 500)}',
+            'Phone': f'01{rng.randint(0, 2)}{i:08d}',
+            'Email': f'patient{i}@bench.local',
+            'Diagnose': rng.choice(('Hypertension', 'Diabetes', 'Fracture', 'Asthma', 'Migraine', '')),
+            'Doctor': rng.choice(doctor_ids),
+            'Date_admission': admitted.isoformat(),
+            'Date_discharge': discharged.isoformat() if discharged else None,
+            'DoctorOrders': orders,
+        })
+
+def generate(patients, doctors=None, departments=10, catalog_size=500, appointments_per_patient=2,
+             usage_per_patient=2, seed=0, log=print):
+    """Fill the current app's empty database; returns the dataset manifest"""
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    doctors = doctors or max(10, patients // 200)
+    started = time.perf_counter()
+
+    db.create_all()
+    users = seed_users()
+
+    _insert(Departments, ({'DepartmentName': f'{SPECIALISTS[i % len(SPECIALISTS)]} {i // len(SPECIALISTS) + 1}'}
+                          for i in range(departments)))
+    department_ids = _ids(Departments.DepartmentID)
+    _insert(Doctors, ({'Name': f'Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                       'Age': rng.randint(28, 70), 'ScientificDegree': rng.choice(('MBBCh', 'MSc', 'MD', 'PhD')),
+                       'Specialist': rng.choice(SPECIALISTS), 'DepartmentID': rng.choice(department_ids),
+                       'Phone': f'010{i:08d}', 'Email': f'doctor{i}@bench.local'}
+                      for i in range(doctors)))
+    _insert(Pharmacy, ({'MedicineName': f'{MEDICINE_NAMES[i % len(MEDICINE_NAMES)]} {i // len(MEDICINE_NAMES) + 1}'
+                                        f' {rng.choice((5, 10, 20, 250, 500, 1000))}mg',
+                        'UnitPrice': round(rng.uniform(5, 500), 2), 'Quantity': rng.randint(0, 5000)}
+                       for i in range(catalog_size)))
+    _insert(Supplies, ({'ItemName': f'Supply item {i}', 'Quantity': rng.randint(0, 5000),
+                        'UnitPrice': round(rng.uniform(1, 100), 2)}
+                       for i in range(catalog_size)))
+    _insert(Laboratory, ({'TestName': f'Lab test {i}', 'Description': '', 'Price': rng.randint(50, 1500)}
+                         for i in range(catalog_size)))
+    _insert(Radiology, ({'TestName': f'Scan {i}', 'Description': '', 'Price': rng.randint(200, 5000)}
+                        for i in range(catalog_size)))
+    doctor_ids = _ids(Doctors.DoctorID)
+    catalogs = {
+        'medicines': _ids(Pharmacy.MedicineID),
+        'supplies': _ids(Supplies.SupplyID),
+        'lab_tests': _ids(Laboratory.TestID),
+        'radiology_tests': _ids(Radiology.RadiologyID),
+    }
+    log(f'catalogs and staff: {time.perf_counter() - started:.1f}s')
+
+    report = import_patients(_patient_lines(rng, patients, doctor_ids, catalogs, now), 'ndjson')
+    if report['failed']:
+        raise RuntimeError(f'Patient import failed: {report["errors"][:5]}')
+    first_patient, last_patient = _id_range(Patients.PatientID)
+    log(f'{report["inserted"]} patients: {time.perf_counter() - started:.1f}s')
+
+    queue_numbers = {}
+
+    def appointment_rows():
+        for _ in range(patients * appointments_per_patient):
+            doctor_id = rng.choice(doctor_ids)
+            when = (now + timedelta(days=rng.randint(-60, 30))).replace(hour=rng.randint(8, 16),
+                                                                        minute=rng.choice((0, 15, 30, 45)), second=0)
+            key = (doctor_id, when.date())
+            queue_numbers[key] = queue_numbers.get(key, 0) + 1
+            yield {'PatientID': rng.randint(first_patient, last_patient), 'DoctorID': doctor_id,
+                   'AppointmentDate': when, 'QueueNumber': queue_numbers[key], 'AvailableSlots': 30}
+    _insert(Appointments, appointment_rows())
+    log(f'appointments: {time.perf_counter() - started:.1f}s')
+
+    def usage_rows():
+        for patient_id in range(first_patient, last_patient + 1):
+            day = now - timedelta(days=rng.randint(0, 365))
+            doctor_id = rng.choice(doctor_ids)
+            for k, medicine_id in enumerate(rng.sample(catalogs['medicines'], usage_per_patient)):
+                yield Patient_MedicineUsage, {'PatientID': patient_id, 'MedicineID': medicine_id,
+                                              'UsageDate': day + timedelta(hours=k), 'QuantityUsed': rng.randint(1, 4),
+                                              'DoctorID': doctor_id}
+            for supply_id in rng.sample(catalogs['supplies'], usage_per_patient):
+                quantity = rng.randint(1, 10)
+                yield Patient_Supplies, {'PatientID': patient_id, 'SupplyID': supply_id, 'QuantityUsed': quantity,
+                                         'DoctorID': doctor_id, 'DateUsed': day}
+                yield SupplyUsage, {'PatientID': patient_id, 'SupplyID': supply_id, 'QuantityUsed': quantity,
+                                    'DoctorID': doctor_id, 'DateUsed': day}
+            yield Patient_Laboratory, {'PatientID': patient_id, 'TestID': rng.choice(catalogs['lab_tests'])}
+            if rng.random() < 0.5:
+                yield Patient_Radiology, {'PatientID': patient_id,
+                                          'RadiologyID': rng.choice(catalogs['radiology_tests'])}
+
+    batches = {}
+    for model, row in usage_rows():
+        batch = batches.setdefault(model, [])
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            _insert(model, batch)
+            batches[model] = []
+    for model, batch in batches.items():
+        _insert(model, batch)
+    log(f'usage rows: {time.perf_counter() - started:.1f}s')
+
+    rebuild_supply_totals()
+    rebuild_inventory_summary()
+    reconcile_dashboard_stats()
+    log(f'derived tables: {time.perf_counter() - started:.1f}s')
+
+    return {
+        'generated_at': now.isoformat(),
+        'seed': seed,
+        'counts': {
+            'departments': departments, 'doctors': doctors, 'patients': report['inserted'],
+            'appointments': patients * appointments_per_patient, 'catalog_size': catalog_size,
+            'usage_per_patient': usage_per_patient
+        },
+        'ids': {
+            'departments': _id_range(Departments.DepartmentID),
+            'doctors': _id_range(Doctors.DoctorID),
+            'patients': [first_patient, last_patient],
+            'appointments': _id_range(Appointments.AppointmentID),
+            'medicines': _id_range(Pharmacy.MedicineID),
+            'supplies': _id_range(Supplies.SupplyID),
+            'laboratory': _id_range(Laboratory.TestID),
+            'radiology': _id_range(Radiology.RadiologyID),
+        },
+        'login': {'email': 'admin@bench.local', 'password': PASSWORD, 'user_id': users['Admin']},
+        'search_terms': sorted({name[:3].lower() for name in FIRST_NAMES + LAST_NAMES}),
+        'autocomplete_terms': sorted({name[:3].lower() for name in MEDICINE_NAMES}),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', help='defaults to a new SQLite file')
+    parser.add_argument('--patients', type=int, default=10000)
+    parser.add_argument('--doctors', type=int, help='defaults to patients / 200')
+    parser.add_argument('--departments', type=int, default=10)
+    parser.add_argument('--catalog-size', type=int, default=500, help='rows per catalog (medicines, supplies, tests)')
+    parser.add_argument('--appointments-per-patient', type=int, default=2)
+    parser.add_argument('--usage-per-patient', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench-dataset.json', help='dataset manifest for loadtest.py')
+    args = parser.parse_args()
+
+    uri = args.database_uri or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    with make_app(uri).app_context():
+        db.create_all()
+        if db.session.query(Patients.PatientID).first() is not None:
+            sys.exit(f'{uri} already has patients; generate into an empty database')
+        manifest = generate(args.patients, args.doctors, args.departments, args.catalog_size,
+                            args.appointments_per_patient, args.usage_per_patient, args.seed)
+    manifest['database_uri'] = uri
+    with open(args.output, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f'Wrote {args.output} for {uri}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""HTTP load test of the JSON API with a stored baseline.
+
+Drives a running server (e.g. gunicorn app:app) with a weighted mix of
+endpoints built from a dataset manifest (benchmarks/generate.py), from
+several processes with several threads each, then reports per endpoint
+throughput, p50/p95/p99 latency and queries per request (read from the
+Server-Timing header):
+    python benchmarks/loadtest.py --url http://localhost:8000 --dataset bench.json --output baseline.json
+    python benchmarks/loadtest.py --url http://localhost:8000 --dataset bench.json --compare baseline.json
+
+--serve starts the routes.py blueprints in this process against the
+manifest's database instead of using --url. With --compare the run exits
+with status 1 when an endpoint's p95 or throughput is worse than the
+baseline by more than --tolerance, or it runs more queries.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from login_bench import percentile
+
+# name -> (weight, path template, extra headers); {patient} etc. are random
+# ids from the manifest
+SCENARIO = {
+    'patients.get_patient': (10, '/api/patients/{patients}', {}),
+    'patients.get_patient_chart': (10, '/api/patients/{patients}/chart', {}),
+    'patients.search': (10, '/api/patients/search?q={search_term}', {}),
+    'patients.list': (5, '/api/patients/?limit=50', {'Accept': 'application/json'}),
+    'appointments.get_appointment': (5, '/api/appointments/{appointments}', {}),
+    'appointments.list': (5, '/api/appointments/?limit=50&DoctorID={doctors}', {'Accept': 'application/json'}),
+    'appointments.availability': (5, '/api/appointments/availability?doctor_id={doctors}', {}),
+    'catalog.autocomplete': (15, '/api/catalog/pharmacy/autocomplete?q={autocomplete_term}', {}),
+    'doctors.list': (5, '/api/doctors/', {'Accept': 'application/json'}),
+    'pharmacy.summary': (5, '/api/pharmacy/summary', {}),
+    'supplies.summary': (5, '/api/supplies/summary', {}),
+    'supplies.usage_by_supply': (5, '/api/supplies/{supplies}/usage', {}),
+    'supplies.patient_usage': (5, '/api/supplies/patients/{patients}', {}),
+}
+QUERIES = re.compile(r'(\d+) queries')
+
+def _fill(template, manifest, rng):
+    values = {name: rng.randint(low, high) for name, (low, high) in manifest['ids'].items()}
+    values['search_term'] = rng.choice(manifest['search_terms'])
+    values['autocomplete_term'] = rng.choice(manifest['autocomplete_terms'])
+    return template.format(**values)
+
+def login(url, manifest):
+    """Bearer token for the manifest's admin user"""
+    target = urlparse(url)
+    connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+    body = json.dumps({'email': manifest['login']['email'], 'password': manifest['login']['password'],
+                       'token': True})
+    connection.request('POST', '/api/auth/login', body, {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    payload = json.loads(response.read())
+    connection.close()
+    if response.status != 200:
+        raise RuntimeError(f'Login failed: {response.status} {payload}')
+    return payload['access_token']
+
+def _worker(url, manifest, token, threads, duration, requests, seed):
+    """One load process: threads that each keep a connection open; returns (samples, seconds)"""
+    target = urlparse(url)
+    names = list(SCENARIO)
+    weights = [SCENARIO[name][0] for name in names]
+    deadline = time.monotonic() + duration if duration else None
+    per_thread = -(-requests // threads) if requests else None
+    samples = []  # (name, status, seconds, queries)
+    lock = threading.Lock()
+
+    def run(thread_seed):
+        rng = random.Random(thread_seed)
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+        own = []
+        done = 0
+        while (deadline is None or time.monotonic() < deadline) and (per_thread is None or done < per_thread):
+            name = rng.choices(names, weights)[0]
+            _, template, headers = SCENARIO[name]
+            path = _fill(template, manifest, rng)
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers={'Authorization': f'Bearer {token}', **headers})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                timing = ', '.join(response.headers.get_all('Server-Timing') or [])
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+                status, timing = 0, ''
+            elapsed = time.perf_counter() - started
+            match = QUERIES.search(timing)
+            own.append((name, status, elapsed, int(match.group(1)) if match else None))
+            done += 1
+        connection.close()
+        with lock:
+            samples.extend(own)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=run, args=(seed * 1000 + i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+def _summary(samples, seconds):
+    latencies = [elapsed for _, _, elapsed, _ in samples]
+    queries = [q for _, _, _, q in samples if q is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, status, _, _ in samples if status == 0 or status >= 400),
+        'throughput': round(len(samples) / seconds, 2) if seconds else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+def report(samples, seconds):
+    by_name = {}
+    for sample in samples:
+        by_name.setdefault(sample[0], []).append(sample)
+    return {
+        'total': _summary(samples, seconds),
+        'endpoints': {name: _summary(rows, seconds) for name, rows in sorted(by_name.items())}
+    }
+
+def compare(result, baseline, tolerance):
+    """Print the change per endpoint; returns the names that regressed"""
+    regressed = []
+    print(f'\n{"endpoint":32} {"req/s":>16} {"p95 ms":>18} {"queries":>12}')
+    for name, now in result['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if not before:
+            print(f'{name:32} (not in baseline)')
+            continue
+        problems = []
+        if before['throughput'] and now['throughput'] < before['throughput'] * (1 - tolerance):
+            problems.append('throughput')
+        if before['p95_ms'] and now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            problems.append('p95')
+        if (before['queries_per_request'] is not None and now['queries_per_request'] is not None
+                and now['queries_per_request'] > before['queries_per_request'] + 0.5):
+            problems.append('queries')
+        if problems:
+            regressed.append(name)
+        print(f'{name:32} {before["throughput"]:>7} -> {now["throughput"]:<7} '
+              f'{before["p95_ms"]:>8} -> {now["p95_ms"]:<8} '
+              f'{before["queries_per_request"]!s:>5} -> {now["queries_per_request"]!s:<5}'
+              f'{"  REGRESSED: " + ", ".join(problems) if problems else ""}')
+    return regressed
+
+def serve(uri):
+    """Serve the routes.py blueprints on a free local port; returns the base URL"""
+    import logging
+    from werkzeug.serving import make_server
+    from query_budget import api_app
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, api_app(uri), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', required=True, help='manifest written by generate.py')
+    parser.add_argument('--url', help='base URL of a running server')
+    parser.add_argument('--serve', action='store_true', help='serve the blueprints in-process instead of --url')
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='threads per process')
+    parser.add_argument('--duration', type=float, default=30, help='seconds; 0 to use --requests')
+    parser.add_argument('--requests', type=int, default=0, help='requests per process when --duration is 0')
+    parser.add_argument('--warmup', type=int, default=50, help='unmeasured requests before the run')
+    parser.add_argument('--output', help='write the results as JSON (a baseline for --compare)')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if not args.url and not args.serve:
+        parser.error('give --url or --serve')
+
+    with open(args.dataset) as f:
+        manifest = json.load(f)
+    url = serve(manifest['database_uri']) if args.serve else args.url
+    token = login(url, manifest)
+
+    if args.warmup:
+        _worker(url, manifest, token, 1, 0, args.warmup, args.seed + 10000)
+    # spawn, not fork: --serve has server threads running in this process
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(args.processes) as pool:
+        parts = pool.starmap(_worker, [(url, manifest, token, args.threads, args.duration, args.requests,
+                                        args.seed + i) for i in range(args.processes)])
+    # Processes start at slightly different times; use the longest run
+    seconds = max(elapsed for _, elapsed in parts)
+    samples = [sample for part, _ in parts for sample in part]
+
+    result = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'), 'revision': _git_revision(),
+            'url': 'in-process' if args.serve else url, 'processes': args.processes, 'threads': args.threads,
+            'duration': round(seconds, 2), 'dataset': manifest['counts'],
+        },
+        **report(samples, seconds)
+    }
+    total = result['total']
+    print(f'{total["requests"]} requests in {seconds:.1f}s: {total["throughput"]} req/s, '
+          f'p50 {total["p50_ms"]} ms, p95 {total["p95_ms"]} ms, p99 {total["p99_ms"]} ms, '
+          f'{total["errors"]} errors')
+    print(f'\n{"endpoint":32} {"req/s":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"queries":>8} {"errors":>7}')
+    for name, row in result['endpoints'].items():
+        print(f'{name:32} {row["throughput"]:>8} {row["p50_ms"]:>8} {row["p95_ms"]:>8} {row["p99_ms"]:>8} '
+              f'{row["queries_per_request"]!s:>8} {row["errors"]:>7}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    regressed = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(result, json.load(f), args.tolerance)
+        print(f'\n{len(regressed)} endpoints regressed')
+    sys.exit(1 if regressed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Login throughput benchmark.
+
+HTTP mode drives POST /api/auth/login on a running server:
+    python benchmarks/login_bench.py --url http://localhost:8000 --email a@b.c --password secret
+
+Direct mode measures the password hashing pool without a server:
+    python benchmarks/login_bench.py --direct --workers 4
+
+Both report logins/sec and p50/p95/p99 latency for the given concurrency.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run(task, total, concurrency):
+    """Call task() total times from concurrency threads; return (latencies, errors, seconds)"""
+    latencies, errors = [], 0
+
+    def timed(_):
+        start = time.perf_counter()
+        ok = task()
+        return ok, time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for ok, elapsed in executor.map(timed, range(total)):
+            latencies.append(elapsed)
+            errors += 0 if ok else 1
+    return latencies, errors, time.perf_counter() - started
+
+def http_task(url, email, password):
+    body = json.dumps({'email': email, 'password': password}).encode()
+
+    def task():
+        req = urllib.request.Request(url.rstrip('/') + '/api/auth/login', data=body,
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return resp.status == 200
+        except urllib.error.HTTPError:
+            return False
+    return task
+
+def direct_task(workers, method):
+    from flask import Flask
+    from passwords import hash_password, verify_password
+
+    app = Flask(__name__)
+    app.config['PASSWORD_HASH_WORKERS'] = workers
+    app.config['PASSWORD_HASH_METHOD'] = method
+    with app.app_context():
+        stored = hash_password('benchmark-password')
+
+    def task():
+        with app.app_context():
+            return verify_password(stored, 'benchmark-password')
+    return task
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    parser.add_argument('--direct', action='store_true', help='benchmark the hashing pool in-process')
+    parser.add_argument('--workers', type=int, default=2, help='hashing pool size in direct mode')
+    parser.add_argument('--method', default='pbkdf2:sha256:260000', help='KDF in direct mode')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    if args.direct:
+        task = direct_task(args.workers, args.method)
+    else:
+        if not args.email or not args.password:
+            parser.error('--email and --password are required in HTTP mode')
+        task = http_task(args.url, args.email, args.password)
+
+    latencies, errors, seconds = run(task, args.requests, args.concurrency)
+    print(json.dumps({
+        'mode': 'direct' if args.direct else 'http',
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'errors': errors,
+        'logins_per_sec': round(args.requests / seconds, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
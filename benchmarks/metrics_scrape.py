@@ -0,0 +1,128 @@
+"""Multi-worker check of the /metrics endpoint.
+
+Forks several workers that share a METRICS_DIR the way gunicorn workers do,
+has each serve some requests, then scrapes /metrics from one of them and
+parses the text format like a Prometheus server would:
+    python benchmarks/metrics_scrape.py --workers 4 --requests 50
+
+Exits with status 1 if the merged request counts or histograms are wrong.
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from extensions import db, init_extensions
+from metrics import init_metrics, render_metrics, CONTENT_TYPE, _flush
+import routes
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+def make_app(uri, metrics_dir):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SECRET_KEY'] = 'metrics-scrape'
+    app.config['METRICS_DIR'] = metrics_dir
+    init_metrics(app)
+    init_extensions(app)
+    for name in dir(routes):
+        if name.endswith('_bp'):
+            app.register_blueprint(getattr(routes, name))
+    app.add_url_rule('/metrics', 'metrics', lambda: (render_metrics(), 200, {'Content-Type': CONTENT_TYPE}))
+    return app
+
+def parse(text):
+    """{(name, frozenset(labels)): value} and {name: type} from the text format"""
+    samples, types = {}, {}
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ', 3)
+            types[name] = kind
+        elif line and not line.startswith('#'):
+            match = SAMPLE.match(line)
+            if not match:
+                raise ValueError(f'Unparseable line: {line!r}')
+            name, _, labels, value = match.groups()
+            samples[(name, frozenset(LABEL.findall(labels or '')))] = float(value)
+    return samples, types
+
+def serve(uri, metrics_dir, requests, scrape, results):
+    app = make_app(uri, metrics_dir)
+    client = app.test_client()
+    for i in range(requests):
+        client.get('/api/catalog/pharmacy/autocomplete?q=para' if i % 2 else '/api/patients/search?q=a')
+    if scrape:
+        response = client.get('/metrics')
+        results.put((response.status_code, response.headers['Content-Type'], response.get_data(as_text=True)))
+    else:
+        # Make sure the last requests are on disk before exiting
+        with app.app_context():
+            _flush(force=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    uri = 'sqlite:///' + os.path.join(directory, 'metrics.db')
+    metrics_dir = os.path.join(directory, 'metrics')
+    with make_app(uri, metrics_dir).app_context():
+        db.create_all()
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    # All but the last worker exit before the scrape, like recycled workers
+    for _ in range(args.workers - 1):
+        worker = context.Process(target=serve, args=(uri, metrics_dir, args.requests, False, results))
+        worker.start()
+        worker.join()
+    scraper = context.Process(target=serve, args=(uri, metrics_dir, args.requests, True, results))
+    scraper.start()
+    status, content_type, text = results.get(timeout=60)
+    scraper.join()
+
+    samples, types = parse(text)
+    errors = []
+    if status != 200 or not content_type.startswith('text/plain'):
+        errors.append(f'/metrics answered {status} {content_type}')
+
+    expected = args.workers * args.requests
+    served = sum(value for (name, _), value in samples.items() if name == 'hms_http_requests_total')
+    if served != expected:
+        errors.append(f'hms_http_requests_total adds up to {served:g}, expected {expected}')
+
+    counts, infinite = defaultdict(float), defaultdict(float)
+    for (name, labels), value in samples.items():
+        if name == 'hms_http_request_duration_seconds_count':
+            counts[dict(labels)['blueprint']] += value
+        if name == 'hms_http_request_duration_seconds_bucket' and dict(labels)['le'] == '+Inf':
+            infinite[dict(labels)['blueprint']] += value
+    if sum(counts.values()) != expected or counts != infinite:
+        errors.append(f'Latency histogram counts {dict(counts)} do not add up to {expected}')
+
+    workers = [labels for (name, labels), _ in samples.items() if name == 'hms_worker_info']
+    if len(workers) != 1:
+        errors.append(f'{len(workers)} running workers reported, expected only the scraping one')
+    for name in ('hms_http_requests_total', 'hms_http_request_duration_seconds', 'hms_cache_hit_ratio'):
+        if name not in types:
+            errors.append(f'No TYPE line for {name}')
+
+    print(f'{args.workers} workers, {expected} requests, {len(samples)} samples scraped')
+    for (name, labels), value in sorted(samples.items(), key=lambda item: item[0][0]):
+        if name.startswith('hms_cache_') or name == 'hms_http_requests_total':
+            print(f'  {name}{dict(labels)} {value:g}')
+    for error in errors:
+        print('ERROR:', error)
+    sys.exit(1 if errors else 0)
+
+if __name__ == '__main__':
+    main()
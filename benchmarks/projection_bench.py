@@ -0,0 +1,114 @@
+"""ORM instances vs read-only projections (projections.py) for list JSON.
+
+Loads every patient, and every appointment with its patient, once through
+the ORM (query.all() + as_dict()) and once through the Core projection the
+list endpoints use, and serializes the result to JSON:
+    python benchmarks/projection_bench.py --patients 50000
+    python benchmarks/projection_bench.py --dataset bench.json --repeat 5
+
+Each path runs in a fresh process so its peak RSS is its own. Reports
+rows/sec (best of --repeat) and peak RSS growth, and exits with status 1 if
+the two paths produce different JSON.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def _rss_kb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+def _load(listing, path):
+    from extensions import db
+    from loading import with_loading
+    from models import Patients, Appointments
+    from projections import PATIENT_ROWS, APPOINTMENT_ROWS
+    if path == 'orm':
+        if listing == 'patients':
+            rows = Patients.query.order_by(Patients.PatientID).all()
+        else:
+            rows = with_loading(Appointments.query, 'appointments.json').order_by(Appointments.AppointmentID).all()
+        items = [row.as_dict() for row in rows]
+    else:
+        projection, key = ((PATIENT_ROWS, Patients.PatientID) if listing == 'patients'
+                           else (APPOINTMENT_ROWS, Appointments.AppointmentID))
+        rows = db.session.execute(projection.select().order_by(key)).all()
+        items = [projection.serialize(row) for row in rows]
+    body = json.dumps(items, default=str)
+    db.session.remove()
+    return len(items), body
+
+def measure(uri, listing, path, repeat, results):
+    """Run in a fresh process: peak RSS of the first run, best time of repeat runs"""
+    from generate import make_app
+    with make_app(uri).app_context():
+        baseline = _rss_kb()
+        started = time.perf_counter()
+        count, body = _load(listing, path)
+        times = [time.perf_counter() - started]
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        digest = hashlib.sha256(body.encode()).hexdigest()
+        del body
+        for _ in range(repeat - 1):
+            started = time.perf_counter()
+            _load(listing, path)
+            times.append(time.perf_counter() - started)
+    results.put({'rows': count, 'seconds': min(times), 'peak_rss_kb': peak - baseline, 'digest': digest})
+
+def run(uri, listing, path, repeat):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=measure, args=(uri, listing, path, repeat, results))
+    process.start()
+    result = results.get(timeout=3600)
+    process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', help='an existing database')
+    parser.add_argument('--dataset', help='manifest written by generate.py')
+    parser.add_argument('--patients', type=int, default=20000, help='size of the generated dataset')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.dataset:
+        with open(args.dataset) as f:
+            uri = json.load(f)['database_uri']
+    else:
+        uri = args.database_uri
+    if uri is None:
+        from extensions import db
+        from generate import make_app, generate
+        uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'projection.db')
+        with make_app(uri).app_context():
+            generate(args.patients, log=lambda message: None)
+            db.session.remove()
+
+    mismatches = []
+    print(f'{"listing":14} {"path":11} {"rows":>8} {"rows/s":>10} {"peak RSS MB":>12}')
+    for listing in ('patients', 'appointments'):
+        results = {path: run(uri, listing, path, args.repeat) for path in ('orm', 'projection')}
+        for path, result in results.items():
+            print(f'{listing:14} {path:11} {result["rows"]:>8} {result["rows"] / result["seconds"]:>10.0f} '
+                  f'{result["peak_rss_kb"] / 1024:>12.1f}')
+        orm, projection = results['orm'], results['projection']
+        print(f'{"":14} {"speedup":11} {"":>8} {orm["seconds"] / projection["seconds"]:>9.2f}x '
+              f'{orm["peak_rss_kb"] / max(projection["peak_rss_kb"], 1):>11.2f}x')
+        if orm['digest'] != projection['digest']:
+            mismatches.append(listing)
+    for listing in mismatches:
+        print(f'ERROR: {listing} JSON differs between the ORM and projection paths')
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    main()
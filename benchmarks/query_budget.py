@@ -0,0 +1,227 @@
+"""N+1 detector and query-budget check for every GET route.
+
+Seeds an in-memory SQLite database at two sizes (benchmarks/seed.py), calls
+each GET route against both and counts the SQL statements it runs:
+  * a route whose count grows with the data is reported as N+1;
+  * a route declaring @query_budget(n) fails if it runs more than n;
+  * a route that raises or answers 5xx fails.
+List routes are also called with Accept: application/json, as "<endpoint> [json]".
+HTML views whose template is not in the tree are reported as skipped.
+    python benchmarks/query_budget.py               # every route of app.py
+    python benchmarks/query_budget.py --api-only    # the routes.py blueprints only
+    python benchmarks/query_budget.py --small 3 --large 12
+
+The full app is built by create_app() with FLASK_SQLALCHEMY_DATABASE_URI
+pointing at SQLite, and needs config.py. Exits with status 1 on any N+1 or
+budget overrun; tests/test_query_budget.py runs the --api-only check.
+"""
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import queue
+import sys
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from jinja2 import TemplateNotFound
+from sqlalchemy import event
+from extensions import db, init_extensions
+from patient_search import warm_patient_search
+from seed import seed, seed_users
+
+# Values for URL arguments that are not integer ids
+URL_ARGUMENTS = {'catalog': 'pharmacy'}
+# Query strings some routes need to do real work
+QUERY_STRINGS = {
+    'patients.search_patients_route': 'q=pat',
+    'catalog.autocomplete_catalog': 'q=med',
+}
+SKIP = {'static', 'logout', 'metrics'}
+# List routes whose JSON path (keyset pages of projections.py rows) differs from the HTML one
+JSON_LISTS = {
+    'patients.get_patients', 'doctors.get_doctors', 'departments.get_departments',
+    'laboratory.get_laboratory_tests', 'radiology.get_radiology_tests', 'supplies.get_supplies',
+    'appointments.get_appointments',
+}
+JSON_HEADERS = {'Accept': 'application/json'}
+# Periodic freshness checks would make counts depend on timing; a run is
+# far shorter than these
+STEADY_CONFIG = {
+    'CATALOG_VERSION_CHECK_SECONDS': 3600,
+    'DASHBOARD_STATS_MAX_AGE': 3600,
+    'PATIENT_SEARCH_SYNC_SECONDS': 3600,
+}
+# Admin first: most role_required views accept it
+ROLE_ORDER = ('Admin', 'Doctor', 'Receptionist', 'Nurse', 'Pharmacist', 'Chemist', 'Radiologist', 'Patient')
+
+def full_app():
+    os.environ.setdefault('FLASK_SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    from app import app
+    return app
+
+def api_app(uri='sqlite://'):
+    import routes
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SECRET_KEY'] = 'query-budget'
+    init_extensions(app)
+    for name in dir(routes):
+        if name.endswith('_bp'):
+            app.register_blueprint(getattr(routes, name))
+    return app
+
+def get_routes(app):
+    """(name, endpoint, url, headers) for every GET route that can be called without a body"""
+    adapter = app.url_map.bind('localhost')
+    found = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if 'GET' not in rule.methods or rule.endpoint.split('.')[-1] in SKIP:
+            continue
+        values = {}
+        for argument in rule.arguments:
+            converter = rule._converters[argument]
+            if type(converter).__name__ == 'IntegerConverter':
+                values[argument] = 1
+            elif argument in URL_ARGUMENTS:
+                values[argument] = URL_ARGUMENTS[argument]
+        if set(values) != set(rule.arguments):
+            continue
+        url = adapter.build(rule.endpoint, values)
+        if rule.endpoint in QUERY_STRINGS:
+            url += '?' + QUERY_STRINGS[rule.endpoint]
+        found.append((rule.endpoint, rule.endpoint, url, {}))
+        if rule.endpoint in JSON_LISTS:
+            found.append((f'{rule.endpoint} [json]', rule.endpoint, url, JSON_HEADERS))
+    return found
+
+def _redirected_away(response):
+    # role_required sends other roles back to the login or index page; JSON views answer 401/403
+    if response.status_code in (401, 403):
+        return True
+    return response.status_code == 302 and urlparse(response.location).path in ('/', '/login')
+
+def _call(client, engine, url, users, headers):
+    """Status and statement count of a warm call, as the first role allowed in"""
+    queries = [0]
+
+    def count(*args):
+        queries[0] += 1
+
+    for role in ROLE_ORDER:
+        with client.session_transaction() as session:
+            session.update(user_id=users[role], user_role=role, user_name=f'Bench {role}')
+        # The first call warms per-worker caches (catalogs, indexes, counters)
+        client.get(url, headers=headers).close()
+        event.listen(engine, 'after_cursor_execute', count)
+        try:
+            response = client.get(url, headers=headers)
+            response.get_data()
+            response.close()
+        finally:
+            event.remove(engine, 'after_cursor_execute', count)
+        if not _redirected_away(response):
+            return response.status_code, queries[0], role
+        queries[0] = 0
+    return response.status_code, queries[0], None
+
+def measure(api_only, scale, results):
+    """Run in a fresh process per scale, so no per-worker cache carries over"""
+    app = api_app() if api_only else full_app()
+    app.config['TESTING'] = True
+    app.config.update(STEADY_CONFIG)
+    with app.app_context():
+        db.create_all()
+        users = seed_users()
+        seed(scale)
+        # As at startup, so searches do not depend on when the index is built
+        warm_patient_search()
+        engine = db.engine
+
+    # Outside any app context, so each request gets its own session as in production
+    client = app.test_client()
+    counts = {}
+    budgets = {}
+    for name, endpoint, url, headers in get_routes(app):
+        budgets[name] = getattr(app.view_functions[endpoint], 'query_budget', None)
+        try:
+            counts[name] = (url, *_call(client, engine, url, users, headers))
+        except TemplateNotFound as e:
+            counts[name] = (url, f'skipped: template {e.name} not found', None, None)
+        except Exception as e:
+            counts[name] = (url, f'{type(e).__name__}: {e}', None, None)
+    results.put((counts, budgets))
+
+def run(api_only, scale):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    process = context.Process(target=measure, args=(api_only, scale, results))
+    process.start()
+    while True:
+        try:
+            counts, budgets = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if process.is_alive():
+                continue
+            # One last look, in case the result arrived as the process exited
+            try:
+                counts, budgets = results.get(timeout=1)
+                break
+            except queue.Empty:
+                sys.exit(f'Measuring at scale {scale} failed: the worker exited with status {process.exitcode}')
+    process.join()
+    return counts, budgets
+
+def check(api_only=True, small_scale=3, large_scale=12):
+    """[(endpoint, status, queries at small, at large, budget, result, failed)] per route"""
+    small, budgets = run(api_only, small_scale)
+    large, _ = run(api_only, large_scale)
+    rows = []
+    for endpoint in sorted(large):
+        url, status, queries, role = large[endpoint]
+        small_queries = small.get(endpoint, (None, None, None))[2]
+        budget = budgets.get(endpoint)
+        failed = True
+        if isinstance(status, str) and status.startswith('skipped'):
+            result, failed = status, False
+        elif not isinstance(status, int):
+            result = f'error: {status}'
+        elif role is None:
+            result, failed = 'no role allowed in', False
+        elif status >= 500:
+            result = 'server error'
+        elif small_queries is not None and queries > small_queries:
+            result = 'N+1: query count grows with rows'
+        elif budget is not None and queries > budget:
+            result = 'over budget'
+        else:
+            result, failed = 'ok', False
+        rows.append((endpoint, status, small_queries, queries, budget, result, failed))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--api-only', action='store_true', help='skip app.py and its templates')
+    parser.add_argument('--small', type=int, default=3, help='seed scale of the first run')
+    parser.add_argument('--large', type=int, default=12, help='seed scale of the second run')
+    args = parser.parse_args()
+    if not args.api_only and importlib.util.find_spec('config') is None:
+        sys.exit('app.py imports config.py, which is not in this tree; run with --api-only')
+
+    rows = check(args.api_only, args.small, args.large)
+    print(f'{"endpoint":45} {"status":>6} {"q@" + str(args.small):>6} {"q@" + str(args.large):>6} {"budget":>6}  result')
+    for endpoint, status, small_queries, queries, budget, result, _ in rows:
+        print(f'{endpoint:45} {status if isinstance(status, int) else "-":>6} '
+              f'{small_queries if small_queries is not None else "-":>6} '
+              f'{queries if queries is not None else "-":>6} {budget if budget is not None else "-":>6}  {result}')
+
+    failures = sum(failed for *_, failed in rows)
+    print(f'\n{failures} of {len(rows)} routes failed')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
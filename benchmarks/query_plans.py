@@ -0,0 +1,166 @@
+"""Query-plan regression check for the hot lookups.
+
+Runs each query in HOT_QUERIES the way the app does, EXPLAINs every SELECT
+it sends and fails when a plan scans a whole table holding at least
+--min-rows rows:
+    python benchmarks/query_plans.py                                  # new SQLite dataset
+    python benchmarks/query_plans.py --dataset bench.json             # a generate.py dataset
+    python benchmarks/query_plans.py --database-uri postgresql://localhost/hms --min-rows 50000
+
+Without --dataset or --database-uri a dataset of --patients is generated
+first (benchmarks/generate.py). SQLite and PostgreSQL plans are understood;
+on PostgreSQL, run ANALYZE first so the planner sees the real table sizes.
+Exits with status 1 on any such scan.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event, func, text
+from extensions import db
+from models import Users, Patients, Appointments
+from patient_portal import dashboard_appointments
+from slow_queries import explain
+from generate import make_app, generate
+
+# SQLite "SCAN Patients" (a bare SCAN, not one USING an index) and
+# PostgreSQL "Seq Scan on "Patients""
+FULL_SCAN = {
+    'sqlite': re.compile(r'^SCAN (\w+)$'),
+    'postgresql': re.compile(r'Seq Scan on "?(\w+)"?'),
+}
+
+def _day_range(sample):
+    start = datetime.combine(sample['day'], datetime.min.time())
+    return start, start + timedelta(days=1)
+
+# name -> callable(sample), each mirroring a query of the app
+HOT_QUERIES = {
+    'login (Users by Email)': lambda sample: Users.query.filter_by(Email=sample['user_email']).first(),
+    'patient_portal.link_patient': lambda sample: (
+        db.session.query(Patients.PatientID).filter(Patients.Email == sample['patient_email'])
+        .order_by(Patients.PatientID).limit(1).scalar()),
+    'patient_portal.dashboard_appointments': lambda sample: dashboard_appointments(sample['patient_id'],
+                                                                                     sample['now']),
+    'dashboard_stats: in house': lambda sample: Patients.query.filter(
+        Patients.Date_admission.isnot(None), Patients.Date_discharge.is_(None)).count(),
+    'dashboard_stats: admissions of a day': lambda sample: Patients.query.filter(
+        Patients.Date_admission >= _day_range(sample)[0], Patients.Date_admission < _day_range(sample)[1]).count(),
+    'dashboard_stats: discharges of a day': lambda sample: Patients.query.filter(
+        Patients.Date_discharge >= _day_range(sample)[0], Patients.Date_discharge < _day_range(sample)[1]).count(),
+    'dashboard_stats: appointments of a day': lambda sample: Appointments.query.filter(
+        Appointments.AppointmentDate >= _day_range(sample)[0],
+        Appointments.AppointmentDate < _day_range(sample)[1]).count(),
+    'availability: appointments of a day': lambda sample: (
+        db.session.query(Appointments.DoctorID, Appointments.AppointmentDate)
+        .filter(Appointments.AppointmentDate >= _day_range(sample)[0],
+                Appointments.AppointmentDate < _day_range(sample)[1],
+                Appointments.DoctorID.isnot(None)).all()),
+    'queue_allocator: last number of a doctor day': lambda sample: (
+        db.session.query(func.coalesce(func.max(Appointments.QueueNumber), 0))
+        .filter(Appointments.DoctorID == sample['doctor_id'],
+                Appointments.AppointmentDate >= _day_range(sample)[0],
+                Appointments.AppointmentDate < _day_range(sample)[1]).scalar()),
+    'patients API: admitted_from/admitted_to': lambda sample: (
+        Patients.query.filter(Patients.Date_admission >= _day_range(sample)[0],
+                              Patients.Date_admission < _day_range(sample)[1])
+        .order_by(Patients.PatientID).limit(50).all()),
+    'patients API: Email filter': lambda sample: (
+        Patients.query.filter(Patients.Email == sample['patient_email'])
+        .order_by(Patients.PatientID).limit(50).all()),
+}
+
+def _sample():
+    """Values that exist in the database, so plans reflect real lookups"""
+    patient = Patients.query.order_by(Patients.PatientID).offset(Patients.query.count() // 2).first()
+    appointment = Appointments.query.order_by(Appointments.AppointmentID).offset(
+        Appointments.query.count() // 2).first()
+    user = Users.query.first()
+    return {
+        'now': datetime.now(),
+        'user_email': user.Email if user else 'nobody@example.com',
+        'patient_id': patient.PatientID if patient else 0,
+        'patient_email': patient.Email if patient else 'nobody@example.com',
+        'doctor_id': appointment.DoctorID if appointment else 0,
+        'day': appointment.AppointmentDate.date() if appointment else datetime.now().date(),
+    }
+
+def capture_plans(run, sample):
+    """[(sql, plan lines)] of the SELECTs run(sample) sends"""
+    plans = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            plans.append((statement, explain(conn, statement, parameters)))
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', on_execute)
+    try:
+        run(sample)
+    finally:
+        event.remove(engine, 'before_cursor_execute', on_execute)
+        db.session.rollback()
+    return plans
+
+def full_scans(dialect, plan):
+    pattern = FULL_SCAN.get(dialect)
+    if pattern is None or not isinstance(plan, list):
+        return []
+    return [match.group(1) for line in plan for match in [pattern.search(line.strip())] if match]
+
+def check(min_rows):
+    dialect = db.engine.dialect.name
+    if dialect not in FULL_SCAN:
+        sys.exit(f'Plans of {dialect} are not understood; use SQLite or PostgreSQL')
+    sample = _sample()
+    sizes = {}
+    failures = []
+    for name, run in HOT_QUERIES.items():
+        for statement, plan in capture_plans(run, sample):
+            scans = full_scans(dialect, plan)
+            for table in scans:
+                if table not in sizes:
+                    sizes[table] = db.session.execute(text(f'SELECT count(*) FROM "{table}"')).scalar()
+            large = [table for table in scans if sizes[table] >= min_rows]
+            print(f'{"FAIL" if large else "ok  "} {name}')
+            for line in plan if isinstance(plan, list) else [plan]:
+                print(f'       {line}')
+            if large:
+                if name not in failures:
+                    failures.append(name)
+                print(f'       full scan of {", ".join(f"{t} ({sizes[t]} rows)" for t in large)}')
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', help='an existing database to check')
+    parser.add_argument('--dataset', help='manifest written by generate.py')
+    parser.add_argument('--patients', type=int, default=20000, help='size of the generated dataset')
+    parser.add_argument('--min-rows', type=int, default=10000, help='smallest table a full scan fails on')
+    args = parser.parse_args()
+
+    if args.dataset:
+        with open(args.dataset) as f:
+            uri = json.load(f)['database_uri']
+    else:
+        uri = args.database_uri
+    app = make_app(uri or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'plans.db'))
+    with app.app_context():
+        if uri is None:
+            generate(args.patients, log=lambda message: None)
+            # Table statistics, as a long-running database would have
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+        failures = check(args.min_rows)
+    print(f'\n{len(failures)} of {len(HOT_QUERIES)} queries scan a table of {args.min_rows}+ rows')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Concurrency stress test for the appointment queue allocator.
+
+Books appointments for one doctor and day from many threads at once and
+checks that every queue number is unique and the capacity is respected:
+    python benchmarks/queue_stress.py --threads 16 --bookings 400
+    python benchmarks/queue_stress.py --database-uri postgresql://localhost/hms_bench
+
+Exits with status 1 if a duplicate number or an over-booking is found.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+from extensions import db, init_extensions
+from models import Doctors, Appointments
+from queue_allocator import allocate_queue_number, NoSlotsAvailable
+
+def make_app(uri, capacity):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['APPOINTMENT_DAILY_SLOTS'] = capacity
+    if uri.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    init_extensions(app)
+    return app
+
+def book(app, doctor_id, when):
+    """One booking transaction; returns the queue number or None when full"""
+    with app.app_context():
+        for _ in range(50):
+            try:
+                queue_number, remaining = allocate_queue_number(doctor_id, when)
+                db.session.add(Appointments(DoctorID=doctor_id, AppointmentDate=when,
+                                            QueueNumber=queue_number, AvailableSlots=remaining))
+                db.session.commit()
+                return queue_number
+            except NoSlotsAvailable:
+                db.session.rollback()
+                return None
+            except OperationalError:
+                # SQLite "database is locked": retry the whole transaction
+                db.session.rollback()
+                time.sleep(0.01)
+        raise RuntimeError('Booking kept failing with lock errors')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--bookings', type=int, default=400)
+    parser.add_argument('--capacity', type=int, default=300)
+    args = parser.parse_args()
+
+    uri = args.database_uri or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'queue_stress.db')
+    app = make_app(uri, args.capacity)
+    with app.app_context():
+        db.create_all()
+        doctor = Doctors(Name='Stress Test')
+        db.session.add(doctor)
+        db.session.commit()
+        doctor_id = doctor.DoctorID
+
+    when = datetime(2030, 1, 1, 9, 0)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        numbers = list(executor.map(lambda _: book(app, doctor_id, when), range(args.bookings)))
+    seconds = time.perf_counter() - started
+
+    assigned = [n for n in numbers if n is not None]
+    duplicates = [n for n, count in Counter(assigned).items() if count > 1]
+    expected = min(args.bookings, args.capacity)
+    print(f'{len(assigned)} booked, {len(numbers) - len(assigned)} rejected as full, '
+          f'{len(assigned) / seconds:.1f} bookings/sec')
+
+    failed = False
+    if duplicates:
+        print(f'FAIL: duplicate queue numbers {sorted(duplicates)[:20]}')
+        failed = True
+    if len(assigned) != expected or sorted(assigned) != list(range(1, expected + 1)):
+        print(f'FAIL: expected numbers 1..{expected}')
+        failed = True
+
+    with app.app_context():
+        stored = [n for (n,) in db.session.query(Appointments.QueueNumber).filter_by(DoctorID=doctor_id)]
+        if len(stored) != len(set(stored)):
+            print('FAIL: duplicate queue numbers stored in Appointments')
+            failed = True
+
+    if not failed:
+        print('OK: no duplicates, capacity respected')
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Synthetic hospital data for the benchmark and query-budget scripts.
+
+seed(scale) fills an empty database through the ORM and the stock helpers,
+so the same listeners run as in production (dashboard counters, inventory
+summary, search log). Every table grows linearly with scale and the same
+scale and seed always produce the same rows.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import (Departments, Doctors, Patients, Appointments, Pharmacy, Supplies, Laboratory,
+                    Radiology, Patient_Laboratory, Patient_Radiology, Users, UserRole)
+from orders import sync_patient_orders
+from werkzeug.security import generate_password_hash
+from passwords import DEFAULT_METHOD, DEFAULT_SALT_LENGTH
+from stock import dispense_medicines, use_supplies
+
+FIRST_NAMES = ('Ahmed', 'Sara', 'Omar', 'Mona', 'Youssef', 'Laila', 'Karim', 'Nour', 'Hassan', 'Dina')
+LAST_NAMES = ('Ali', 'Hassan', 'Ibrahim', 'Mahmoud', 'Saleh', 'Farouk', 'Nabil', 'Kamal')
+SPECIALISTS = ('Cardiology', 'Neurology', 'Pediatrics', 'Orthopedics', 'Dermatology')
+MEDICINE_NAMES = ('Paracetamol', 'Amoxicillin', 'Ibuprofen', 'Omeprazole', 'Metformin', 'Atorvastatin',
+                  'Amlodipine', 'Ciprofloxacin', 'Insulin', 'Salbutamol', 'Diclofenac', 'Azithromycin')
+PASSWORD = 'benchmark'
+
+def _name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+def seed_users(password=PASSWORD):
+    """One user per role, email <role>@bench.local; returns {role value: UserID}
+
+    The Patient login uses the first seeded patient's email, so the patient
+    portal links it on first use.
+    """
+    # Hashed here rather than through the passwords.py process pool
+    password_hash = generate_password_hash(password, method=DEFAULT_METHOD, salt_length=DEFAULT_SALT_LENGTH)
+    users = {}
+    for role in UserRole:
+        email = 'patient0@bench.local' if role is UserRole.Patient else f'{role.value.lower()}@bench.local'
+        user = Users(Name=f'Bench {role.value}', Role=role, Email=email,
+                     PasswordHash=password_hash)
+        db.session.add(user)
+        users[role.value] = user
+    db.session.commit()
+    return {role: user.UserID for role, user in users.items()}
+
+def seed(scale, seed=0, now=None):
+    """Insert about scale rows per table (appointments: 2 * scale); returns the row counts"""
+    rng = random.Random(seed)
+    now = now or datetime.now().replace(microsecond=0)
+
+    departments = [Departments(DepartmentName=f'{name} Department')
+                   for name in SPECIALISTS[:max(1, min(len(SPECIALISTS), scale // 5))]]
+    db.session.add_all(departments)
+    db.session.flush()
+
+    doctors = [Doctors(Name=f'Dr. {_name(rng)}', Age=rng.randint(30, 65), ScientificDegree='MD',
+                       Specialist=rng.choice(SPECIALISTS), DepartmentID=rng.choice(departments).DepartmentID,
+                       Phone=f'010{i:08d}', Email=f'doctor{i}@bench.local')
+               for i in range(scale)]
+    medicines = [Pharmacy(MedicineName=f'{MEDICINE_NAMES[i % len(MEDICINE_NAMES)]} {i} {rng.choice((250, 500, 1000))}mg',
+                          UnitPrice=round(rng.uniform(5, 200), 2), Quantity=10 * scale + rng.randint(0, 50))
+                 for i in range(scale)]
+    supplies = [Supplies(ItemName=f'Supply {i}', Quantity=10 * scale + rng.randint(0, 50),
+                         UnitPrice=round(rng.uniform(1, 50), 2))
+                for i in range(scale)]
+    lab_tests = [Laboratory(TestName=f'Lab test {i}', Description='', Price=rng.randint(50, 500))
+                 for i in range(scale)]
+    radiology_tests = [Radiology(TestName=f'Scan {i}', Description='', Price=rng.randint(100, 2000))
+                       for i in range(scale)]
+    db.session.add_all(doctors + medicines + supplies + lab_tests + radiology_tests)
+    db.session.flush()
+
+    patients = []
+    for i in range(scale):
+        admitted = now - timedelta(days=rng.randint(0, 30), hours=rng.randint(0, 23))
+        patient = Patients(Name=_name(rng), NationalID=f'{29000000000000 + i}', Age=rng.randint(1, 90),
+                           Gender=rng.choice(('Male', 'Female')), Weight=rng.randint(40, 110),
+                           Height=rng.randint(140, 195), Address=f'{i} Bench Street',
+                           Phone=f'011{i:08d}', Email=f'patient{i}@bench.local',
+                           Doctor=rng.choice(doctors).DoctorID, Date_admission=admitted,
+                           Date_discharge=admitted + timedelta(days=3) if rng.random() < 0.5 else None)
+        patients.append(patient)
+    db.session.add_all(patients)
+    db.session.flush()
+
+    for patient in patients:
+        orders = {
+            'medicines': [{'id': rng.choice(medicines).MedicineID}],
+            'labTests': [{'id': rng.choice(lab_tests).TestID}],
+            'radiologyTests': [{'id': rng.choice(radiology_tests).RadiologyID}],
+            'supplies': [{'id': rng.choice(supplies).SupplyID}],
+        }
+        patient.DoctorOrders = json.dumps(orders)
+        sync_patient_orders(patient, orders)
+        db.session.add(Patient_Laboratory(PatientID=patient.PatientID, TestID=rng.choice(lab_tests).TestID))
+        db.session.add(Patient_Radiology(PatientID=patient.PatientID,
+                                         RadiologyID=rng.choice(radiology_tests).RadiologyID))
+        dispense_medicines(patient.PatientID, patient.Doctor,
+                           [{'MedicineID': rng.choice(medicines).MedicineID, 'Quantity': rng.randint(1, 3)}])
+        use_supplies(patient.PatientID, patient.Doctor,
+                     [{'SupplyID': rng.choice(supplies).SupplyID, 'Quantity': rng.randint(1, 5)}])
+
+    queue_numbers = {}
+    for i in range(2 * scale):
+        doctor = rng.choice(doctors)
+        when = (now + timedelta(days=rng.randint(-10, 10))).replace(hour=rng.randint(8, 16), minute=0, second=0)
+        queue_numbers[(doctor.DoctorID, when.date())] = queue_numbers.get((doctor.DoctorID, when.date()), 0) + 1
+        db.session.add(Appointments(PatientID=rng.choice(patients).PatientID, DoctorID=doctor.DoctorID,
+                                    AppointmentDate=when, QueueNumber=queue_numbers[(doctor.DoctorID, when.date())],
+                                    AvailableSlots=30))
+    db.session.commit()
+
+    return {
+        'departments': len(departments), 'doctors': len(doctors), 'patients': len(patients),
+        'appointments': 2 * scale, 'medicines': len(medicines), 'supplies': len(supplies),
+        'lab_tests': len(lab_tests), 'radiology_tests': len(radiology_tests)
+    }
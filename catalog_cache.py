@@ -0,0 +1,155 @@
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from extensions import db
+from models import Doctors, Departments, Pharmacy, Laboratory, Radiology, Supplies, CatalogVersions
+
+# Reference catalogs cached per worker process, as lists of as_dict() rows.
+# Writers call invalidate_catalog() before committing; once the commit lands,
+# the catalog's row in CatalogVersions is bumped so other gunicorn workers
+# notice on their next check.
+CATALOGS = {
+    'doctors': lambda: Doctors.query.order_by(Doctors.DoctorID),
+    'departments': lambda: Departments.query.order_by(Departments.DepartmentID),
+    'pharmacy': lambda: Pharmacy.query.order_by(Pharmacy.MedicineID),
+    'laboratory': lambda: Laboratory.query.order_by(Laboratory.TestID),
+    'radiology': lambda: Radiology.query.order_by(Radiology.RadiologyID),
+    'supplies': lambda: Supplies.query.order_by(Supplies.SupplyID),
+}
+# Stock levels change with every dispense (stock.py) without invalidating the
+# catalog, so they are not cached: get_catalog() reads them from the table
+# (id column, live columns)
+LIVE_FIELDS = {
+    'pharmacy': (Pharmacy.MedicineID, (Pharmacy.Quantity,)),
+    'supplies': (Supplies.SupplyID, (Supplies.Quantity,)),
+}
+
+# How long a worker trusts its copy before re-reading CatalogVersions
+DEFAULT_VERSION_CHECK_SECONDS = 2.0
+
+_lock = threading.Lock()
+_entries = {}  # name -> (version, rows)
+_versions = {}  # name -> version last read from CatalogVersions
+_versions_checked_at = 0.0
+_invalidations = 0  # bumped by every local invalidation, so older reads are not trusted
+stats = {'hits': 0, 'misses': 0}
+
+def _version(name):
+    """The catalog's shared version, re-read from CatalogVersions at most every TTL"""
+    global _versions_checked_at
+    ttl = current_app.config.get('CATALOG_VERSION_CHECK_SECONDS', DEFAULT_VERSION_CHECK_SECONDS)
+    now = time.monotonic()
+    with _lock:
+        if now - _versions_checked_at < ttl:
+            return _versions.get(name, 0)
+        invalidations = _invalidations
+
+    # One small query covers every catalog; run outside the lock
+    rows = (db.session.query(CatalogVersions.Name, CatalogVersions.Version)
+            .filter(CatalogVersions.Name.in_(list(CATALOGS)))
+            .all())
+    with _lock:
+        if invalidations == _invalidations:
+            _versions.clear()
+            _versions.update({name: version for name, version in rows})
+            _versions_checked_at = now
+        return dict(rows).get(name, 0)
+
+def _with_live_fields(name, rows):
+    if name not in LIVE_FIELDS:
+        return rows
+    id_column, columns = LIVE_FIELDS[name]
+    live = {row[0]: row[1:] for row in db.session.query(id_column, *columns)}
+    keys = [column.key for column in columns]
+    # Rows deleted since the load are dropped; copies keep the cached rows clean
+    return [dict(row, **dict(zip(keys, live[row[id_column.key]])))
+            for row in rows if row[id_column.key] in live]
+
+def get_catalog(name):
+    """Return the cached rows of a reference catalog, loading it if stale"""
+    version = _version(name)
+    with _lock:
+        entry = _entries.get(name)
+        if entry and entry[0] == version:
+            stats['hits'] += 1
+            rows = entry[1]
+        else:
+            stats['misses'] += 1
+            rows = None
+
+    if rows is None:
+        # Loaded outside the lock so other catalogs stay readable meanwhile
+        live = {column.key for column in LIVE_FIELDS.get(name, (None, ()))[1]}
+        rows = [{key: value for key, value in row.as_dict().items() if key not in live}
+                for row in CATALOGS[name]()]
+        with _lock:
+            entry = _entries.get(name)
+            if not entry or entry[0] <= version:
+                _entries[name] = (version, rows)
+    return _with_live_fields(name, rows)
+
+def invalidate_catalog(name):
+    """Mark a catalog as changed by the caller's transaction; the version is bumped after it commits"""
+    db.session.info.setdefault('catalog_invalidations', set()).add(name)
+
+def catalog_version(name):
+    """The catalog's shared version as last seen by this worker"""
+    return _version(name)
+
+def bump_version(name, session=None):
+    """Increment a shared version row in the session's transaction and return the new value"""
+    session = session or db.session
+
+    def increment():
+        return (session.query(CatalogVersions)
+                .filter_by(Name=name)
+                .update({CatalogVersions.Version: CatalogVersions.Version + 1},
+                        synchronize_session=False))
+
+    if not increment():
+        try:
+            with session.begin_nested():
+                session.add(CatalogVersions(Name=name, Version=1))
+        except IntegrityError:
+            # Created by a concurrent writer; bump that row instead
+            increment()
+    return session.query(CatalogVersions.Version).filter_by(Name=name).scalar()
+
+@event.listens_for(Session, 'after_commit')
+def _bump_invalidated(session):
+    # Savepoint commits fire this event too; wait for the real commit
+    if session.in_nested_transaction():
+        return
+    names = session.info.pop('catalog_invalidations', None)
+    if not names:
+        return
+    # Bumped once the change is visible, so no worker caches the old rows
+    # under the new version. Its own session, as this one has just finished.
+    with Session(session.get_bind()) as bump_session, bump_session.begin():
+        # Lets later after_commit listeners (autocomplete.py) tell their own writes apart
+        session.info['catalog_versions'] = {name: bump_version(name, bump_session)
+                                            for name in sorted(names)}
+    global _versions_checked_at, _invalidations
+    with _lock:
+        for name in names:
+            _entries.pop(name, None)
+        _versions_checked_at = 0.0
+        _invalidations += 1
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidations(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('catalog_invalidations', None)
+
+def clear_catalog_cache():
+    """Forget every cached catalog in this worker"""
+    global _versions_checked_at, _invalidations
+    with _lock:
+        _entries.clear()
+        _versions.clear()
+        _versions_checked_at = 0.0
+        _invalidations += 1
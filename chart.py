@@ -0,0 +1,108 @@
+from extensions import db
+from loading import with_loading
+from models import (Patients, Doctors, Appointments, Patient_MedicineUsage, Patient_Supplies,
+                    Patient_Laboratory, Patient_Radiology)
+
+# Patient chart: the patient plus each related collection, one query per
+# section (six in total) whatever the chart size. Sections are capped with
+# LIMIT in SQL, newest first, so a long stay does not load its whole history.
+DEFAULT_SECTION_LIMIT = 20
+MAX_SECTION_LIMIT = 500
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+def _appointment(row):
+    return {
+        'AppointmentID': row.AppointmentID,
+        'DoctorID': row.DoctorID,
+        'DoctorName': row.doctor.Name if row.doctor else None,
+        'AppointmentDate': _iso(row.AppointmentDate),
+        'QueueNumber': row.QueueNumber
+    }
+
+def _medicine_usage(row):
+    return {**row.as_dict(), 'MedicineName': row.medicine.MedicineName if row.medicine else None}
+
+def _supply_usage(row):
+    return {**row.as_dict(), 'ItemName': row.supply.ItemName if row.supply else None}
+
+def _laboratory(row):
+    return {'TestID': row.TestID, 'TestName': row.laboratory_test.TestName if row.laboratory_test else None}
+
+def _radiology(row):
+    return {'RadiologyID': row.RadiologyID,
+            'TestName': row.radiology_test.TestName if row.radiology_test else None}
+
+# section -> (model, ordering, serializer)
+SECTIONS = {
+    'appointments': (Appointments, lambda: (Appointments.AppointmentDate.desc(), Appointments.AppointmentID.desc()),
+                     _appointment),
+    'medicine_usage': (Patient_MedicineUsage, lambda: (Patient_MedicineUsage.UsageDate.desc(),), _medicine_usage),
+    'patient_supplies': (Patient_Supplies, lambda: (Patient_Supplies.DateUsed.desc(),), _supply_usage),
+    'patient_laboratory': (Patient_Laboratory, lambda: (Patient_Laboratory.TestID,), _laboratory),
+    'patient_radiology': (Patient_Radiology, lambda: (Patient_Radiology.RadiologyID,), _radiology),
+}
+
+# Dated sections that go into the timeline: section -> (date key, event type)
+TIMELINE = {
+    'appointments': ('AppointmentDate', 'appointment'),
+    'medicine_usage': ('UsageDate', 'medicine'),
+    'patient_supplies': ('DateUsed', 'supply'),
+}
+
+def _load_section(name, patient_id, limit):
+    model, ordering, serialize = SECTIONS[name]
+    # One extra row tells whether the section was cut off
+    rows = (with_loading(model.query, f'chart.{name}')
+            .filter(model.PatientID == patient_id)
+            .order_by(*ordering())
+            .limit(limit + 1)
+            .all())
+    return {
+        'items': [serialize(row) for row in rows[:limit]],
+        'truncated': len(rows) > limit
+    }
+
+def _timeline(patient, sections):
+    events = []
+    if patient['Date_admission']:
+        events.append({'type': 'admission', 'at': patient['Date_admission']})
+    if patient['Date_discharge']:
+        events.append({'type': 'discharge', 'at': patient['Date_discharge']})
+    for name, (date_key, event_type) in TIMELINE.items():
+        for item in sections.get(name, {}).get('items', []):
+            if item.get(date_key):
+                events.append({'type': event_type, 'at': item[date_key], **item})
+    # ISO strings of naive datetimes sort chronologically
+    events.sort(key=lambda event: event['at'], reverse=True)
+    return events
+
+def patient_chart(patient_id, limits=None, default_limit=DEFAULT_SECTION_LIMIT):
+    """Chart dict for a patient, or None if there is no such patient.
+
+    limits maps section names to their row caps; a cap of 0 leaves the
+    section out.
+    """
+    row = (db.session.query(Patients, Doctors.Name)
+           .outerjoin(Doctors, Doctors.DoctorID == Patients.Doctor)
+           .filter(Patients.PatientID == patient_id)
+           .first())
+    if row is None:
+        return None
+    patient, doctor_name = row
+    patient_dict = patient.as_dict()
+    patient_dict['DoctorName'] = doctor_name
+
+    sections = {}
+    for name in SECTIONS:
+        limit = (limits or {}).get(name, default_limit)
+        limit = max(0, min(limit, MAX_SECTION_LIMIT))
+        if limit:
+            sections[name] = _load_section(name, patient_id, limit)
+
+    return {
+        'patient': patient_dict,
+        **sections,
+        'timeline': _timeline(patient_dict, sections)
+    }
@@ -0,0 +1,225 @@
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, date, timedelta
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from extensions import db
+from models import Patients, Appointments, DashboardCounters
+from stock import add_to_total
+from tracking import track_history, committed_value
+
+# Role dashboard counters.
+# Writes to Patients and Appointments are turned into counter deltas in
+# before_flush and added to DashboardCounters just before commit (the bulk
+# importer reports its own rows). Each commit adds to one of
+# DASHBOARD_COUNTER_SHARDS rows per counter, picked at random, so commits do
+# not all lock the same 'patients.total' row; a counter is the sum of its
+# shards. Dashboards read a per-worker snapshot that is at most
+# DASHBOARD_STATS_MAX_AGE seconds old. "flask reconcile-stats" recounts
+# today's figures from the tables to correct any drift; run it from cron.
+DEFAULT_MAX_AGE = 30
+DEFAULT_SHARDS = 8
+RECONCILED_AT = 'stats.reconciled_at'
+
+def _as_date(value):
+    # Form posts assign ISO strings to the date columns
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        return value.date()
+    return value or None
+
+def patient_counters(admitted, discharged):
+    """Counters one patient contributes to, given their admission and discharge dates"""
+    counters = Counter({'patients.total': 1})
+    if admitted:
+        counters[f'admissions:{admitted}'] += 1
+        if not discharged:
+            counters['patients.in_house'] += 1
+    if discharged:
+        counters[f'discharges:{discharged}'] += 1
+    return counters
+
+def appointment_counters(day, doctor_id):
+    counters = Counter()
+    if day:
+        counters[f'appointments:{day}'] += 1
+        if doctor_id:
+            counters[f'appointments:{day}:doctor:{int(doctor_id)}'] += 1
+    return counters
+
+_TRACKED = {
+    Patients: (('Date_admission', 'Date_discharge'),
+               lambda admitted, discharged: patient_counters(_as_date(admitted), _as_date(discharged))),
+    Appointments: (('AppointmentDate', 'DoctorID'),
+                   lambda when, doctor_id: appointment_counters(_as_date(when), doctor_id)),
+}
+
+track_history(Patients.Date_admission, Patients.Date_discharge,
+              Appointments.AppointmentDate, Appointments.DoctorID)
+
+def _values(obj, keys, current):
+    if current:
+        return [getattr(obj, key) for key in keys]
+    return [committed_value(obj, key) for key in keys]
+
+def _record(session, delta):
+    pending = session.info.setdefault('dashboard_deltas', Counter())
+    pending.update(delta)
+
+def count_imported_patients(rows):
+    """Count patients inserted with Core statements, which skip before_flush"""
+    delta = Counter()
+    for row in rows:
+        delta.update(patient_counters(_as_date(row.get('Date_admission')), _as_date(row.get('Date_discharge'))))
+    _record(db.session(), delta)
+
+@event.listens_for(Session, 'before_flush')
+def _collect_counter_changes(session, flush_context, instances):
+    delta = Counter()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tracked = _TRACKED.get(type(obj))
+        if tracked is None:
+            continue
+        keys, counters = tracked
+        if obj not in session.new:
+            delta.subtract(counters(*_values(obj, keys, False)))
+        if obj not in session.deleted:
+            delta.update(counters(*_values(obj, keys, True)))
+    if any(delta.values()):
+        _record(session, delta)
+
+@event.listens_for(Session, 'before_commit')
+def _apply_counter_changes(session):
+    # Savepoint commits fire this event too; only act on the real commit
+    if session.in_nested_transaction() or session.info.get('applying_dashboard_deltas'):
+        return
+    session.flush()
+    pending = session.info.pop('dashboard_deltas', None)
+    if not pending:
+        return
+    session.info['applying_dashboard_deltas'] = True
+    try:
+        shard = random.randrange(_shards())
+        # Sorted, so concurrent commits lock the counter rows in the same order
+        for name, change in sorted(pending.items()):
+            if change:
+                add_to_total(DashboardCounters, {'Name': name, 'Shard': shard},
+                             {DashboardCounters.Value: DashboardCounters.Value + change},
+                             {'Value': change})
+        session.info['dashboard_changed'] = True
+    finally:
+        session.info.pop('applying_dashboard_deltas', None)
+
+@event.listens_for(Session, 'after_commit')
+def _expire_snapshot(session):
+    if session.in_nested_transaction():
+        return
+    if session.info.pop('dashboard_changed', None):
+        # Read-your-writes in this worker
+        _snapshot['loaded_at'] = 0.0
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_counter_changes(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('dashboard_deltas', None)
+    session.info.pop('dashboard_changed', None)
+
+def _shards():
+    return max(1, current_app.config.get('DASHBOARD_COUNTER_SHARDS', DEFAULT_SHARDS))
+
+def _set_counter(name, value):
+    # The count goes in shard 0; the other shards restart from zero
+    (DashboardCounters.query.filter(DashboardCounters.Name == name, DashboardCounters.Shard != 0)
+     .delete(synchronize_session=False))
+    updated = (DashboardCounters.query.filter_by(Name=name, Shard=0)
+               .update({DashboardCounters.Value: value}, synchronize_session=False))
+    if not updated:
+        add_to_total(DashboardCounters, {'Name': name, 'Shard': 0},
+                     {DashboardCounters.Value: value}, {'Value': value})
+
+def reconcile_dashboard_stats(day=None):
+    """Recount the global counters and one day's counters from the tables (flask reconcile-stats)"""
+    day = day or date.today()
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+
+    counts = {
+        'patients.total': Patients.query.count(),
+        'patients.in_house': Patients.query.filter(Patients.Date_admission.isnot(None),
+                                                   Patients.Date_discharge.is_(None)).count(),
+        f'admissions:{day}': Patients.query.filter(Patients.Date_admission >= start,
+                                                   Patients.Date_admission < end).count(),
+        f'discharges:{day}': Patients.query.filter(Patients.Date_discharge >= start,
+                                                   Patients.Date_discharge < end).count(),
+        f'appointments:{day}': Appointments.query.filter(Appointments.AppointmentDate >= start,
+                                                         Appointments.AppointmentDate < end).count(),
+    }
+    # Doctors with no appointments left that day go back to zero
+    DashboardCounters.query.filter(DashboardCounters.Name.like(f'appointments:{day}:doctor:%')).update(
+        {DashboardCounters.Value: 0}, synchronize_session=False)
+    per_doctor = (db.session.query(Appointments.DoctorID, func.count())
+                  .filter(Appointments.AppointmentDate >= start,
+                          Appointments.AppointmentDate < end,
+                          Appointments.DoctorID.isnot(None))
+                  .group_by(Appointments.DoctorID))
+    for doctor_id, count in per_doctor:
+        counts[f'appointments:{day}:doctor:{doctor_id}'] = count
+    counts[RECONCILED_AT] = int(time.time())
+
+    for name, value in sorted(counts.items()):
+        _set_counter(name, value)
+    db.session.commit()
+    return counts
+
+_lock = threading.Lock()
+_snapshot = {'loaded_at': 0.0, 'day': None, 'values': {}}
+stats = {'hits': 0, 'misses': 0}
+
+def _load(day):
+    names = ['patients.total', 'patients.in_house', RECONCILED_AT,
+             f'admissions:{day}', f'discharges:{day}', f'appointments:{day}']
+    rows = (db.session.query(DashboardCounters.Name, func.sum(DashboardCounters.Value))
+            .filter(DashboardCounters.Name.in_(names) |
+                    DashboardCounters.Name.like(f'appointments:{day}:doctor:%'))
+            .group_by(DashboardCounters.Name)
+            .all())
+    return {name: int(value) for name, value in rows}
+
+def dashboard_stats():
+    """Snapshot of the dashboard counters, at most DASHBOARD_STATS_MAX_AGE seconds old"""
+    max_age = current_app.config.get('DASHBOARD_STATS_MAX_AGE', DEFAULT_MAX_AGE)
+    day = date.today()
+    with _lock:
+        now = time.monotonic()
+        if now - _snapshot['loaded_at'] < max_age and _snapshot['day'] == day:
+            stats['hits'] += 1
+        else:
+            stats['misses'] += 1
+            values = _load(day)
+            _snapshot.update(loaded_at=now, day=day, values=values, as_of=datetime.now())
+        values = _snapshot['values']
+        as_of = _snapshot['as_of']
+
+    doctor_prefix = f'appointments:{day}:doctor:'
+    return {
+        'as_of': as_of.isoformat(),
+        'max_age_seconds': max_age,
+        'patients_total': values.get('patients.total', 0),
+        'patients_in_house': values.get('patients.in_house', 0),
+        'admissions_today': values.get(f'admissions:{day}', 0),
+        'discharges_today': values.get(f'discharges:{day}', 0),
+        'appointments_today': values.get(f'appointments:{day}', 0),
+        'appointments_today_by_doctor': {
+            int(name[len(doctor_prefix):]): value
+            for name, value in values.items()
+            if name.startswith(doctor_prefix) and value
+        }
+    }
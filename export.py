@@ -0,0 +1,50 @@
+import json
+from flask import request, jsonify, Response, stream_with_context
+from sqlalchemy import Select
+from extensions import db
+
+EXPORT_BATCH_SIZE = 1000
+
+def _as_dict(row):
+    return row.as_dict()
+
+def _ndjson_chunks(rows, batch_size, serialize=_as_dict):
+    lines = []
+    for row in rows:
+        # default=str covers Decimal and anything as_dict() leaves unconverted
+        lines.append(json.dumps(serialize(row), default=str))
+        if len(lines) >= batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def _json_array_chunks(rows, batch_size, serialize=_as_dict):
+    yield '['
+    first = True
+    for chunk in _ndjson_chunks(rows, batch_size, serialize):
+        items = chunk.rstrip('\n').replace('\n', ',')
+        yield items if first else ',' + items
+        first = False
+    yield ']'
+
+def stream_export(query, batch_size=EXPORT_BATCH_SIZE, serialize=_as_dict):
+    """Stream every row of query as NDJSON (?format=ndjson, default) or a JSON array (?format=json).
+
+    Rows are fetched from a server-side cursor batch_size at a time and written out
+    as they arrive, so memory stays flat regardless of table size. query is an ORM
+    query, or a Core select() whose rows serialize(row) turns into dicts.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'json'):
+        return jsonify({'message': f'Unsupported export format: {fmt}'}), 400
+
+    if isinstance(query, Select):
+        rows = db.session.execute(query.execution_options(stream_results=True, yield_per=batch_size))
+    else:
+        rows = query.execution_options(stream_results=True).yield_per(batch_size)
+    if fmt == 'ndjson':
+        body, mimetype = _ndjson_chunks(rows, batch_size, serialize), 'application/x-ndjson'
+    else:
+        body, mimetype = _json_array_chunks(rows, batch_size, serialize), 'application/json'
+    return Response(stream_with_context(body), mimetype=mimetype)
@@ -1,8 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
+from instrumentation import init_instrumentation
+from slow_queries import init_slow_query_log
 
 # Initialize SQLAlchemy
 db = SQLAlchemy()
 
 def init_extensions(app):
     """Initialize Flask extensions"""
-    db.init_app(app)
\ No newline at end of file
+    db.init_app(app)
+    init_instrumentation(app)
+    with app.app_context():
+        init_slow_query_log(app, db.engines.values())
\ No newline at end of file
@@ -0,0 +1,218 @@
+import bisect
+import threading
+import time
+from collections import deque
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request timing.
+# Request hooks time each request and cursor listeners add up the SQL it ran
+# (time, statement count, rows). Each request is recorded per endpoint in
+# rolling histograms covering the last INSTRUMENTATION_WINDOW_SECONDS and
+# reported to the client in a Server-Timing header. Figures are per worker;
+# the settings live in app.extensions['instrumentation'].
+DEFAULT_WINDOW_SECONDS = 300
+SLOT_SECONDS = 10
+
+BUCKETS = {
+    'wall_ms': (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+    'db_ms': (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+    'queries': (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500),
+    'rows': (0, 1, 10, 100, 1000, 10000, 100000),
+}
+
+class Histogram:
+    """Counts per upper bound, plus an overflow bucket"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th value (the max if it overflowed)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return round(min(bound, self.max), 2)
+        return round(self.max, 2)
+
+    def summary(self):
+        return {
+            'mean': round(self.sum / self.count, 2) if self.count else None,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 2)
+        }
+
+def _new_slot(start):
+    return start, {name: Histogram(bounds) for name, bounds in BUCKETS.items()}
+
+class _Rolling:
+    """Histograms of one endpoint in SLOT_SECONDS slots, oldest dropped first"""
+
+    def __init__(self):
+        self.slots = deque()
+
+    def observe(self, now, values):
+        start = now - now % SLOT_SECONDS
+        if not self.slots or self.slots[-1][0] != start:
+            self.slots.append(_new_slot(start))
+        histograms = self.slots[-1][1]
+        for name, value in values.items():
+            histograms[name].observe(value)
+
+    def expire(self, oldest):
+        while self.slots and self.slots[0][0] < oldest:
+            self.slots.popleft()
+
+    def merged(self):
+        _, total = _new_slot(0)
+        for _, histograms in self.slots:
+            for name, histogram in histograms.items():
+                total[name].merge(histogram)
+        return total
+
+_lock = threading.Lock()
+_endpoints = {}  # endpoint -> _Rolling
+_observers = []
+
+def on_request(observer):
+    """Call observer(blueprint, method, status, values) after each timed request"""
+    _observers.append(observer)
+    return observer
+
+def record_request(endpoint, values, now=None):
+    now = now if now is not None else time.time()
+    with _lock:
+        rolling = _endpoints.get(endpoint)
+        if rolling is None:
+            rolling = _endpoints[endpoint] = _Rolling()
+        rolling.observe(now, values)
+
+def endpoint_stats(now=None):
+    """{endpoint: {'requests', 'per_second', metric: summary}} over the rolling window"""
+    now = now if now is not None else time.time()
+    settings = current_app.extensions.get('instrumentation', {})
+    window = settings.get('window_seconds', DEFAULT_WINDOW_SECONDS)
+    result = {}
+    with _lock:
+        for endpoint, rolling in list(_endpoints.items()):
+            rolling.expire(now - window)
+            if not rolling.slots:
+                del _endpoints[endpoint]
+                continue
+            histograms = rolling.merged()
+            requests = histograms['wall_ms'].count
+            result[endpoint] = {
+                'requests': requests,
+                'per_second': round(requests / window, 3),
+                **{name: histogram.summary() for name, histogram in histograms.items()}
+            }
+    return result
+
+def query_budget(max_queries):
+    """Declare the most SQL statements a view may run per request.
+
+    benchmarks/query_budget.py fails when a view goes over; in production an
+    overrun is logged as a warning.
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+def _current():
+    # Only SQL run while serving a request is attributed to it
+    return g.get('_timing') if has_request_context() else None
+
+# The start time is kept on the execution context, like slow_queries.py, so
+# a statement that raises leaves nothing behind on the connection
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current() is not None:
+        context._timing_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    timing = _current()
+    started = getattr(context, '_timing_started', None)
+    if timing is None or started is None:
+        return
+    timing['db'] += time.perf_counter() - started
+    timing['queries'] += 1
+    # -1 when the driver does not report it (e.g. SQLite SELECTs)
+    if cursor.rowcount > 0:
+        timing['rows'] += cursor.rowcount
+
+def _before_request():
+    g._timing = {'started': time.perf_counter(), 'db': 0.0, 'queries': 0, 'rows': 0}
+
+def _finish(app, timing, endpoint, blueprint, method, status):
+    """Record a finished request; returns its values"""
+    values = {
+        'wall_ms': (time.perf_counter() - timing['started']) * 1000,
+        'db_ms': timing['db'] * 1000,
+        'queries': timing['queries'],
+        'rows': timing['rows']
+    }
+    record_request(endpoint or '<unmatched>', values)
+    budget = getattr(app.view_functions.get(endpoint), 'query_budget', None)
+    if budget is not None and timing['queries'] > budget:
+        app.logger.warning('%s ran %d queries, over its budget of %d', endpoint, timing['queries'], budget)
+    for observer in _observers:
+        observer(blueprint, method, status, values)
+    return values
+
+def _after_request(response):
+    timing = g.get('_timing')
+    if timing is None:
+        return response
+    app = current_app._get_current_object()
+    request_info = (request.endpoint, request.blueprint, request.method, response.status_code)
+    if response.is_streamed:
+        # The body (and its SQL, e.g. export.py) runs after this hook, so the
+        # request is recorded once the server closes the response. Headers are
+        # already gone by then, hence no Server-Timing.
+        response.call_on_close(lambda: _finish(app, timing, *request_info))
+        return response
+
+    g.pop('_timing', None)
+    values = _finish(app, timing, *request_info)
+    if app.extensions['instrumentation']['server_timing']:
+        response.headers.add('Server-Timing', f'app;dur={values["wall_ms"]:.1f}')
+        response.headers.add('Server-Timing',
+                             f'db;dur={values["db_ms"]:.1f};desc="{timing["queries"]} queries, {timing["rows"]} rows"')
+    return response
+
+def init_instrumentation(app):
+    """Register the request hooks; the cursor listeners apply to every engine"""
+    if not app.config.get('INSTRUMENTATION_ENABLED', True):
+        return
+    app.extensions['instrumentation'] = {
+        'window_seconds': app.config.get('INSTRUMENTATION_WINDOW_SECONDS', DEFAULT_WINDOW_SECONDS),
+        'server_timing': app.config.get('SERVER_TIMING_HEADER', True),
+    }
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -0,0 +1,48 @@
+from sqlalchemy.orm import joinedload, load_only
+from models import (Appointments, Patients, Doctors, Pharmacy, Supplies, Laboratory, Radiology,
+                    Patient_MedicineUsage, Patient_Supplies, Patient_Laboratory, Patient_Radiology)
+
+# Eager loading strategies, chosen per endpoint.
+# joinedload for many-to-one (one row each, same SELECT),
+# load_only for dropdowns that only need an id and a name.
+LOAD_STRATEGIES = {
+    # Appointments.as_dict() serializes the patient
+    'appointments.json': lambda: (
+        joinedload(Appointments.patient),
+    ),
+    # appointments.html shows the patient and doctor of every row
+    'appointments.html': lambda: (
+        joinedload(Appointments.patient).load_only(Patients.PatientID, Patients.Name),
+        joinedload(Appointments.doctor).load_only(Doctors.DoctorID, Doctors.Name),
+    ),
+    'appointments.patient_dashboard': lambda: (
+        joinedload(Appointments.doctor).load_only(Doctors.DoctorID, Doctors.Name),
+    ),
+    'patients.dropdown': lambda: (
+        load_only(Patients.PatientID, Patients.Name),
+    ),
+    # Patient chart sections (chart.py): each row shows the name of what it refers to
+    'chart.appointments': lambda: (
+        joinedload(Appointments.doctor).load_only(Doctors.DoctorID, Doctors.Name),
+    ),
+    'chart.medicine_usage': lambda: (
+        joinedload(Patient_MedicineUsage.medicine).load_only(Pharmacy.MedicineID, Pharmacy.MedicineName),
+    ),
+    'chart.patient_supplies': lambda: (
+        joinedload(Patient_Supplies.supply).load_only(Supplies.SupplyID, Supplies.ItemName),
+    ),
+    'chart.patient_laboratory': lambda: (
+        joinedload(Patient_Laboratory.laboratory_test).load_only(Laboratory.TestID, Laboratory.TestName),
+    ),
+    'chart.patient_radiology': lambda: (
+        joinedload(Patient_Radiology.radiology_test).load_only(Radiology.RadiologyID, Radiology.TestName),
+    ),
+}
+
+def load_options(name):
+    """Return the loader options registered for an endpoint"""
+    return LOAD_STRATEGIES[name]()
+
+def with_loading(query, name):
+    """Apply an endpoint's loading strategy to a query"""
+    return query.options(*load_options(name))
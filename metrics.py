@@ -0,0 +1,251 @@
+import glob
+import json
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from flask import current_app, request
+from sqlalchemy.pool import QueuePool
+from extensions import db
+from instrumentation import Histogram, on_request
+from catalog_cache import stats as catalog_stats
+from autocomplete import stats as autocomplete_stats
+from dashboard_stats import stats as dashboard_stats_cache
+
+# Prometheus text exposition for /metrics.
+# Each worker keeps cumulative counters and histograms in memory. With
+# METRICS_DIR set, it also writes them to <METRICS_DIR>/worker-<pid>.json, at
+# most every METRICS_FLUSH_SECONDS, and a scrape served by any worker merges
+# the files of every worker started by the same gunicorn master. Counters of
+# workers that have exited are kept so totals never go backwards; gauges are
+# only reported for workers that are still running.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+DEFAULT_FLUSH_SECONDS = 5
+
+CACHES = {
+    'catalog': catalog_stats,
+    'autocomplete': autocomplete_stats,
+    'dashboard_stats': dashboard_stats_cache,
+}
+
+_lock = threading.Lock()
+_requests = defaultdict(int)  # (blueprint, method, status) -> count
+_latency = {}  # blueprint -> Histogram
+_pool_wait = Histogram(POOL_WAIT_BUCKETS)
+_worker = {}
+_flushed_at = [0.0]
+
+def _start_worker():
+    _requests.clear()
+    _latency.clear()
+    _pool_wait.__init__(POOL_WAIT_BUCKETS)
+    _worker.update(pid=os.getpid(), master_pid=os.getppid(), host=socket.gethostname(),
+                   started=time.time(), server='')
+    _flushed_at[0] = 0.0
+
+_start_worker()
+# With gunicorn --preload the app is imported by the master and then forked
+os.register_at_fork(after_in_child=_start_worker)
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            with _lock:
+                _pool_wait.observe(waited)
+
+@on_request
+def _count_request(blueprint, method, status, values):
+    blueprint = blueprint or 'app'
+    if not _worker['server']:
+        _worker['server'] = request.environ.get('SERVER_SOFTWARE', '')
+    with _lock:
+        _requests[(blueprint, method, str(status))] += 1
+        histogram = _latency.get(blueprint)
+        if histogram is None:
+            histogram = _latency[blueprint] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(values['wall_ms'] / 1000)
+    _flush()
+
+def _pool_gauges():
+    pool = db.engine.pool
+    gauges = {}
+    for name, method in (('size', 'size'), ('checked_out', 'checkedout'),
+                         ('checked_in', 'checkedin'), ('overflow', 'overflow')):
+        # Pools other than QueuePool (e.g. SQLite's) only have some of these
+        if callable(getattr(pool, method, None)):
+            gauges[name] = getattr(pool, method)()
+    return gauges
+
+def _histogram_state(histogram):
+    return {'counts': histogram.counts, 'sum': histogram.sum}
+
+def _snapshot():
+    """This worker's metrics as a JSON-serializable dict"""
+    with _lock:
+        return {
+            'worker': dict(_worker),
+            'requests': [[*labels, count] for labels, count in _requests.items()],
+            'latency': {blueprint: _histogram_state(h) for blueprint, h in _latency.items()},
+            'pool_wait': _histogram_state(_pool_wait),
+            'pool': _pool_gauges(),
+            'caches': {name: dict(stats) for name, stats in CACHES.items()},
+        }
+
+def _flush(force=False):
+    directory = current_app.config.get('METRICS_DIR')
+    if not directory:
+        return
+    every = current_app.config.get('METRICS_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)
+    now = time.monotonic()
+    if not force and now - _flushed_at[0] < every:
+        return
+    _flushed_at[0] = now
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'worker-{os.getpid()}.json')
+    # Written aside and renamed, so a scrape never reads half a file
+    with open(path + '.tmp', 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _worker_snapshots():
+    directory = current_app.config.get('METRICS_DIR')
+    if not directory:
+        return [_snapshot()]
+    _flush(force=True)
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, 'worker-*.json')):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        master_pid = snapshot['worker']['master_pid']
+        if master_pid == _worker['master_pid']:
+            snapshots.append(snapshot)
+        elif not _alive(master_pid):
+            # Left over from a previous server run
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return snapshots
+
+def _labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _histogram_lines(name, bounds, states_by_labels):
+    for labels, states in sorted(states_by_labels.items()):
+        counts = [0] * (len(bounds) + 1)
+        total = 0.0
+        for state in states:
+            counts = [a + b for a, b in zip(counts, state['counts'])]
+            total += state['sum']
+        label_dict = dict(labels)
+        cumulative = 0
+        for bound, count in zip(bounds, counts):
+            cumulative += count
+            yield f'{name}_bucket{_labels(**label_dict, le=bound)} {cumulative}'
+        yield f'{name}_bucket{_labels(**label_dict, le="+Inf")} {sum(counts)}'
+        yield f'{name}_sum{_labels(**label_dict)} {_number(total)}'
+        yield f'{name}_count{_labels(**label_dict)} {sum(counts)}'
+
+def render_metrics():
+    """Every worker's metrics merged, in the Prometheus text format"""
+    snapshots = _worker_snapshots()
+    live = [s for s in snapshots if s['worker']['pid'] == _worker['pid'] or _alive(s['worker']['pid'])]
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    requests = defaultdict(int)
+    for snapshot in snapshots:
+        for blueprint, method, status, count in snapshot['requests']:
+            requests[(blueprint, method, status)] += count
+    family('hms_http_requests_total', 'counter', 'Requests served, by blueprint, method and status.')
+    for (blueprint, method, status), count in sorted(requests.items()):
+        lines.append(f'hms_http_requests_total{_labels(blueprint=blueprint, method=method, status=status)} {count}')
+
+    latency = defaultdict(list)
+    for snapshot in snapshots:
+        for blueprint, state in snapshot['latency'].items():
+            latency[(('blueprint', blueprint),)].append(state)
+    family('hms_http_request_duration_seconds', 'histogram', 'Request wall time, by blueprint.')
+    lines.extend(_histogram_lines('hms_http_request_duration_seconds', LATENCY_BUCKETS, latency))
+
+    family('hms_db_pool_wait_seconds', 'histogram', 'Time spent waiting to check out a pooled connection.')
+    lines.extend(_histogram_lines('hms_db_pool_wait_seconds', POOL_WAIT_BUCKETS,
+                                  {(): [s['pool_wait'] for s in snapshots]}))
+
+    for gauge, help_text in (('size', 'Configured pool size.'),
+                             ('checked_out', 'Connections currently checked out.'),
+                             ('checked_in', 'Idle connections in the pool.'),
+                             ('overflow', 'Connections open beyond the pool size.')):
+        values = [(s['worker']['pid'], s['pool'][gauge]) for s in live if gauge in s['pool']]
+        if values:
+            family(f'hms_db_pool_{gauge}', 'gauge', help_text)
+            for pid, value in sorted(values):
+                lines.append(f'hms_db_pool_{gauge}{_labels(pid=pid)} {value}')
+
+    family('hms_worker_info', 'gauge', 'Running workers; the value is always 1.')
+    for snapshot in sorted(live, key=lambda s: s['worker']['pid']):
+        worker = snapshot['worker']
+        labels = _labels(pid=worker['pid'], master_pid=worker['master_pid'], host=worker['host'],
+                         server=worker['server'])
+        lines.append(f'hms_worker_info{labels} 1')
+    family('hms_worker_start_time_seconds', 'gauge', 'Unix time each running worker started.')
+    for snapshot in sorted(live, key=lambda s: s['worker']['pid']):
+        worker = snapshot['worker']
+        lines.append(f'hms_worker_start_time_seconds{_labels(pid=worker["pid"])} {_number(worker["started"])}')
+
+    caches = defaultdict(lambda: {'hits': 0, 'misses': 0})
+    for snapshot in snapshots:
+        for name, stats in snapshot['caches'].items():
+            caches[name]['hits'] += stats['hits']
+            caches[name]['misses'] += stats['misses']
+    family('hms_cache_hits_total', 'counter', 'Lookups answered from a per-worker cache.')
+    for name, stats in sorted(caches.items()):
+        lines.append(f'hms_cache_hits_total{_labels(cache=name)} {stats["hits"]}')
+    family('hms_cache_misses_total', 'counter', 'Lookups that had to load or rebuild the cache.')
+    for name, stats in sorted(caches.items()):
+        lines.append(f'hms_cache_misses_total{_labels(cache=name)} {stats["misses"]}')
+    family('hms_cache_hit_ratio', 'gauge', 'Hits over all lookups since the workers started.')
+    for name, stats in sorted(caches.items()):
+        lookups = stats['hits'] + stats['misses']
+        lines.append(f'hms_cache_hit_ratio{_labels(cache=name)} {_number(stats["hits"] / lookups if lookups else 0.0)}')
+
+    return '\n'.join(lines) + '\n'
+
+def init_metrics(app):
+    """Time pool checkouts; call before init_extensions creates the engine"""
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if not uri.startswith('sqlite'):
+        options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        options.setdefault('poolclass', TimedQueuePool)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
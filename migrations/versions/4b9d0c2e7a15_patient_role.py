@@ -0,0 +1,35 @@
+"""Patient role for patient portal logins
+
+Revision ID: 4b9d0c2e7a15
+Revises: e31f84a75ea3
+Create Date: 2026-10-17 09:00:00.000000
+
+SQLite stores the role as plain text. PostgreSQL values cannot be removed
+from an enum type, so the downgrade leaves 'Patient' in place.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b9d0c2e7a15'
+down_revision = 'e31f84a75ea3'
+branch_labels = None
+depends_on = None
+
+ROLES = ('Receptionist', 'Nurse', 'Doctor', 'Admin', 'Chemist', 'Radiologist', 'Pharmacist', 'Patient')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # ADD VALUE cannot be used in the transaction that adds it
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE role_enum ADD VALUE IF NOT EXISTS 'Patient'")
+    elif dialect == 'mysql':
+        op.alter_column('Users', 'Role', existing_nullable=False,
+                        type_=sa.Enum(*ROLES, name='role_enum'))
+
+
+def downgrade():
+    pass
@@ -0,0 +1,67 @@
+"""Surrogate key for Patient_MedicineUsage
+
+Revision ID: 9c3e5f1a2b84
+Revises: 4b9d0c2e7a15
+Create Date: 2026-10-17 11:00:00.000000
+
+The primary key was (PatientID, MedicineID, UsageDate), so two dispenses of
+one medicine to one patient within a timestamp tick collided. Existing rows
+are numbered in place; SQLite copies the table, as it cannot change a key.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3e5f1a2b84'
+down_revision = '4b9d0c2e7a15'
+branch_labels = None
+depends_on = None
+
+TABLE = 'Patient_MedicineUsage'
+OLD_KEY = ['PatientID', 'MedicineID', 'UsageDate']
+# (index, columns)
+INDEXES = (
+    ('idx_medicine_usage_patient_date', ['PatientID', 'UsageDate']),
+    ('ix_Patient_MedicineUsage_MedicineID', ['MedicineID']),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'UsageID' not in {c['name'] for c in inspector.get_columns(TABLE)}:
+        dialect = bind.dialect.name
+        if dialect == 'sqlite':
+            with op.batch_alter_table(TABLE, recreate='always') as batch:
+                # Copied rows get a rowid, which an INTEGER PRIMARY KEY aliases
+                batch.add_column(sa.Column('UsageID', sa.Integer()), insert_before='PatientID')
+                batch.create_primary_key(f'pk_{TABLE}', ['UsageID'])
+        elif dialect == 'mysql':
+            op.execute(f'ALTER TABLE `{TABLE}` DROP PRIMARY KEY, '
+                       'ADD COLUMN `UsageID` INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY FIRST')
+        else:
+            name = inspector.get_pk_constraint(TABLE)['name']
+            op.drop_constraint(name, TABLE, type_='primary')
+            op.execute(f'ALTER TABLE "{TABLE}" ADD COLUMN "UsageID" SERIAL PRIMARY KEY')
+        inspector = sa.inspect(bind)
+
+    existing = inspector.get_indexes(TABLE)
+    for name, columns in INDEXES:
+        if any(index['name'] == name or index['column_names'] == columns for index in existing):
+            continue
+        op.create_index(name, TABLE, columns)
+
+
+def downgrade():
+    # Fails if two rows now share the old key
+    bind = op.get_bind()
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name=TABLE)
+    if bind.dialect.name == 'sqlite':
+        with op.batch_alter_table(TABLE, recreate='always') as batch:
+            batch.drop_column('UsageID')
+            batch.create_primary_key(f'pk_{TABLE}', OLD_KEY)
+    else:
+        op.drop_column(TABLE, 'UsageID')
+        op.create_primary_key(f'pk_{TABLE}', TABLE, OLD_KEY)
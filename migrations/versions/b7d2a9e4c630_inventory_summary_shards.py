@@ -0,0 +1,71 @@
+"""Shard InventorySummary and InventoryDailyUsage
+
+Revision ID: b7d2a9e4c630
+Revises: 9c3e5f1a2b84
+Create Date: 2026-10-17 13:00:00.000000
+
+Each commit that changes stock adds to one shard row picked at random
+(stock.py), instead of every commit locking the same row. Existing rows
+become shard 0; the other shards are created on the next rebuild.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2a9e4c630'
+down_revision = '9c3e5f1a2b84'
+branch_labels = None
+depends_on = None
+
+# (table, primary key without Shard)
+TABLES = (
+    ('InventorySummary', ['Inventory']),
+    ('InventoryDailyUsage', ['Inventory', 'UsageDate']),
+)
+
+
+def _set_primary_key(bind, table, columns):
+    if bind.dialect.name == 'sqlite':
+        # SQLite cannot change a key; batch mode copies the table
+        with op.batch_alter_table(table, recreate='always') as batch:
+            batch.create_primary_key(f'pk_{table}', columns)
+    else:
+        name = sa.inspect(bind).get_pk_constraint(table)['name']
+        op.drop_constraint(name, table, type_='primary')
+        op.create_primary_key(f'pk_{table}', table, columns)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table, key in TABLES:
+        if 'Shard' in {c['name'] for c in inspector.get_columns(table)}:
+            continue
+        op.add_column(table, sa.Column('Shard', sa.Integer(), nullable=False, server_default='0'))
+        _set_primary_key(bind, table, key + ['Shard'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    # Fold the shards back into shard 0 first: the summary is rebuilt from
+    # the items tables on the next read, the daily usage is summed
+    op.execute(sa.table('InventorySummary').delete())
+    usage = sa.table('InventoryDailyUsage', sa.column('Inventory'), sa.column('UsageDate'),
+                     sa.column('Shard', sa.Integer()), sa.column('QuantityUsed', sa.Integer()))
+    totals = bind.execute(sa.select(usage.c.Inventory, usage.c.UsageDate, sa.func.sum(usage.c.QuantityUsed))
+                          .group_by(usage.c.Inventory, usage.c.UsageDate)).all()
+    op.execute(usage.delete())
+    if totals:
+        op.bulk_insert(usage, [{'Inventory': inventory, 'UsageDate': day, 'Shard': 0, 'QuantityUsed': int(used)}
+                               for inventory, day, used in totals])
+    for table, key in TABLES:
+        if bind.dialect.name == 'sqlite':
+            with op.batch_alter_table(table, recreate='always') as batch:
+                batch.drop_column('Shard')
+                batch.create_primary_key(f'pk_{table}', key)
+        else:
+            name = sa.inspect(bind).get_pk_constraint(table)['name']
+            op.drop_constraint(name, table, type_='primary')
+            op.drop_column(table, 'Shard')
+            op.create_primary_key(f'pk_{table}', table, key)
@@ -0,0 +1,60 @@
+"""Shard DashboardCounters
+
+Revision ID: c4e8a1f27d93
+Revises: b7d2a9e4c630
+Create Date: 2026-10-17 15:00:00.000000
+
+Each commit that changes a count adds to one shard row picked at random
+(dashboard_stats.py), instead of every commit locking the same
+'patients.total' row. Existing rows become shard 0.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1f27d93'
+down_revision = 'b7d2a9e4c630'
+branch_labels = None
+depends_on = None
+
+TABLE = 'DashboardCounters'
+
+
+def _set_primary_key(bind, columns):
+    if bind.dialect.name == 'sqlite':
+        # SQLite cannot change a key; batch mode copies the table
+        with op.batch_alter_table(TABLE, recreate='always') as batch:
+            batch.create_primary_key(f'pk_{TABLE}', columns)
+    else:
+        name = sa.inspect(bind).get_pk_constraint(TABLE)['name']
+        op.drop_constraint(name, TABLE, type_='primary')
+        op.create_primary_key(f'pk_{TABLE}', TABLE, columns)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if 'Shard' in {c['name'] for c in sa.inspect(bind).get_columns(TABLE)}:
+        return
+    op.add_column(TABLE, sa.Column('Shard', sa.Integer(), nullable=False, server_default='0'))
+    _set_primary_key(bind, ['Name', 'Shard'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    # Fold the shards back into one row per counter
+    counters = sa.table(TABLE, sa.column('Name'), sa.column('Shard', sa.Integer()), sa.column('Value', sa.Integer()))
+    totals = bind.execute(sa.select(counters.c.Name, sa.func.sum(counters.c.Value))
+                          .group_by(counters.c.Name)).all()
+    op.execute(counters.delete())
+    if totals:
+        op.bulk_insert(counters, [{'Name': name, 'Shard': 0, 'Value': int(value)} for name, value in totals])
+    if bind.dialect.name == 'sqlite':
+        with op.batch_alter_table(TABLE, recreate='always') as batch:
+            batch.drop_column('Shard')
+            batch.create_primary_key(f'pk_{TABLE}', ['Name'])
+    else:
+        name = sa.inspect(bind).get_pk_constraint(TABLE)['name']
+        op.drop_constraint(name, TABLE, type_='primary')
+        op.drop_column(TABLE, 'Shard')
+        op.create_primary_key(f'pk_{TABLE}', TABLE, ['Name'])
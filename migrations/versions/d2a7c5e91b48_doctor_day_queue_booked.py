@@ -0,0 +1,42 @@
+"""Count live queue numbers in DoctorDayQueues
+
+Revision ID: d2a7c5e91b48
+Revises: c4e8a1f27d93
+Create Date: 2026-10-17 16:00:00.000000
+
+Booked is the number of appointments holding a number in the doctor's day
+(queue_allocator.py). Releasing a number lowers it, so Capacity no longer
+has to go up and numbers stay within 1..Capacity.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c5e91b48'
+down_revision = 'c4e8a1f27d93'
+branch_labels = None
+depends_on = None
+
+TABLE = 'DoctorDayQueues'
+
+
+def upgrade():
+    bind = op.get_bind()
+    if 'Booked' in {c['name'] for c in sa.inspect(bind).get_columns(TABLE)}:
+        return
+    op.add_column(TABLE, sa.Column('Booked', sa.Integer(), nullable=False, server_default='0'))
+    queues = sa.table(TABLE, sa.column('DoctorID'), sa.column('QueueDate'), sa.column('Booked', sa.Integer()))
+    appointments = sa.table('Appointments', sa.column('DoctorID'), sa.column('AppointmentDate'),
+                            sa.column('QueueNumber'))
+    booked = (sa.select(sa.func.count())
+              .where(appointments.c.DoctorID == queues.c.DoctorID,
+                     sa.func.date(appointments.c.AppointmentDate) == queues.c.QueueDate,
+                     appointments.c.QueueNumber.isnot(None))
+              .scalar_subquery())
+    op.execute(queues.update().values(Booked=booked))
+
+
+def downgrade():
+    with op.batch_alter_table(TABLE) as batch:
+        batch.drop_column('Booked')
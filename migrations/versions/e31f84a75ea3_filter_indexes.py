@@ -0,0 +1,65 @@
+"""Indexes on filtered columns, and columns added to existing tables
+
+Revision ID: e31f84a75ea3
+Revises:
+Create Date: 2026-10-17 07:00:00.000000
+
+db.create_all() at startup creates missing tables but never alters an
+existing one, so a database created by an older models.py or by schema.sql
+lacks the columns and indexes added since. Each step is skipped when the
+column or an index on the same columns already exists, so this is also safe
+on a database built from the current models.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e31f84a75ea3'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# (table, column, referenced table, referenced column)
+COLUMNS = (
+    ('Patients', 'Doctor', 'Doctors', 'DoctorID'),
+    ('Users', 'PatientID', 'Patients', 'PatientID'),
+)
+# (table, index, columns); the last five are new in this revision
+INDEXES = (
+    ('Patients', 'ix_Patients_Doctor', ['Doctor']),
+    ('Users', 'ix_Users_PatientID', ['PatientID']),
+    ('Appointments', 'idx_appointments_doctor_date', ['DoctorID', 'AppointmentDate']),
+    ('Appointments', 'idx_appointments_patient_date', ['PatientID', 'AppointmentDate']),
+    ('Users', 'idx_users_email', ['Email']),
+    ('Patients', 'idx_patients_email', ['Email']),
+    ('Patients', 'idx_patients_admission', ['Date_admission']),
+    ('Patients', 'idx_patients_discharge', ['Date_discharge']),
+    ('Appointments', 'idx_appointments_date', ['AppointmentDate']),
+)
+NEW_INDEXES = INDEXES[-5:]
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table, column, target, target_column in COLUMNS:
+        if column in {c['name'] for c in inspector.get_columns(table)}:
+            continue
+        op.add_column(table, sa.Column(column, sa.Integer()))
+        # SQLite cannot add a constraint to an existing table
+        if bind.dialect.name != 'sqlite':
+            op.create_foreign_key(f'fk_{table}_{column}'.lower(), table, target, [column], [target_column])
+
+    for table, name, columns in INDEXES:
+        existing = inspector.get_indexes(table)
+        if any(index['name'] == name or index['column_names'] == columns for index in existing):
+            continue
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table, name, _ in NEW_INDEXES:
+        if name in {index['name'] for index in inspector.get_indexes(table)}:
+            op.drop_index(name, table_name=table)
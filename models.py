@@ -2,7 +2,7 @@ from extensions import db
 from datetime import datetime
 from enum import Enum
 from sqlalchemy import DECIMAL, Text, Enum as SQLEnum
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password
 # Enum Classes
 class Gender(Enum):
     Male = 'Male'
@@ -17,6 +17,8 @@ class UserRole(Enum):
     Chemist = 'Chemist'
     Radiologist = 'Radiologist'
     Pharmacist = 'Pharmacist'
+    # Patient portal logins (see patient_portal.py)
+    Patient = 'Patient'
 
 # Models
 class Departments(db.Model):
@@ -127,12 +129,24 @@ class Users(db.Model):
     Phone = db.Column(db.String(20))
     Email = db.Column(db.String(100))
     PasswordHash = db.Column(db.String(255))
+    # Patient record of a Patient-role login (see patient_portal.py)
+    PatientID = db.Column(db.Integer, db.ForeignKey('Patients.PatientID'), index=True)
+    # Every login looks the user up by email
+    __table_args__ = (
+        db.Index('idx_users_email', 'Email'),
+    )
 
     def set_password(self, password):
-        self.PasswordHash = generate_password_hash(password)
+        self.PasswordHash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.PasswordHash, password)
+        return verify_password(self.PasswordHash, password)
+
+class RevokedTokens(db.Model):
+    __tablename__ = 'RevokedTokens'
+    # JWT ids revoked before they expire (see auth_tokens.py)
+    JTI = db.Column(db.String(32), primary_key=True)
+    ExpiresAt = db.Column(db.DateTime, nullable=False, index=True)
 
 class Appointments(db.Model):
     __tablename__ = 'Appointments'
@@ -144,6 +158,14 @@ class Appointments(db.Model):
     AvailableSlots = db.Column(db.Integer)
     patient = db.relationship('Patients', back_populates='appointments')
     doctor = db.relationship('Doctors', back_populates='appointments')
+    # Per-doctor day lookups (queue numbers, availability)
+    __table_args__ = (
+        db.Index('idx_appointments_doctor_date', 'DoctorID', 'AppointmentDate'),
+        # Patient dashboard: a patient's recent and upcoming appointments
+        db.Index('idx_appointments_patient_date', 'PatientID', 'AppointmentDate'),
+        # Dashboard counters and availability: every appointment of a day
+        db.Index('idx_appointments_date', 'AppointmentDate'),
+    )
     def as_dict(self):
         return {
             'AppointmentID': self.AppointmentID,
@@ -156,6 +178,16 @@ class Appointments(db.Model):
             
         }
 
+class DoctorDayQueues(db.Model):
+    __tablename__ = 'DoctorDayQueues'
+    # Per-doctor, per-day queue counter (see queue_allocator.py)
+    # Booked counts live numbers; numbers above LastQueueNumber have never been handed out
+    DoctorID = db.Column(db.Integer, db.ForeignKey('Doctors.DoctorID'), primary_key=True)
+    QueueDate = db.Column(db.Date, primary_key=True)
+    LastQueueNumber = db.Column(db.Integer, nullable=False, default=0)
+    Booked = db.Column(db.Integer, nullable=False, default=0)
+    Capacity = db.Column(db.Integer, nullable=False)
+
 class Patients(db.Model):
     __tablename__ = 'Patients'
     PatientID = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -171,14 +203,24 @@ class Patients(db.Model):
     MedicalNotes = db.Column(db.Text)
     Report = db.Column(db.Text)
     Diagnose = db.Column(db.String(200))
+    Doctor = db.Column(db.Integer, db.ForeignKey('Doctors.DoctorID'), index=True)
     DoctorOrders = db.Column(db.Text)
     Date_admission = db.Column(db.DateTime)
     Date_discharge = db.Column(db.DateTime)
     appointments = db.relationship('Appointments', back_populates='patient')
+    # Normalized copy of DoctorOrders, kept in sync by orders.sync_patient_orders
+    orders = db.relationship('Patient_Orders', back_populates='patient', cascade='all, delete-orphan')
     medicine_usage = db.relationship('Patient_MedicineUsage', back_populates='patient')
     patient_supplies = db.relationship('Patient_Supplies', back_populates='patient')
     patient_laboratory = db.relationship('Patient_Laboratory', back_populates='patient')
     patient_radiology = db.relationship('Patient_Radiology', back_populates='patient')
+    __table_args__ = (
+        # Patient portal linking and the API's Email filter
+        db.Index('idx_patients_email', 'Email'),
+        # Dashboard admission/discharge counts and the admitted_from/to filters
+        db.Index('idx_patients_admission', 'Date_admission'),
+        db.Index('idx_patients_discharge', 'Date_discharge'),
+    )
 
     def as_dict(self):
         return {
@@ -200,6 +242,23 @@ class Patients(db.Model):
             'Date_discharge': self.Date_discharge.isoformat() if self.Date_discharge else None
     }
 
+class CatalogVersions(db.Model):
+    __tablename__ = 'CatalogVersions'
+    # One row per cached reference catalog, bumped on every write (see catalog_cache.py)
+    Name = db.Column(db.String(50), primary_key=True)
+    Version = db.Column(db.Integer, nullable=False, default=0)
+
+class Patient_Orders(db.Model):
+    __tablename__ = 'Patient_Orders'
+    PatientID = db.Column(db.Integer, db.ForeignKey('Patients.PatientID'), primary_key=True)
+    ItemType = db.Column(db.String(20), primary_key=True)  # 'medicine', 'labTest', 'radiologyTest' or 'supply'
+    ItemID = db.Column(db.Integer, primary_key=True)
+    patient = db.relationship('Patients', back_populates='orders')
+    # "Which patients have this item ordered" lookups go through this index
+    __table_args__ = (
+        db.Index('idx_patient_orders_item', 'ItemType', 'ItemID', 'PatientID'),
+    )
+
 class Patient_Radiology(db.Model):
     __tablename__ = 'Patient_Radiology'
     PatientID = db.Column(db.Integer, db.ForeignKey('Patients.PatientID'), primary_key=True)
@@ -216,15 +275,31 @@ class Patient_Laboratory(db.Model):
 
 class Patient_MedicineUsage(db.Model):
     __tablename__ = 'Patient_MedicineUsage'
-    PatientID = db.Column(db.Integer, db.ForeignKey('Patients.PatientID'), primary_key=True)
-    MedicineID = db.Column(db.Integer, db.ForeignKey('Pharmacy.MedicineID'), primary_key=True)
-    UsageDate = db.Column(db.DateTime, primary_key=True, default=datetime.utcnow)
+    # One row per dispense; two dispenses may share a UsageDate
+    UsageID = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    PatientID = db.Column(db.Integer, db.ForeignKey('Patients.PatientID'), nullable=False)
+    MedicineID = db.Column(db.Integer, db.ForeignKey('Pharmacy.MedicineID'), nullable=False, index=True)
+    UsageDate = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     QuantityUsed = db.Column(db.Integer, nullable=False, default=1)
     DoctorID = db.Column(db.Integer, db.ForeignKey('Doctors.DoctorID'))
     Notes = db.Column(db.Text)
     patient = db.relationship('Patients', back_populates='medicine_usage')
     medicine = db.relationship('Pharmacy', back_populates='usage_records')
     doctor = db.relationship('Doctors', backref='medicine_prescriptions')
+    __table_args__ = (
+        # A patient's chart lists its usage newest first
+        db.Index('idx_medicine_usage_patient_date', 'PatientID', 'UsageDate'),
+    )
+
+    def as_dict(self):
+        return {
+            'PatientID': self.PatientID,
+            'MedicineID': self.MedicineID,
+            'UsageDate': self.UsageDate.isoformat() if self.UsageDate else None,
+            'QuantityUsed': self.QuantityUsed,
+            'DoctorID': self.DoctorID,
+            'Notes': self.Notes
+        }
 
 class Patient_Supplies(db.Model):
     __tablename__ = 'Patient_Supplies'
@@ -235,4 +310,84 @@ class Patient_Supplies(db.Model):
     DateUsed = db.Column(db.DateTime, default=datetime.utcnow)
     patient = db.relationship('Patients', back_populates='patient_supplies')
     supply = db.relationship('Supplies', back_populates='usage_records')
-    doctor = db.relationship('Doctors')
\ No newline at end of file
+    doctor = db.relationship('Doctors')
+
+    def as_dict(self):
+        return {
+            'PatientID': self.PatientID,
+            'SupplyID': self.SupplyID,
+            'QuantityUsed': self.QuantityUsed,
+            'DoctorID': self.DoctorID,
+            'DateUsed': self.DateUsed.isoformat() if self.DateUsed else None
+        }
+
+class SupplyUsage(db.Model):
+    __tablename__ = 'SupplyUsage'
+    # Append-only ledger; Patient_Supplies and SupplyUsageTotals hold the running totals
+    UsageID = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    PatientID = db.Column(db.Integer, db.ForeignKey('Patients.PatientID'), index=True)
+    SupplyID = db.Column(db.Integer, db.ForeignKey('Supplies.SupplyID'), index=True)
+    QuantityUsed = db.Column(db.Integer, nullable=False)
+    DoctorID = db.Column(db.Integer, db.ForeignKey('Doctors.DoctorID'))
+    DateUsed = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def as_dict(self):
+        return {
+            'UsageID': self.UsageID,
+            'PatientID': self.PatientID,
+            'SupplyID': self.SupplyID,
+            'QuantityUsed': self.QuantityUsed,
+            'DoctorID': self.DoctorID,
+            'DateUsed': self.DateUsed.isoformat() if self.DateUsed else None
+        }
+
+class SupplyUsageTotals(db.Model):
+    __tablename__ = 'SupplyUsageTotals'
+    SupplyID = db.Column(db.Integer, db.ForeignKey('Supplies.SupplyID'), primary_key=True)
+    QuantityUsed = db.Column(db.Integer, nullable=False, default=0)
+    PatientCount = db.Column(db.Integer, nullable=False, default=0)
+    LastUsed = db.Column(db.DateTime)
+
+    def as_dict(self):
+        return {
+            'SupplyID': self.SupplyID,
+            'QuantityUsed': self.QuantityUsed,
+            'PatientCount': self.PatientCount,
+            'LastUsed': self.LastUsed.isoformat() if self.LastUsed else None
+        }
+
+class InventorySummary(db.Model):
+    __tablename__ = 'InventorySummary'
+    # Shards of one inventory's totals ('pharmacy', 'supplies'), kept current
+    # by stock.py; the summary is their sum
+    Inventory = db.Column(db.String(20), primary_key=True)
+    Shard = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    ItemCount = db.Column(db.Integer, nullable=False, default=0)
+    TotalQuantity = db.Column(db.Integer, nullable=False, default=0)
+    TotalValue = db.Column(db.Float, nullable=False, default=0)
+    LowStockCount = db.Column(db.Integer, nullable=False, default=0)
+    LowStockThreshold = db.Column(db.Integer, nullable=False)
+    UpdatedAt = db.Column(db.DateTime)
+
+class InventoryDailyUsage(db.Model):
+    __tablename__ = 'InventoryDailyUsage'
+    Inventory = db.Column(db.String(20), primary_key=True)
+    UsageDate = db.Column(db.Date, primary_key=True)
+    Shard = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    QuantityUsed = db.Column(db.Integer, nullable=False, default=0)
+
+class PatientChanges(db.Model):
+    __tablename__ = 'PatientChanges'
+    # Change feed for the in-process patient search index (patient_search.py)
+    Seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    PatientID = db.Column(db.Integer, nullable=False)
+    ChangedAt = db.Column(db.DateTime, nullable=False, index=True)
+
+class DashboardCounters(db.Model):
+    __tablename__ = 'DashboardCounters'
+    # Shards of the running counts for the role dashboards (see
+    # dashboard_stats.py), e.g. 'patients.in_house' or
+    # 'appointments:2024-05-01:doctor:3'; a count is the sum of its shards
+    Name = db.Column(db.String(80), primary_key=True)
+    Shard = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    Value = db.Column(db.Integer, nullable=False, default=0)
\ No newline at end of file
@@ -0,0 +1,106 @@
+import json
+from sqlalchemy.orm import selectinload
+from extensions import db
+from models import Patients, Doctors, Patient_Orders
+
+# DoctorOrders JSON keys -> Patient_Orders.ItemType
+# ('medications' is the key the old views looked for, 'medicines' is what the form posts)
+ORDER_KEYS = {
+    'medicines': 'medicine',
+    'medications': 'medicine',
+    'labTests': 'labTest',
+    'radiologyTests': 'radiologyTest',
+    'supplies': 'supply',
+}
+
+def parse_order_items(doctor_orders):
+    """Return the set of (ItemType, ItemID) pairs found in a DoctorOrders dict or JSON string"""
+    if not doctor_orders:
+        return set()
+    if isinstance(doctor_orders, str):
+        try:
+            doctor_orders = json.loads(doctor_orders)
+        except json.JSONDecodeError:
+            return set()
+    if not isinstance(doctor_orders, dict):
+        return set()
+
+    items = set()
+    for key, item_type in ORDER_KEYS.items():
+        entries = doctor_orders.get(key)
+        if not isinstance(entries, list):
+            # Missing, or not a list of items ({"medicines": 5})
+            continue
+        for entry in entries:
+            item_id = entry.get('id') if isinstance(entry, dict) else entry
+            try:
+                items.add((item_type, int(item_id)))
+            except (TypeError, ValueError):
+                # Skip entries without a usable id
+                continue
+    return items
+
+def sync_patient_orders(patient, doctor_orders):
+    """Replace the patient's Patient_Orders rows with the items in doctor_orders"""
+    wanted = parse_order_items(doctor_orders)
+    existing = {(o.ItemType, o.ItemID): o for o in patient.orders}
+
+    # Only touch rows that actually changed
+    for key, order in existing.items():
+        if key not in wanted:
+            patient.orders.remove(order)
+    for item_type, item_id in wanted - set(existing):
+        patient.orders.append(Patient_Orders(ItemType=item_type, ItemID=item_id))
+
+def patients_with_order(item_type, item_id):
+    """Patients that have the given item in their doctor orders, with their doctor's name"""
+    return (
+        db.session.query(
+            Patients.PatientID,
+            Patients.Name,
+            Patients.Gender,
+            Patients.Age,
+            Patients.Date_admission,
+            Doctors.Name.label('DoctorName'),
+        )
+        .join(Patient_Orders, Patient_Orders.PatientID == Patients.PatientID)
+        .outerjoin(Doctors, Doctors.DoctorID == Patients.Doctor)
+        .filter(Patient_Orders.ItemType == item_type, Patient_Orders.ItemID == item_id)
+        .order_by(Patients.PatientID)
+        .all()
+    )
+
+def order_rows_as_dicts(rows, date_key):
+    """Format patients_with_order rows the way the *_patients.html templates expect"""
+    result = []
+    for row in rows:
+        # Order date uses the admission date as an approximation
+        result.append({
+            'PatientID': row.PatientID,
+            'Name': row.Name,
+            'Gender': row.Gender,
+            'Age': row.Age,
+            'DoctorName': row.DoctorName or "N/A",
+            date_key: row.Date_admission.strftime('%Y-%m-%d %H:%M') if row.Date_admission else "N/A",
+        })
+    return result
+
+def rebuild_patient_orders(batch_size=1000):
+    """Backfill Patient_Orders from every patient's DoctorOrders blob"""
+    count = 0
+    last_id = 0
+    while True:
+        patients = (Patients.query
+                    .options(selectinload(Patients.orders))
+                    .filter(Patients.PatientID > last_id)
+                    .order_by(Patients.PatientID)
+                    .limit(batch_size)
+                    .all())
+        if not patients:
+            break
+        for patient in patients:
+            sync_patient_orders(patient, patient.DoctorOrders)
+        db.session.commit()
+        count += len(patients)
+        last_id = patients[-1].PatientID
+    return count
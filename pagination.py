@@ -0,0 +1,89 @@
+import base64
+import json
+from datetime import datetime
+from flask import request, jsonify
+from sqlalchemy import Select
+from extensions import db
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+def encode_cursor(last_key):
+    """Opaque cursor for the row after last_key"""
+    raw = json.dumps({'after': last_key}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))['after']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def _coerce(name, column, value):
+    # Query string values are strings, cursor values decoded JSON; convert
+    # to the column's Python type
+    python_type = column.type.python_type
+    if isinstance(value, python_type) and not isinstance(value, bool):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f'Invalid value for {name}: {value}')
+    try:
+        if python_type is datetime:
+            return datetime.fromisoformat(value)
+        return python_type(value)
+    except ValueError:
+        raise ValueError(f'Invalid value for {name}: {value}')
+
+def keyset_page(query, key, filters=None, ranges=None):
+    """Apply ?limit=&cursor= keyset pagination and filters from the request.
+
+    query is an ORM query or a Core select(). key is the (unique, indexed)
+    column the pages are ordered by. filters maps query parameters to columns
+    compared with ==, ranges maps them to (column, '>=' or '<') pairs.
+    Returns (rows, next_cursor) and raises ValueError on bad parameters.
+    """
+    args = request.args
+
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    for name, column in (filters or {}).items():
+        if name in args:
+            query = query.filter(column == _coerce(name, column, args[name]))
+    for name, (column, op) in (ranges or {}).items():
+        if name in args:
+            value = _coerce(name, column, args[name])
+            query = query.filter(column >= value if op == '>=' else column < value)
+
+    # Seek past the last key instead of OFFSET, so every page costs the same
+    cursor = args.get('cursor')
+    if cursor:
+        query = query.filter(key > _coerce('cursor', key, decode_cursor(cursor)))
+
+    # Fetch one extra row to know whether there is a next page
+    page = query.order_by(key).limit(limit + 1)
+    # A Core select() (projections.py) runs on the session and returns plain rows
+    rows = db.session.execute(page).all() if isinstance(page, Select) else page.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], key.key))
+    return rows, next_cursor
+
+def keyset_json(query, key, filters=None, ranges=None, serialize=None):
+    """JSON response for one page: {'items': [...], 'next_cursor': ...}
+
+    Rows are serialized with serialize(row), by default row.as_dict().
+    """
+    try:
+        rows, next_cursor = keyset_page(query, key, filters, ranges)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return jsonify({
+        'items': [serialize(row) for row in rows] if serialize else [row.as_dict() for row in rows],
+        'next_cursor': next_cursor
+    })
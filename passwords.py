@@ -0,0 +1,89 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# KDF used for new hashes; stored hashes with a different method are
+# upgraded on the next successful login (see needs_rehash)
+DEFAULT_METHOD = 'pbkdf2:sha256:260000'
+DEFAULT_SALT_LENGTH = 16
+# Hashes run in a per-worker process pool of PASSWORD_HASH_WORKERS processes.
+# A job that would make more than PASSWORD_HASH_MAX_QUEUE queued or running
+# is refused at submit with PasswordHasherBusy.
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_QUEUE = 32
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hash/verify jobs are already queued"""
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_slots = None
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+def _get_pool():
+    # Created lazily, and again after a fork, so each gunicorn worker owns its pool
+    global _pool, _pool_pid, _slots
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=_config('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS))
+            _pool_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(_config('PASSWORD_HASH_MAX_QUEUE', DEFAULT_MAX_QUEUE))
+        return _pool, _slots
+
+def _run(fn, *args):
+    if _config('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS) == 0:
+        # Inline mode for development and tests
+        return fn(*args)
+
+    pool, slots = _get_pool()
+    # The slot is held until the job finishes, even if the caller stops waiting
+    if not slots.acquire(blocking=False):
+        raise PasswordHasherBusy('Too many logins in progress, please try again')
+    try:
+        future = pool.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
+
+def hash_password(password):
+    """Hash a password with the configured KDF in the worker pool"""
+    return _run(
+        generate_password_hash,
+        password,
+        _config('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        _config('PASSWORD_SALT_LENGTH', DEFAULT_SALT_LENGTH)
+    )
+
+def verify_password(password_hash, password):
+    """Check a password against a stored hash in the worker pool"""
+    if not password_hash:
+        return False
+    return _run(check_password_hash, password_hash, password)
+
+def needs_rehash(password_hash):
+    """True if the stored hash was made with a different KDF or salt length"""
+    # werkzeug hashes are "method$salt$hash"
+    parts = password_hash.split('$') if password_hash else []
+    if len(parts) != 3:
+        return True
+    method, salt, _ = parts
+    return (method != _config('PASSWORD_HASH_METHOD', DEFAULT_METHOD) or
+            len(salt) != _config('PASSWORD_SALT_LENGTH', DEFAULT_SALT_LENGTH))
+
+def verify_and_upgrade(user, password):
+    """Verify a login and rehash the password if the KDF parameters changed.
+
+    The caller commits; returns False for a wrong password.
+    """
+    if not verify_password(user.PasswordHash, password):
+        return False
+    if needs_rehash(user.PasswordHash):
+        user.PasswordHash = hash_password(password)
+    return True
@@ -0,0 +1,166 @@
+import csv
+import json
+from datetime import datetime
+from extensions import db
+from models import Patients, Doctors, Patient_Orders
+from orders import parse_order_items
+from patient_search import record_imported_patients
+from dashboard_stats import count_imported_patients
+
+IMPORT_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+
+INT_FIELDS = ('Age', 'Doctor')
+FLOAT_FIELDS = ('Weight', 'Height')
+DATE_FIELDS = ('Date_admission', 'Date_discharge')
+TEXT_FIELDS = ('Name', 'NationalID', 'Gender', 'Address', 'Phone', 'Email',
+               'MedicalNotes', 'Report', 'Diagnose')
+MAX_LENGTHS = {field: Patients.__table__.c[field].type.length for field in TEXT_FIELDS
+               if getattr(Patients.__table__.c[field].type, 'length', None)}
+
+def iter_records(lines, fmt):
+    """Yield (line_number, record dict) from CSV or NDJSON text lines"""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, ValueError(f'Invalid JSON: {e.msg}')
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+def validate_record(record, doctor_ids=None):
+    """Return (patient row, order items) or raise ValueError
+
+    doctor_ids, when given, is the set of existing DoctorIDs.
+    """
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError('Expected an object')
+
+    row = {}
+    for field in TEXT_FIELDS:
+        value = record.get(field)
+        row[field] = str(value).strip() if value not in (None, '') else None
+    if not row['Name']:
+        raise ValueError('Name is required')
+    if not row['NationalID']:
+        raise ValueError('NationalID is required')
+    for field, length in MAX_LENGTHS.items():
+        if row[field] and len(row[field]) > length:
+            raise ValueError(f'{field} is longer than {length} characters')
+
+    for field, convert in [(f, int) for f in INT_FIELDS] + [(f, float) for f in FLOAT_FIELDS]:
+        value = record.get(field)
+        try:
+            row[field] = convert(value) if value not in (None, '') else None
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be a number')
+    if row['Doctor'] is not None and doctor_ids is not None and row['Doctor'] not in doctor_ids:
+        raise ValueError(f'Doctor {row["Doctor"]} does not exist')
+    for field in DATE_FIELDS:
+        value = record.get(field)
+        try:
+            row[field] = datetime.fromisoformat(value) if value else None
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be an ISO date')
+
+    doctor_orders = record.get('DoctorOrders')
+    if isinstance(doctor_orders, str) and doctor_orders:
+        try:
+            doctor_orders = json.loads(doctor_orders)
+        except json.JSONDecodeError:
+            raise ValueError('DoctorOrders is not valid JSON')
+    row['DoctorOrders'] = json.dumps(doctor_orders) if doctor_orders else None
+    return row, parse_order_items(doctor_orders)
+
+def _flush_batch(batch):
+    """Insert a batch of (row, items) and return how many were new"""
+    national_ids = [row['NationalID'] for row, _ in batch]
+    existing = {nid for (nid,) in db.session.query(Patients.NationalID)
+                .filter(Patients.NationalID.in_(national_ids))}
+    new = [(row, items) for row, items in batch if row['NationalID'] not in existing]
+    if not new:
+        return 0, len(batch)
+
+    db.session.execute(Patients.__table__.insert(), [row for row, _ in new])
+    record_imported_patients([row['NationalID'] for row, _ in new])
+    count_imported_patients([row for row, _ in new])
+
+    # Map NationalID back to the generated ids to attach the orders
+    with_orders = {row['NationalID']: items for row, items in new if items}
+    if with_orders:
+        ids = dict(db.session.query(Patients.NationalID, Patients.PatientID)
+                   .filter(Patients.NationalID.in_(list(with_orders))))
+        order_rows = [
+            {'PatientID': ids[nid], 'ItemType': item_type, 'ItemID': item_id}
+            for nid, items in with_orders.items()
+            for item_type, item_id in items
+        ]
+        db.session.execute(Patient_Orders.__table__.insert(), order_rows)
+
+    db.session.commit()
+    return len(new), len(batch) - len(new)
+
+def import_patients(lines, fmt, batch_size=IMPORT_BATCH_SIZE):
+    """Stream-validate and bulk insert patients, one transaction per batch.
+
+    Rows whose NationalID already exists (in the database or earlier in the
+    file) are skipped. A batch that fails is retried row by row, so only
+    the rows at fault are lost. Returns a report with per-row errors.
+    """
+    report = {'inserted': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+    doctor_ids = {doctor_id for (doctor_id,) in db.session.query(Doctors.DoctorID)}
+    seen = set()
+    batch = []
+
+    def error(line_number, message):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line_number, 'error': message})
+
+    def insert(rows):
+        inserted, skipped = _flush_batch([(row, items) for _, row, items in rows])
+        report['inserted'] += inserted
+        report['skipped'] += skipped
+
+    def flush(batch):
+        try:
+            insert(batch)
+            return
+        except Exception:
+            # e.g. a concurrent insert of the same NationalID; the whole batch is rolled back
+            db.session.rollback()
+        for entry in batch:
+            try:
+                insert([entry])
+            except Exception as e:
+                db.session.rollback()
+                error(entry[0], str(getattr(e, 'orig', e)))
+
+    for line_number, record in iter_records(lines, fmt):
+        try:
+            row, items = validate_record(record, doctor_ids)
+        except ValueError as e:
+            error(line_number, str(e))
+            continue
+        if row['NationalID'] in seen:
+            report['skipped'] += 1
+            continue
+        seen.add(row['NationalID'])
+        batch.append((line_number, row, items))
+
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+
+    if batch:
+        flush(batch)
+    return report
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case
+from extensions import db
+from loading import with_loading
+from models import Users, Patients, Appointments
+
+# Patient dashboard lookups. Users.PatientID links a login to its patient
+# record; accounts created before the link existed are matched by email
+# once and then linked. Appointments are read through
+# idx_appointments_patient_date and bucketed by the database; upcoming and
+# recent ones are capped separately, so a long history cannot crowd out
+# what is still to come.
+DEFAULT_RECENT_DAYS = 30
+MAX_UPCOMING = 50
+MAX_RECENT = 20
+
+def link_patient(user):
+    """PatientID for a Users row, linking it by email the first time"""
+    if user.PatientID is None and user.Email:
+        patient_id = (db.session.query(Patients.PatientID)
+                      .filter(Patients.Email == user.Email)
+                      .order_by(Patients.PatientID)
+                      .limit(1)
+                      .scalar())
+        if patient_id is not None:
+            user.PatientID = patient_id
+            db.session.commit()
+    return user.PatientID
+
+def patient_id_for(current_user):
+    """PatientID of a Users row or TokenUser, without a query once linked"""
+    patient_id = getattr(current_user, 'PatientID', None)
+    if patient_id is not None:
+        return patient_id
+    user = current_user if isinstance(current_user, Users) else db.session.get(Users, current_user.UserID)
+    return link_patient(user) if user else None
+
+def appointment_status(now):
+    """Same buckets as the dashboard used to compute per row in Python"""
+    return case(
+        (Appointments.AppointmentDate <= now, 'Completed'),
+        (Appointments.AppointmentDate >= now + timedelta(days=1), 'Upcoming'),
+        (Appointments.AppointmentDate >= now + timedelta(hours=1), 'Soon'),
+        else_='Imminent')
+
+def dashboard_appointments(patient_id, now):
+    """Recent and upcoming (appointment, status) pairs, oldest first"""
+    recent_days = current_app.config.get('PATIENT_DASHBOARD_RECENT_DAYS', DEFAULT_RECENT_DAYS)
+    query = with_loading(db.session.query(Appointments, appointment_status(now).label('Status')),
+                         'appointments.patient_dashboard').filter(Appointments.PatientID == patient_id)
+    # Latest past visits first, so the limit keeps the most recent ones
+    recent = (query.filter(Appointments.AppointmentDate >= now - timedelta(days=recent_days),
+                           Appointments.AppointmentDate <= now)
+              .order_by(Appointments.AppointmentDate.desc())
+              .limit(MAX_RECENT)
+              .all())
+    upcoming = (query.filter(Appointments.AppointmentDate > now)
+                .order_by(Appointments.AppointmentDate)
+                .limit(MAX_UPCOMING)
+                .all())
+    return recent[::-1] + upcoming
+
+def time_remaining(when, now):
+    if when is None:
+        return "Unknown"
+    if when <= now:
+        return "Passed"
+    time_diff = when - now
+    days = time_diff.days
+    hours, remainder = divmod(time_diff.seconds, 3600)
+    minutes = remainder // 60
+    if days > 0:
+        return f"{days} days, {hours} hours"
+    if hours > 0:
+        return f"{hours} hours, {minutes} minutes"
+    return f"{minutes} minutes"
@@ -0,0 +1,383 @@
+import heapq
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, func, inspect, literal, or_, select, text
+from sqlalchemy.orm import Session, object_session
+from extensions import db
+from models import Patients, PatientChanges
+
+# Patient search over Name, NationalID, Phone and Email.
+# On PostgreSQL with pg_trgm the database does the matching (see the GIN
+# indexes in schema.sql). Elsewhere each worker keeps an in-process trigram
+# index, built at startup (warm_patient_search) and kept current from the
+# PatientChanges log that every insert, update and delete of a patient
+# appends to. The log is only written for the in-process index; old entries
+# are removed with "flask prune-patient-changes".
+SEARCH_FIELDS = ('Name', 'NationalID', 'Phone', 'Email')
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+DEFAULT_SYNC_SECONDS = 2.0
+# Log entries are re-read this far back, so transactions that commit out of
+# Seq order are not missed
+SYNC_OVERLAP = timedelta(seconds=60)
+LOG_RETENTION = timedelta(days=1)
+# Postings longer than this are skipped when collecting fuzzy candidates
+FUZZY_POSTINGS_LIMIT = 5000
+# Above this many candidates, full matches are collected from the patients
+# with the fewest trigrams first and the rest are not scored
+MAX_CANDIDATES = 5000
+
+_WORD = re.compile(r'[^\W_]+')
+_PHONE_QUERY = re.compile(r'^[\d\s()+\-.]+$')
+
+def _normalize(field, value):
+    if not value:
+        return ''
+    value = str(value).lower()
+    if field == 'Phone':
+        return re.sub(r'\D', '', value)
+    return ' '.join(_WORD.findall(value))
+
+def _normalize_query(q):
+    # "0100-123 45" should find the phone number 010012345
+    if _PHONE_QUERY.match(q) and any(c.isdigit() for c in q):
+        return re.sub(r'\D', '', q)
+    return ' '.join(_WORD.findall(q.lower()))
+
+def trigrams(normalized, prefix=False):
+    """pg_trgm-style trigrams: each word padded with two spaces before and one after.
+
+    With prefix=True the last word is left open-ended, so "sa" matches "salem".
+    """
+    padded = [f'  {word} ' for word in normalized.split()]
+    if prefix and padded:
+        padded[-1] = padded[-1][:-1]
+    return {word[i:i + 3] for word in padded for i in range(len(word) - 2)}
+
+class _Index:
+    def __init__(self):
+        self.fields = {}  # patient id -> normalized search fields
+        self.gram_counts = {}  # patient id -> number of distinct trigrams
+        self.postings = defaultdict(set)  # trigram -> patient ids
+        self.by_size = defaultdict(set)  # number of distinct trigrams -> patient ids
+        self.built = False
+        self.synced_at = None  # wall clock of the last build/sync start
+        self.checked_at = 0.0
+        self.applied = {}  # Seq -> ChangedAt of log entries inside the overlap window
+        self.dirty = False
+
+    def _grams(self, fields):
+        return trigrams(' '.join(fields))
+
+    def put(self, patient_id, values):
+        if patient_id in self.fields:
+            self.remove(patient_id)
+        fields = tuple(_normalize(f, v) for f, v in zip(SEARCH_FIELDS, values))
+        grams = self._grams(fields)
+        for gram in grams:
+            self.postings[gram].add(patient_id)
+        self.fields[patient_id] = fields
+        self.gram_counts[patient_id] = len(grams)
+        self.by_size[len(grams)].add(patient_id)
+
+    def remove(self, patient_id):
+        fields = self.fields.pop(patient_id, None)
+        if fields is None:
+            return
+        size = self.gram_counts.pop(patient_id)
+        self.by_size[size].discard(patient_id)
+        if not self.by_size[size]:
+            del self.by_size[size]
+        for gram in self._grams(fields):
+            postings = self.postings.get(gram)
+            if postings is not None:
+                postings.discard(patient_id)
+                if not postings:
+                    del self.postings[gram]
+
+_lock = threading.Lock()
+_index = _Index()
+_building = False
+_syncing = False
+_database_search = None  # None until pg_trgm availability has been checked
+
+def _columns():
+    return [getattr(Patients, field) for field in SEARCH_FIELDS]
+
+def _build():
+    global _index, _building
+    started = datetime.utcnow()
+    index = _Index()
+    rows = (db.session.query(Patients.PatientID, *_columns())
+            .execution_options(yield_per=10000))
+    for row in rows:
+        index.put(row[0], row[1:])
+    index.built = True
+    index.synced_at = started
+    index.checked_at = time.monotonic()
+    with _lock:
+        _index = index
+        _building = False
+
+def _build_in_background(app):
+    def run():
+        global _building
+        with app.app_context():
+            try:
+                _build()
+            except Exception:
+                app.logger.exception('Building the patient search index failed')
+                with _lock:
+                    _building = False
+            finally:
+                db.session.remove()
+    threading.Thread(target=run, name='patient-search-build', daemon=True).start()
+
+def _read_changes(index):
+    """Patients changed since the index was last synced: ({id: row or None}, log entries)"""
+    entries = (db.session.query(PatientChanges.Seq, PatientChanges.PatientID, PatientChanges.ChangedAt)
+               .filter(PatientChanges.ChangedAt >= index.synced_at - SYNC_OVERLAP)
+               .all())
+    ids = list({patient_id for seq, patient_id, _ in entries if seq not in index.applied})
+    changes = dict.fromkeys(ids)
+    for start in range(0, len(ids), 1000):
+        changes.update((row[0], row[1:]) for row in
+                       db.session.query(Patients.PatientID, *_columns())
+                       .filter(Patients.PatientID.in_(ids[start:start + 1000])))
+    return changes, entries
+
+def _sync(index):
+    # Only one request syncs at a time (_syncing); the queries run without
+    # the lock, so searches keep using the index meanwhile
+    started = datetime.utcnow()
+    changes, entries = _read_changes(index)
+    cutoff = started - SYNC_OVERLAP * 2
+    applied = {seq: at for seq, at in index.applied.items() if at >= cutoff}
+    applied.update((seq, changed_at) for seq, _, changed_at in entries)
+    with _lock:
+        for patient_id, row in changes.items():
+            if row is not None:
+                index.put(patient_id, row)
+            else:
+                index.remove(patient_id)
+        index.applied = applied
+        index.synced_at = started
+
+def _ensure_index():
+    """Bring the local index up to date; False if it has not been built"""
+    global _building, _syncing
+    ttl = current_app.config.get('PATIENT_SEARCH_SYNC_SECONDS', DEFAULT_SYNC_SECONDS)
+    now = time.monotonic()
+    with _lock:
+        index = _index
+        if not index.built:
+            return False
+        if datetime.utcnow() - index.synced_at > LOG_RETENTION:
+            # The log may have been pruned past our last sync: rebuild, and
+            # keep serving the current index until the new one is ready
+            if not _building:
+                _building = True
+                _build_in_background(current_app._get_current_object())
+            return True
+        if _syncing or not (index.dirty or now - index.checked_at >= ttl):
+            return True
+        _syncing = True
+        index.dirty = False
+        index.checked_at = now
+    try:
+        _sync(index)
+    finally:
+        with _lock:
+            _syncing = False
+    return True
+
+def warm_patient_search():
+    """Build the in-process index; run at startup, before requests are served"""
+    global _building
+    if _uses_database(db.session) or not inspect(db.engine).has_table(PatientChanges.__tablename__):
+        return False
+    with _lock:
+        _building = True
+    try:
+        _build()
+    finally:
+        with _lock:
+            _building = False
+    return True
+
+def prune_patient_changes():
+    """Delete log entries older than LOG_RETENTION; returns how many"""
+    result = db.session.execute(PatientChanges.__table__.delete()
+                                .where(PatientChanges.ChangedAt < datetime.utcnow() - LOG_RETENTION))
+    db.session.commit()
+    return result.rowcount
+
+def _full_matches(index, postings, wanted):
+    """Ids containing every trigram; postings sorted shortest first"""
+    if len(postings[0]) <= MAX_CANDIDATES:
+        return set.intersection(*postings)
+    # A common query. Every full match shares all of the query's trigrams,
+    # so the ones with the fewest trigrams of their own score highest: take
+    # those first and stop once there are enough to rank.
+    found = set()
+    for size in sorted(index.by_size):
+        found |= index.by_size[size].intersection(*postings)
+        if len(found) >= wanted:
+            break
+    return found
+
+def _rank(q, limit):
+    """[(patient id, score)] from the in-process index, best first"""
+    query_grams = trigrams(q, prefix=True)
+    if not query_grams:
+        return []
+    with _lock:
+        postings = sorted((_index.postings.get(gram, set()) for gram in query_grams), key=len)
+        total = len(query_grams)
+        # Candidates containing every trigram of the query
+        matched = dict.fromkeys(_full_matches(_index, postings, limit * 5), total)
+        if len(matched) < limit:
+            # Not enough: fall back to ids sharing at least half of the trigrams
+            counts = Counter()
+            for ids in postings:
+                if len(ids) <= FUZZY_POSTINGS_LIMIT:
+                    counts.update(ids)
+            needed = (total + 1) // 2
+            for patient_id, count in counts.items():
+                if count >= needed:
+                    matched.setdefault(patient_id, count)
+
+        # Jaccard similarity over trigrams, as pg_trgm's similarity()
+        def similarity(patient_id):
+            count = matched[patient_id]
+            return count / (total + _index.gram_counts[patient_id] - count)
+
+        shortlist = heapq.nlargest(limit * 5, matched, key=similarity)
+
+        # Whole-field, prefix and whole-word matches rank above partial ones
+        padded_q = f' {q} '
+        def score(patient_id):
+            fields = _index.fields[patient_id]
+            boost = 1.0 if q in fields else 0.5 if any(f.startswith(q) for f in fields) else 0.0
+            if any(padded_q in f' {f} ' for f in fields):
+                boost += 0.25
+            return similarity(patient_id) + boost
+
+        ranked = [(patient_id, score(patient_id)) for patient_id in shortlist]
+    ranked.sort(key=lambda item: -item[1])
+    return ranked[:limit]
+
+def _search_memory(q, limit):
+    if not trigrams(q, prefix=True):
+        return []
+    if not _ensure_index():
+        return _search_prefix(q, limit)
+    ranked = _rank(q, limit)
+    rows = {row.PatientID: row for row in
+            db.session.query(Patients.PatientID, *_columns())
+            .filter(Patients.PatientID.in_([patient_id for patient_id, _ in ranked]))}
+    return [(rows[patient_id], score) for patient_id, score in ranked if patient_id in rows]
+
+def _search_prefix(q, limit):
+    # Used when the in-process index has not been built: plain prefix matches
+    pattern = re.sub(r'([\\%_])', r'\\\1', q) + '%'
+    rows = (db.session.query(Patients.PatientID, *_columns())
+            .filter(or_(Patients.Name.ilike(pattern, escape='\\'),
+                        Patients.NationalID == q,
+                        Patients.Phone.like(pattern, escape='\\'),
+                        Patients.Email.ilike(pattern, escape='\\')))
+            .order_by(Patients.PatientID)
+            .limit(limit)
+            .all())
+    return [(row, 1.0 if q in (_normalize(f, v) for f, v in zip(SEARCH_FIELDS, row[1:])) else 0.5)
+            for row in rows]
+
+def _search_database(q, limit):
+    score = func.greatest(*[func.similarity(func.coalesce(column, ''), q) for column in _columns()])
+    return (db.session.query(Patients.PatientID, *_columns(), score.label('score'))
+            .filter(or_(*[column.op('%')(q) for column in _columns()]))
+            .order_by(score.desc(), Patients.PatientID)
+            .limit(limit)
+            .all())
+
+def _uses_database(executor):
+    # executor: the session, or the connection of a flush in progress
+    global _database_search
+    configured = current_app.config.get('PATIENT_SEARCH_BACKEND', 'auto')
+    if configured != 'auto':
+        return configured == 'database'
+    if _database_search is None:
+        _database_search = (db.engine.dialect.name == 'postgresql' and
+                            executor.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+                            .first() is not None)
+    return _database_search
+
+def search_backend():
+    """'database' when pg_trgm can do the matching, otherwise 'memory'"""
+    return 'database' if _uses_database(db.session) else 'memory'
+
+def search_patients(q, limit=DEFAULT_LIMIT):
+    """Top matches for q as dicts with the search fields and a Score, best first"""
+    limit = max(1, min(limit, MAX_LIMIT))
+    if search_backend() == 'database':
+        q = q.strip()
+        rows = [(row, row.score) for row in _search_database(q, limit)] if q else []
+    else:
+        rows = _search_memory(_normalize_query(q), limit)
+    return [
+        {'PatientID': row.PatientID, **{field: getattr(row, field) for field in SEARCH_FIELDS},
+         'Score': round(float(score), 3)}
+        for row, score in rows
+    ]
+
+def record_imported_patients(national_ids):
+    """Log patients inserted with Core statements, which skip the mapper events"""
+    if _uses_database(db.session):
+        return
+    db.session.execute(PatientChanges.__table__.insert().from_select(
+        ['PatientID', 'ChangedAt'],
+        select(Patients.PatientID, literal(datetime.utcnow(), PatientChanges.ChangedAt.type))
+        .where(Patients.NationalID.in_(national_ids))))
+    _mark_session(db.session())
+
+def _log_change(connection, target):
+    if _uses_database(connection):
+        return
+    connection.execute(PatientChanges.__table__.insert(),
+                       {'PatientID': target.PatientID, 'ChangedAt': datetime.utcnow()})
+    session = object_session(target)
+    if session is not None:
+        _mark_session(session)
+
+def _mark_session(session):
+    session.info['patient_search_changed'] = True
+
+@event.listens_for(Patients, 'after_insert')
+@event.listens_for(Patients, 'after_delete')
+def _patient_added_or_deleted(mapper, connection, target):
+    _log_change(connection, target)
+
+@event.listens_for(Patients, 'after_update')
+def _patient_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in SEARCH_FIELDS):
+        _log_change(connection, target)
+
+@event.listens_for(Session, 'after_commit')
+def _mark_dirty(session):
+    # Savepoint commits fire this event too; wait for the real commit
+    if session.in_nested_transaction():
+        return
+    if session.info.pop('patient_search_changed', None):
+        # Read-your-writes in this worker: sync on the next search
+        _index.dirty = True
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_mark(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('patient_search_changed', None)
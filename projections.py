@@ -0,0 +1,87 @@
+from sqlalchemy import select, DateTime, Numeric
+from models import (Patients, Doctors, Departments, Laboratory, Radiology, Supplies, Appointments,
+                    Patient_MedicineUsage, Patient_Supplies)
+
+# Read-only row path for the JSON list endpoints.
+# A Projection selects only the columns a model's as_dict() returns, with a
+# Core select(), so rows come back as plain Row tuples: no ORM instances, no
+# identity map, no change tracking. Its serializer is built once from the
+# column types and returns the same dict as as_dict().
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+def _converter(column):
+    # Mirrors as_dict(): datetimes as ISO strings, DECIMAL prices as str()
+    if isinstance(column.type, DateTime):
+        return _iso
+    if isinstance(column.type, Numeric) and column.type.asdecimal:
+        return str
+    return None
+
+class Projection:
+    """Columns of one model, plus optionally one many-to-one nested as a dict.
+
+    nested is (key, relationship, projection); the nested projection's first
+    field must be its primary key, which is NULL when there is no related row.
+    """
+
+    def __init__(self, model, fields, nested=None):
+        self.model = model
+        self.fields = tuple(fields)
+        self.nested = nested
+        self.serialize = self._compile()
+
+    def columns(self, prefix=''):
+        return [getattr(self.model, name).label(prefix + name) for name in self.fields]
+
+    def select(self):
+        statement = select(*self.columns())
+        if self.nested:
+            key, relationship, projection = self.nested
+            statement = (statement.add_columns(*projection.columns(f'{key}__'))
+                         .select_from(self.model)
+                         .outerjoin(relationship))
+        return statement
+
+    def _compile(self):
+        keys = self.fields
+        converters = tuple((name, converter) for name in keys
+                           for converter in [_converter(self.model.__table__.c[name])] if converter)
+        if self.nested:
+            nested_key, _, projection = self.nested
+            nested_serialize = projection.serialize
+            width = len(keys)
+
+            def serialize(row):
+                values = dict(zip(keys, row))
+                for name, converter in converters:
+                    values[name] = converter(values[name])
+                values[nested_key] = nested_serialize(row[width:]) if row[width] is not None else None
+                return values
+        elif converters:
+            def serialize(row):
+                values = dict(zip(keys, row))
+                for name, converter in converters:
+                    values[name] = converter(values[name])
+                return values
+        else:
+            def serialize(row):
+                return dict(zip(keys, row))
+        return serialize
+
+PATIENT_ROWS = Projection(Patients, (
+    'PatientID', 'Name', 'NationalID', 'Age', 'Gender', 'Weight', 'Height', 'Address', 'Phone', 'Email',
+    'MedicalNotes', 'Report', 'Diagnose', 'DoctorOrders', 'Date_admission', 'Date_discharge'))
+DOCTOR_ROWS = Projection(Doctors, (
+    'DoctorID', 'Name', 'Age', 'ScientificDegree', 'Specialist', 'DepartmentID', 'Phone', 'Email'))
+DEPARTMENT_ROWS = Projection(Departments, ('DepartmentID', 'DepartmentName'))
+LABORATORY_ROWS = Projection(Laboratory, ('TestID', 'TestName', 'Description', 'Price'))
+RADIOLOGY_ROWS = Projection(Radiology, ('RadiologyID', 'TestName', 'Description', 'Price'))
+SUPPLY_ROWS = Projection(Supplies, ('SupplyID', 'ItemName', 'Quantity', 'UnitPrice'))
+APPOINTMENT_ROWS = Projection(Appointments, (
+    'AppointmentID', 'PatientID', 'DoctorID', 'AppointmentDate', 'QueueNumber', 'AvailableSlots'),
+    nested=('patient', Appointments.patient, PATIENT_ROWS))
+MEDICINE_USAGE_ROWS = Projection(Patient_MedicineUsage, (
+    'PatientID', 'MedicineID', 'UsageDate', 'QuantityUsed', 'DoctorID', 'Notes'))
+PATIENT_SUPPLY_ROWS = Projection(Patient_Supplies, ('PatientID', 'SupplyID', 'QuantityUsed', 'DoctorID', 'DateUsed'))
@@ -0,0 +1,109 @@
+from datetime import datetime, time, timedelta
+from flask import current_app
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Appointments, DoctorDayQueues
+
+DEFAULT_DAILY_SLOTS = 30
+
+class NoSlotsAvailable(Exception):
+    """Raised when a doctor's queue for the day is full"""
+
+def _take_number(doctor_id, queue_date):
+    # Conditional increment: only succeeds while there is room, and holds the
+    # row lock until the caller commits, so no two bookings get the same number.
+    # Numbers are handed out in order until the last one, then released ones are reused.
+    return (DoctorDayQueues.query
+            .filter(DoctorDayQueues.DoctorID == doctor_id,
+                    DoctorDayQueues.QueueDate == queue_date,
+                    DoctorDayQueues.Booked < DoctorDayQueues.Capacity)
+            .update({DoctorDayQueues.Booked: DoctorDayQueues.Booked + 1,
+                     DoctorDayQueues.LastQueueNumber: case(
+                         (DoctorDayQueues.LastQueueNumber < DoctorDayQueues.Capacity,
+                          DoctorDayQueues.LastQueueNumber + 1),
+                         else_=DoctorDayQueues.LastQueueNumber)},
+                    synchronize_session=False))
+
+def _day_numbers(doctor_id, queue_date):
+    day_start = datetime.combine(queue_date, time.min)
+    return (db.session.query(Appointments.QueueNumber)
+            .filter(Appointments.DoctorID == doctor_id,
+                    Appointments.AppointmentDate >= day_start,
+                    Appointments.AppointmentDate < day_start + timedelta(days=1),
+                    Appointments.QueueNumber.isnot(None)))
+
+def _released_number(doctor_id, queue_date, capacity):
+    # Every number has been handed out once: the lowest one no longer in use
+    taken = {number for number, in _day_numbers(doctor_id, queue_date)}
+    return next((number for number in range(1, capacity + 1) if number not in taken), None)
+
+def _create_counter(doctor_id, queue_date):
+    # Count the numbers handed out before the counter existed
+    booked, last_number = (_day_numbers(doctor_id, queue_date)
+                           .with_entities(func.count(), func.coalesce(func.max(Appointments.QueueNumber), 0))
+                           .one())
+    capacity = current_app.config.get('APPOINTMENT_DAILY_SLOTS', DEFAULT_DAILY_SLOTS)
+    try:
+        with db.session.begin_nested():
+            db.session.add(DoctorDayQueues(DoctorID=doctor_id, QueueDate=queue_date, Booked=booked,
+                                           LastQueueNumber=min(last_number, capacity), Capacity=capacity))
+    except IntegrityError:
+        # Another booking created it first
+        pass
+
+def allocate_queue_number(doctor_id, appointment_date):
+    """Reserve the next queue number for a doctor's day.
+
+    Returns (queue_number, remaining_slots). Runs inside the caller's
+    transaction; the caller adds the appointment and commits.
+    """
+    doctor_id = int(doctor_id)
+    queue_date = appointment_date.date()
+
+    if not _take_number(doctor_id, queue_date):
+        _create_counter(doctor_id, queue_date)
+        if not _take_number(doctor_id, queue_date):
+            raise NoSlotsAvailable(f'No slots left for doctor {doctor_id} on {queue_date}')
+
+    last_number, booked, capacity = (
+        db.session.query(DoctorDayQueues.LastQueueNumber, DoctorDayQueues.Booked, DoctorDayQueues.Capacity)
+        .filter_by(DoctorID=doctor_id, QueueDate=queue_date)
+        .one())
+    # Below the last number the increment above is ours; at it, it may not be
+    number = last_number if last_number < capacity else _released_number(doctor_id, queue_date, capacity)
+    if number is None:
+        # Booked is behind the appointments table (rows removed outside the app)
+        raise NoSlotsAvailable(f'No slots left for doctor {doctor_id} on {queue_date}')
+    return number, capacity - booked
+
+def release_queue_number(doctor_id, appointment_date, queue_number):
+    """Give back the slot of a deleted or moved appointment; its number can be handed out again"""
+    if not doctor_id or not appointment_date or queue_number is None:
+        return
+    (DoctorDayQueues.query
+     .filter(DoctorDayQueues.DoctorID == int(doctor_id),
+             DoctorDayQueues.QueueDate == appointment_date.date(),
+             DoctorDayQueues.Booked > 0)
+     .update({DoctorDayQueues.Booked: DoctorDayQueues.Booked - 1}, synchronize_session=False))
+
+def reallocate_if_moved(appointment, old_doctor_id, old_date):
+    """Give a rescheduled appointment a number in its new doctor/day queue.
+
+    The only place an existing appointment's QueueNumber and AvailableSlots
+    change; the old queue gets its slot back.
+    """
+    queued = bool(appointment.DoctorID and appointment.AppointmentDate)
+    if queued:
+        same_doctor = old_doctor_id is not None and int(old_doctor_id) == int(appointment.DoctorID)
+        same_day = old_date is not None and old_date.date() == appointment.AppointmentDate.date()
+        if same_doctor and same_day:
+            return
+    elif not old_doctor_id or not old_date:
+        return
+    release_queue_number(old_doctor_id, old_date, appointment.QueueNumber)
+    # Cleared first, so a new queue's counter does not start after the old number
+    appointment.QueueNumber = appointment.AvailableSlots = None
+    if queued:
+        appointment.QueueNumber, appointment.AvailableSlots = allocate_queue_number(
+            appointment.DoctorID, appointment.AppointmentDate)
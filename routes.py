@@ -4,16 +4,45 @@ from flask import (
 )
 from extensions import db
 from models import *
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
 import jwt
 import os
+import io
 import json
 from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
+from orders import sync_patient_orders
+from loading import with_loading
+from pagination import keyset_page, keyset_json
+from export import stream_export
+from projections import (PATIENT_ROWS, DOCTOR_ROWS, DEPARTMENT_ROWS, LABORATORY_ROWS, RADIOLOGY_ROWS, SUPPLY_ROWS,
+                         APPOINTMENT_ROWS, MEDICINE_USAGE_ROWS, PATIENT_SUPPLY_ROWS)
+from catalog_cache import get_catalog, invalidate_catalog
+from auth_tokens import TokenUser, consume_token, create_tokens, decode_token, revoke_token
+from passwords import hash_password, verify_and_upgrade, PasswordHasherBusy
+from patient_import import import_patients
+from queue_allocator import allocate_queue_number, reallocate_if_moved, release_queue_number, NoSlotsAvailable
+from availability import appointment_changed, find_free_slots
+from stock import dispense_medicines, use_supplies, inventory_summary, InsufficientStock
+from patient_search import search_patients, search_backend
+from autocomplete import suggest, AUTOCOMPLETE_CATALOGS
+from chart import patient_chart, SECTIONS as CHART_SECTIONS, DEFAULT_SECTION_LIMIT
+from patient_portal import patient_id_for, dashboard_appointments, time_remaining
+from instrumentation import query_budget
 # Session-based Authentication Decorator
+# API clients may instead send "Authorization: Bearer <access token>";
+# the token is verified without a database lookup.
 def session_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            try:
+                claims = decode_token(auth_header[len('Bearer '):], 'access')
+            except jwt.InvalidTokenError as e:
+                return jsonify({'message': f'Invalid token: {str(e)}'}), 401
+            return f(TokenUser(claims), *args, **kwargs)
+        
         if 'user_id' not in session:
             return jsonify({'message': 'Login required!'}), 401
         
@@ -35,6 +64,7 @@ pharmacy_bp = Blueprint('pharmacy', __name__, url_prefix='/api/pharmacy')
 users_bp = Blueprint('users', __name__, url_prefix='/api/users')
 appointments_bp = Blueprint('appointments', __name__, url_prefix='/api/appointments')
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
+catalog_bp = Blueprint('catalog', __name__, url_prefix='/api/catalog')
 
 # Auth Routes
 @auth_bp.route('/login', methods=['POST'])
@@ -45,11 +75,34 @@ def login():
     user = Users.query.filter_by(Email=auth.get('email')).first()
     if not user:
         return jsonify({'message': 'User not found!'}), 404
-    if check_password_hash(user.PasswordHash, auth.get('password')):
+    try:
+        valid = verify_and_upgrade(user, auth.get('password'))
+    except PasswordHasherBusy as e:
+        return jsonify({'message': str(e)}), 503
+    if valid:
+        # Save the upgraded hash if the KDF parameters changed
+        db.session.commit()
+        
+        # API clients can ask for signed tokens instead of a session
+        if auth.get('token'):
+            access_token, refresh_token = create_tokens(user)
+            return jsonify({
+                'message': 'Login successful',
+                'access_token': access_token,
+                'refresh_token': refresh_token,
+                'token_type': 'Bearer',
+                'user': {
+                    'id': user.UserID,
+                    'name': user.Name,
+                    'role': user.Role.value if hasattr(user.Role, 'value') else user.Role
+                }
+            })
+        
         # Store user info in session instead of generating token
         session['user_id'] = user.UserID
         session['user_role'] = user.Role.value if hasattr(user.Role, 'value') else user.Role
         session['user_name'] = user.Name
+        session['patient_id'] = user.PatientID
         
         return jsonify({
             'message': 'Login successful',
@@ -61,6 +114,57 @@ def login():
         })
     return jsonify({'message': 'Invalid credentials!'}), 401
 
+@auth_bp.route('/refresh', methods=['POST'])
+def refresh():
+    data = request.json
+    if not data or not data.get('refresh_token'):
+        return jsonify({'message': 'Missing refresh token!'}), 400
+    try:
+        claims = decode_token(data.get('refresh_token'), 'refresh')
+    except jwt.InvalidTokenError as e:
+        return jsonify({'message': f'Invalid token: {str(e)}'}), 401
+    
+    # Reload the user so role changes and deletions take effect on refresh
+    user = db.session.get(Users, int(claims['sub']))
+    if not user:
+        return jsonify({'message': 'User not found!'}), 401
+    
+    # Refresh tokens are single use
+    try:
+        consume_token(claims)
+    except jwt.InvalidTokenError as e:
+        return jsonify({'message': f'Invalid token: {str(e)}'}), 401
+    access_token, refresh_token = create_tokens(user)
+    return jsonify({
+        'access_token': access_token,
+        'refresh_token': refresh_token,
+        'token_type': 'Bearer'
+    })
+
+@auth_bp.route('/logout', methods=['POST'])
+def logout():
+    # Revoke whichever tokens the client hands back
+    data = request.get_json(silent=True) or {}
+    auth_header = request.headers.get('Authorization', '')
+    tokens = [(data.get('refresh_token'), 'refresh')]
+    if auth_header.startswith('Bearer '):
+        tokens.append((auth_header[len('Bearer '):], 'access'))
+    
+    for token, token_type in tokens:
+        if not token:
+            continue
+        try:
+            revoke_token(decode_token(token, token_type))
+        except jwt.InvalidTokenError:
+            # Already expired or revoked
+            continue
+    
+    session.pop('user_id', None)
+    session.pop('user_role', None)
+    session.pop('user_name', None)
+    session.pop('patient_id', None)
+    return jsonify({'message': 'Logged out'})
+
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -70,7 +174,10 @@ def register():
     existing_user = Users.query.filter_by(Email=data.get('email')).first()
     if existing_user:
         return jsonify({'message': 'User already exists!'}), 409
-    hashed_password = generate_password_hash(data.get('password'))
+    try:
+        hashed_password = hash_password(data.get('password'))
+    except PasswordHasherBusy as e:
+        return jsonify({'message': str(e)}), 503
     
     # Find the matching enum by value instead of trying to create it directly
     role_value = data.get('role')
@@ -99,36 +206,63 @@ def register():
 #  add a patient dashboard route:
 @auth_bp.route('/patient-dashboard')
 @session_required
+@query_budget(4)
 def patient_dashboard(current_user):
-    if current_user.Role != UserRole.Patient and current_user.Role.value != 'Patient':
+    if current_user.Role != UserRole.Patient:
         return jsonify({'message': 'Access denied'}), 403
     
-    # Get patient data
-    patient = Patients.query.filter_by(Email=current_user.Email).first()
+    # Get patient data through the Users -> Patients link
+    patient_id = patient_id_for(current_user)
+    patient = db.session.get(Patients, patient_id) if patient_id else None
     if not patient:
         return jsonify({'message': 'Patient record not found'}), 404
     
+    now = datetime.now()
+    appointments = [
+        {
+            'AppointmentID': appointment.AppointmentID,
+            'DoctorID': appointment.DoctorID,
+            'DoctorName': appointment.doctor.Name if appointment.doctor else None,
+            'AppointmentDate': appointment.AppointmentDate.isoformat(),
+            'QueueNumber': appointment.QueueNumber,
+            'Status': status,
+            'time_remaining': time_remaining(appointment.AppointmentDate, now)
+        }
+        for appointment, status in dashboard_appointments(patient.PatientID, now)
+    ]
+    
     return jsonify({
         'patient': patient.as_dict(),
+        'appointments': appointments,
         'message': 'Patient dashboard data retrieved successfully'
     })    
 #______________________________________________________________
 # Patients Routes
 @patients_bp.route('/', methods=['GET'])
+@query_budget(2)
 def get_patients():
+    # For API requests, return JSON
+    if request.headers.get('Accept') == 'application/json':
+        return keyset_json(PATIENT_ROWS.select(), Patients.PatientID, serialize=PATIENT_ROWS.serialize, filters={
+            'NationalID': Patients.NationalID,
+            'Gender': Patients.Gender,
+            'Doctor': Patients.Doctor,
+            'Phone': Patients.Phone,
+            'Email': Patients.Email,
+        }, ranges={
+            'admitted_from': (Patients.Date_admission, '>='),
+            'admitted_to': (Patients.Date_admission, '<'),
+        })
+    
     patients = Patients.query.all()
-    doctors = Doctors.query.all()  # Get all doctors for the dropdown
+    doctors = get_catalog('doctors')  # Get all doctors for the dropdown
     
     # Get supplies, medicines, and lab tests for doctor orders
-    supplies = Supplies.query.all()
-    medicines = Pharmacy.query.all()
-    lab_tests = Laboratory.query.all()
+    supplies = get_catalog('supplies')
+    medicines = get_catalog('pharmacy')
+    lab_tests = get_catalog('laboratory')
     # Add this line to fetch radiology tests
-    radiology_tests = Radiology.query.all()
-    
-    # For API requests, return JSON
-    if request.headers.get('Accept') == 'application/json':
-        return jsonify([p.as_dict() for p in patients])
+    radiology_tests = get_catalog('radiology')
     
     # For web requests, render template
     return render_template('patients.html', 
@@ -139,7 +273,25 @@ def get_patients():
                           lab_tests=lab_tests,
                           radiology_tests=radiology_tests)
 
+@patients_bp.route('/export', methods=['GET'])
+@query_budget(1)
+def export_patients():
+    return stream_export(PATIENT_ROWS.select().order_by(Patients.PatientID), serialize=PATIENT_ROWS.serialize)
+
+@patients_bp.route('/search', methods=['GET'])
+@query_budget(2)
+def search_patients_route():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'message': 'q is required!'}), 400
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'message': 'limit must be an integer'}), 400
+    return jsonify({'items': search_patients(q, limit), 'backend': search_backend()})
+
 @patients_bp.route('/<int:patient_id>', methods=['GET'])
+@query_budget(2)
 def get_patient(patient_id):
     patient = Patients.query.get_or_404(patient_id)
     patient_dict = patient.as_dict()
@@ -152,6 +304,22 @@ def get_patient(patient_id):
     
     return jsonify(patient_dict)
 
+@patients_bp.route('/<int:patient_id>/chart', methods=['GET'])
+@query_budget(6)
+def get_patient_chart(patient_id):
+    # ?limit= caps every section, ?<section>_limit= overrides one (0 leaves it out)
+    try:
+        default_limit = int(request.args.get('limit', DEFAULT_SECTION_LIMIT))
+        limits = {name: int(request.args[f'{name}_limit'])
+                  for name in CHART_SECTIONS if f'{name}_limit' in request.args}
+    except ValueError:
+        return jsonify({'message': 'Section limits must be integers'}), 400
+    
+    chart = patient_chart(patient_id, limits, default_limit)
+    if chart is None:
+        return jsonify({'message': 'Patient not found!'}), 404
+    return jsonify(chart)
+
 @patients_bp.route('/create', methods=['POST'])
 def create_patient():
     try:
@@ -179,6 +347,7 @@ def create_patient():
         selected_supplies = request.form.get('selectedSupplies')
         selected_medicines = request.form.get('selectedMedicines')
         selected_lab_tests = request.form.get('selectedLabTests')
+        selected_radiology_tests = request.form.get('selectedRadiologyTests')
         
         # Combine all doctor orders into a single JSON object
         doctor_orders = {
@@ -194,6 +363,7 @@ def create_patient():
         }
         
         new_patient.DoctorOrders = json.dumps(doctor_orders)
+        sync_patient_orders(new_patient, doctor_orders)
         
         db.session.add(new_patient)
         db.session.commit()
@@ -204,6 +374,23 @@ def create_patient():
     
     return redirect(url_for('patients.get_patients'))
 
+@patients_bp.route('/import', methods=['POST'])
+def import_patients_bulk():
+    # Accept an uploaded file (multipart field "file") or a raw request body
+    upload = request.files.get('file')
+    filename = upload.filename if upload else ''
+    fmt = request.args.get('format')
+    if not fmt:
+        is_csv = filename.endswith('.csv') or (request.mimetype or '').endswith('csv')
+        fmt = 'csv' if is_csv else 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'message': f'Unsupported import format: {fmt}'}), 400
+    
+    stream = upload.stream if upload else request.stream
+    lines = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    report = import_patients(lines, fmt)
+    return jsonify(report), 200 if not report['failed'] else 207
+
 @patients_bp.route('/update/<int:patient_id>', methods=['POST'])
 def update_patient(patient_id):
     patient = Patients.query.get_or_404(patient_id)
@@ -246,6 +433,7 @@ def update_patient(patient_id):
         }
         
         patient.DoctorOrders = json.dumps(doctor_orders)
+        sync_patient_orders(patient, doctor_orders)
         
         db.session.commit()
         flash('Patient updated successfully!', 'success')
@@ -272,13 +460,17 @@ def delete_patient(patient_id):
 doctors_bp = Blueprint('doctors', __name__, url_prefix='/api/doctors')
 
 @doctors_bp.route('/', methods=['GET'])
+@query_budget(2)
 def get_doctors():
-    doctors = Doctors.query.all()
-    departments = Departments.query.all()
-    
     # For API requests, return JSON
     if request.headers.get('Accept') == 'application/json':
-        return jsonify([d.as_dict() for d in doctors])
+        return keyset_json(DOCTOR_ROWS.select(), Doctors.DoctorID, serialize=DOCTOR_ROWS.serialize, filters={
+            'DepartmentID': Doctors.DepartmentID,
+            'Specialist': Doctors.Specialist,
+        })
+    
+    doctors = Doctors.query.all()
+    departments = get_catalog('departments')
     
     # For web requests, render template
     return render_template('doctor.html', doctors=doctors, departments=departments)
@@ -307,6 +499,7 @@ def create_doctor():
         )
     
     db.session.add(new_doctor)
+    invalidate_catalog('doctors')
     db.session.commit()
     
     # Return appropriate response based on request type
@@ -337,6 +530,7 @@ def update_doctor(doctor_id):
         if request.form.get('ScientificDegree'):
             doctor.ScientificDegree = request.form.get('ScientificDegree')
     
+    invalidate_catalog('doctors')
     db.session.commit()
     
     if request.is_json:
@@ -352,6 +546,7 @@ def delete_doctor(doctor_id):
         # Handle form submission for delete
         doctor = Doctors.query.get_or_404(doctor_id)
         db.session.delete(doctor)
+        invalidate_catalog('doctors')
         db.session.commit()
         
         from flask import flash, redirect, url_for
@@ -361,17 +556,22 @@ def delete_doctor(doctor_id):
         # Handle API request
         doctor = Doctors.query.get_or_404(doctor_id)
         db.session.delete(doctor)
+        invalidate_catalog('doctors')
         db.session.commit()
         return jsonify({'message': 'Doctor deleted!'})
 
 # Departments Routes
 @departments_bp.route('/', methods=['GET'])
+@query_budget(1)
 def get_departments():
-    departments = Departments.query.all()
     # For API requests, return JSON
     if request.headers.get('Accept') == 'application/json':
-        return jsonify([dept.as_dict() for dept in departments])
+        return keyset_json(DEPARTMENT_ROWS.select(), Departments.DepartmentID,
+                           serialize=DEPARTMENT_ROWS.serialize, filters={
+            'DepartmentName': Departments.DepartmentName,
+        })
     # For web requests, render template
+    departments = Departments.query.all()
     return render_template('department.html', departments=departments)
 
 @departments_bp.route('/<int:department_id>', methods=['GET'])
@@ -391,6 +591,7 @@ def create_department():
         new_department = Departments(DepartmentName=department_name)
     
     db.session.add(new_department)
+    invalidate_catalog('departments')
     db.session.commit()
     
     # Return appropriate response based on request type
@@ -414,6 +615,7 @@ def update_department(department_id):
         department_name = request.form.get('DepartmentName')
         department.DepartmentName = department_name
     
+    invalidate_catalog('departments')
     db.session.commit()
     
     if request.is_json:
@@ -435,6 +637,8 @@ def delete_department(department_id):
         
         # Now delete the department
         db.session.delete(department)
+        invalidate_catalog('departments')
+        invalidate_catalog('doctors')
         db.session.commit()
         
         flash('Department deleted successfully', 'success')
@@ -448,12 +652,15 @@ def delete_department(department_id):
 
 # Laboratory Routes
 @laboratory_bp.route('/', methods=['GET'])
+@query_budget(1)
 def get_laboratory_tests():
-    tests = Laboratory.query.all()
     # For API requests, return JSON
     if request.headers.get('Accept') == 'application/json':
-        return jsonify([t.as_dict() for t in tests])
+        return keyset_json(LABORATORY_ROWS.select(), Laboratory.TestID, serialize=LABORATORY_ROWS.serialize, filters={
+            'TestName': Laboratory.TestName,
+        })
     # For web requests, render template
+    tests = Laboratory.query.all()
     return render_template('laboratory.html', lab_tests=tests)
 
 @laboratory_bp.route('/', methods=['POST'])
@@ -482,6 +689,7 @@ def create_laboratory_test():
             return redirect(url_for('laboratory.get_laboratory_tests'))
     
     db.session.add(new_test)
+    invalidate_catalog('laboratory')
     db.session.commit()
     
     if request.is_json:
@@ -520,6 +728,7 @@ def update_laboratory_test(test_id):
             flash(f'Error updating laboratory test: {str(e)}', 'danger')
             return redirect(url_for('laboratory.get_laboratory_tests'))
     
+    invalidate_catalog('laboratory')
     db.session.commit()
     
     if request.is_json:
@@ -539,6 +748,7 @@ def delete_laboratory_test(test_id):
         
         # Now delete the laboratory test
         db.session.delete(test)
+        invalidate_catalog('laboratory')
         db.session.commit()
         
         flash('Laboratory test deleted successfully', 'success')
@@ -551,14 +761,17 @@ def delete_laboratory_test(test_id):
 
 # Radiology Routes
 @radiology_bp.route('/', methods=['GET'])
+@query_budget(1)
 def get_radiology_tests():
-    rad_tests = Radiology.query.all()
-    
     # For API requests, return JSON
     if request.headers.get('Accept') == 'application/json':
-        return jsonify([test.as_dict() for test in rad_tests])
+        return keyset_json(RADIOLOGY_ROWS.select(), Radiology.RadiologyID,
+                           serialize=RADIOLOGY_ROWS.serialize, filters={
+            'TestName': Radiology.TestName,
+        })
     
     # For web requests, render template
+    rad_tests = Radiology.query.all()
     return render_template('radiology.html', rad_tests=rad_tests)
 
 
@@ -594,6 +807,7 @@ def create_radiology_test():
 
         # Move database operations outside the if/else blocks
         db.session.add(new_test)
+        invalidate_catalog('radiology')
         db.session.commit()
         
         if request.is_json:
@@ -612,6 +826,7 @@ def update_radiology_test(test_id):
         test.Description = request.form.get('Description')
         test.Price = request.form.get('Price')
         
+        invalidate_catalog('radiology')
         db.session.commit()
         flash('Radiology test updated successfully!', 'success')
     except Exception as e:
@@ -625,6 +840,7 @@ def delete_radiology_test(test_id):
     test = Radiology.query.get_or_404(test_id)
     try:
         db.session.delete(test)
+        invalidate_catalog('radiology')
         db.session.commit()
         flash('Radiology test deleted successfully!', 'success')
     except Exception as e:
@@ -636,12 +852,15 @@ def delete_radiology_test(test_id):
 
 # Supplies Routes
 @supplies_bp.route('/', methods=['GET'])
+@query_budget(1)
 def get_supplies():
-    supplies = Supplies.query.all()
     # For API requests, return JSON
     if request.headers.get('Accept') == 'application/json':
-        return jsonify([s.as_dict() for s in supplies])
+        return keyset_json(SUPPLY_ROWS.select(), Supplies.SupplyID, serialize=SUPPLY_ROWS.serialize, filters={
+            'ItemName': Supplies.ItemName,
+        })
     # For web requests, render template
+    supplies = Supplies.query.all()
     return render_template('supplies.html', supplies=supplies)
 
 @supplies_bp.route('/create', methods=['POST'])
@@ -654,6 +873,7 @@ def create_supply():
             UnitPrice=request.form.get('UnitPrice')
         )
         db.session.add(new_supply)
+        invalidate_catalog('supplies')
         db.session.commit()
         flash('Supply added successfully!', 'success')
     except Exception as e:
@@ -671,6 +891,7 @@ def update_supply(supply_id):
         supply.Quantity = request.form.get('Quantity')
         supply.UnitPrice = request.form.get('UnitPrice')
         
+        invalidate_catalog('supplies')
         db.session.commit()
         flash('Supply updated successfully!', 'success')
     except Exception as e:
@@ -684,6 +905,7 @@ def delete_supply(supply_id):
     supply = Supplies.query.get_or_404(supply_id)
     try:
         db.session.delete(supply)
+        invalidate_catalog('supplies')
         db.session.commit()
         flash('Supply deleted successfully!', 'success')
     except Exception as e:
@@ -692,12 +914,130 @@ def delete_supply(supply_id):
     
     return redirect(url_for('supplies.get_supplies'))
 
+@supplies_bp.route('/summary', methods=['GET'])
+@query_budget(2)
+def get_supplies_summary():
+    return jsonify(inventory_summary('supplies'))
+
+@supplies_bp.route('/use', methods=['POST'])
+def use_supply():
+    # {"PatientID": 1, "DoctorID": 2, "items": [{"SupplyID": 3, "Quantity": 2}, ...]}
+    data = request.json
+    if not data or not data.get('PatientID') or not data.get('items'):
+        return jsonify({'message': 'PatientID and items are required!'}), 400
+    try:
+        used = use_supplies(data.get('PatientID'), data.get('DoctorID'), data.get('items'))
+        db.session.commit()
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'SupplyID': e.item_id}), 409
+    except (KeyError, TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'message': f'Invalid items: {str(e)}'}), 400
+    except IntegrityError:
+        # The foreign keys checked the ids for us
+        db.session.rollback()
+        return jsonify({'message': 'Unknown PatientID or DoctorID'}), 400
+    
+    return jsonify({
+        'message': 'Supply usage recorded',
+        'items': [{'SupplyID': s, 'Quantity': q} for s, q in used]
+    }), 201
+
+@supplies_bp.route('/usage', methods=['GET'])
+@query_budget(1)
+def get_supply_usage():
+    # Ward consumption: running totals per supply, no scan of the ledger
+    rows = (db.session.query(SupplyUsageTotals, Supplies.ItemName, Supplies.Quantity)
+            .join(Supplies, Supplies.SupplyID == SupplyUsageTotals.SupplyID)
+            .order_by(SupplyUsageTotals.QuantityUsed.desc())
+            .all())
+    return jsonify([
+        {**totals.as_dict(), 'ItemName': name, 'QuantityInStock': in_stock}
+        for totals, name, in_stock in rows
+    ])
+
+@supplies_bp.route('/<int:supply_id>/usage', methods=['GET'])
+@query_budget(2)
+def get_supply_usage_by_patient(supply_id):
+    # Per-patient totals for one supply, paged by PatientID
+    try:
+        rows, next_cursor = keyset_page(
+            PATIENT_SUPPLY_ROWS.select().filter(Patient_Supplies.SupplyID == supply_id),
+            Patient_Supplies.PatientID)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    totals = db.session.get(SupplyUsageTotals, supply_id) or SupplyUsageTotals(
+        SupplyID=supply_id, QuantityUsed=0, PatientCount=0)
+    return jsonify({
+        'totals': totals.as_dict(),
+        'items': [PATIENT_SUPPLY_ROWS.serialize(row) for row in rows],
+        'next_cursor': next_cursor
+    })
+
+@supplies_bp.route('/patients/<int:patient_id>', methods=['GET'])
+@query_budget(1)
+def get_patient_supply_usage(patient_id):
+    rows = (db.session.query(Patient_Supplies, Supplies.ItemName)
+            .join(Supplies, Supplies.SupplyID == Patient_Supplies.SupplyID)
+            .filter(Patient_Supplies.PatientID == patient_id)
+            .order_by(Supplies.ItemName)
+            .all())
+    return jsonify([{**usage.as_dict(), 'ItemName': name} for usage, name in rows])
+
 # Pharmacy Routes
 @pharmacy_bp.route('/', methods=['GET'])
+@query_budget(1)
 def get_pharmacy_items():
     medicines = Pharmacy.query.all()
     return render_template('pharmacy.html', medicines=medicines)
 
+@pharmacy_bp.route('/usage/export', methods=['GET'])
+@query_budget(1)
+def export_medicine_usage():
+    query = MEDICINE_USAGE_ROWS.select().order_by(
+        Patient_MedicineUsage.PatientID,
+        Patient_MedicineUsage.MedicineID,
+        Patient_MedicineUsage.UsageDate,
+        Patient_MedicineUsage.UsageID
+    )
+    return stream_export(query, serialize=MEDICINE_USAGE_ROWS.serialize)
+
+@pharmacy_bp.route('/summary', methods=['GET'])
+@query_budget(2)
+def get_pharmacy_summary():
+    return jsonify(inventory_summary('pharmacy'))
+
+@pharmacy_bp.route('/dispense', methods=['POST'])
+def dispense():
+    # {"PatientID": 1, "DoctorID": 2, "items": [{"MedicineID": 3, "Quantity": 2}, ...]}
+    data = request.json
+    if not data or not data.get('PatientID') or not data.get('items'):
+        return jsonify({'message': 'PatientID and items are required!'}), 400
+    try:
+        dispensed = dispense_medicines(
+            data.get('PatientID'),
+            data.get('DoctorID'),
+            data.get('items'),
+            data.get('Notes')
+        )
+        db.session.commit()
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'MedicineID': e.item_id}), 409
+    except (KeyError, TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'message': f'Invalid items: {str(e)}'}), 400
+    except IntegrityError:
+        # The foreign keys checked the ids for us
+        db.session.rollback()
+        return jsonify({'message': 'Unknown PatientID or DoctorID'}), 400
+    
+    return jsonify({
+        'message': 'Medicines dispensed',
+        'items': [{'MedicineID': m, 'Quantity': q} for m, q in dispensed]
+    }), 201
+
 @pharmacy_bp.route('/create', methods=['POST'])
 def create_pharmacy_item():
     try:
@@ -708,6 +1048,7 @@ def create_pharmacy_item():
             UnitPrice=request.form.get('UnitPrice')
         )
         db.session.add(new_medicine)
+        invalidate_catalog('pharmacy')
         db.session.commit()
         flash('Medicine added successfully!', 'success')
     except Exception as e:
@@ -725,6 +1066,7 @@ def update_pharmacy_item(medicine_id):
         medicine.Quantity = request.form.get('Quantity')
         medicine.UnitPrice = request.form.get('UnitPrice')
         
+        invalidate_catalog('pharmacy')
         db.session.commit()
         flash('Medicine updated successfully!', 'success')
     except Exception as e:
@@ -738,6 +1080,7 @@ def delete_pharmacy_item(medicine_id):
     medicine = Pharmacy.query.get_or_404(medicine_id)
     try:
         db.session.delete(medicine)
+        invalidate_catalog('pharmacy')
         db.session.commit()
         flash('Medicine deleted successfully!', 'success')
     except Exception as e:
@@ -748,21 +1091,54 @@ def delete_pharmacy_item(medicine_id):
 
 # Appointments Routes
 @appointments_bp.route('/', methods=['GET'])
+@query_budget(3)
 def get_appointments():
-    appointments = Appointments.query.all()
-    patients = Patients.query.all()
-    doctors = Doctors.query.all()
-    
     # For API requests, return JSON
     if request.headers.get('Accept') == 'application/json':
-        return jsonify([a.as_dict() for a in appointments])
+        return keyset_json(APPOINTMENT_ROWS.select(), Appointments.AppointmentID,
+                           serialize=APPOINTMENT_ROWS.serialize, filters={
+            'PatientID': Appointments.PatientID,
+            'DoctorID': Appointments.DoctorID,
+        }, ranges={
+            'date_from': (Appointments.AppointmentDate, '>='),
+            'date_to': (Appointments.AppointmentDate, '<'),
+        })
     
     # For web requests, render template
+    appointments = with_loading(Appointments.query, 'appointments.html').all()
+    patients = with_loading(Patients.query, 'patients.dropdown').all()
+    doctors = get_catalog('doctors')
     return render_template('appointments.html', appointments=appointments, patients=patients, doctors=doctors)
 
+@appointments_bp.route('/export', methods=['GET'])
+@query_budget(1)
+def export_appointments():
+    query = APPOINTMENT_ROWS.select().order_by(Appointments.AppointmentID)
+    return stream_export(query, serialize=APPOINTMENT_ROWS.serialize)
+
+@appointments_bp.route('/availability', methods=['GET'])
+def get_availability():
+    # e.g. ?department_id=3&date_from=2024-05-06&date_to=2024-05-12&limit=5
+    doctors = get_catalog('doctors')
+    try:
+        if request.args.get('doctor_id'):
+            doctors = [d for d in doctors if d['DoctorID'] == int(request.args['doctor_id'])]
+        if request.args.get('department_id'):
+            doctors = [d for d in doctors if d['DepartmentID'] == int(request.args['department_id'])]
+        if request.args.get('specialist'):
+            specialist = request.args['specialist'].lower()
+            doctors = [d for d in doctors if (d['Specialist'] or '').lower() == specialist]
+        date_from = datetime.strptime(request.args.get('date_from', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d').date()
+        date_to = datetime.strptime(request.args['date_to'], '%Y-%m-%d').date() if request.args.get('date_to') else date_from + timedelta(days=6)
+        limit = min(int(request.args.get('limit', 10)), 100)
+    except ValueError as e:
+        return jsonify({'message': f'Invalid parameter: {str(e)}'}), 400
+    
+    return jsonify({'slots': find_free_slots(doctors, date_from, date_to, limit)})
+
 @appointments_bp.route('/<int:appointment_id>', methods=['GET'])
 def get_appointment(appointment_id):
-    appointment = Appointments.query.get_or_404(appointment_id)
+    appointment = with_loading(Appointments.query, 'appointments.json').get_or_404(appointment_id)
     return jsonify(appointment.as_dict())
 
 @appointments_bp.route('/', methods=['POST'])
@@ -774,9 +1150,7 @@ def create_appointment():
             new_appointment = Appointments(
                 PatientID=data.get('PatientID'),
                 DoctorID=data.get('DoctorID'),
-                AppointmentDate=datetime.strptime(data.get('AppointmentDate'), '%Y-%m-%d %H:%M'),
-                QueueNumber=data.get('QueueNumber'),
-                AvailableSlots=data.get('AvailableSlots')
+                AppointmentDate=datetime.strptime(data.get('AppointmentDate'), '%Y-%m-%d %H:%M')
             )
         except Exception as e:
             return jsonify({'message': f'Error creating appointment: {str(e)}'}), 400
@@ -786,32 +1160,67 @@ def create_appointment():
             new_appointment = Appointments(
                 PatientID=request.form.get('patient_id'),
                 DoctorID=request.form.get('doctor_id'),
-                AppointmentDate=datetime.strptime(request.form.get('date'), '%Y-%m-%dT%H:%M'),
-                QueueNumber=request.form.get('queue_number'),
-                AvailableSlots=request.form.get('available_slots')
+                AppointmentDate=datetime.strptime(request.form.get('date'), '%Y-%m-%dT%H:%M')
             )
         except Exception as e:
             from flask import flash, redirect, url_for
             flash(f'Error adding appointment: {str(e)}', 'danger')
             return redirect(url_for('appointments.get_appointments'))
     
+    # Queue number and remaining slots are assigned by the server
+    try:
+        new_appointment.QueueNumber, new_appointment.AvailableSlots = allocate_queue_number(
+            new_appointment.DoctorID, new_appointment.AppointmentDate)
+    except (NoSlotsAvailable, TypeError, ValueError) as e:
+        db.session.rollback()
+        message = str(e) if isinstance(e, NoSlotsAvailable) else 'A valid doctor is required'
+        if request.is_json:
+            return jsonify({'message': message}), 409 if isinstance(e, NoSlotsAvailable) else 400
+        flash(f'Error adding appointment: {message}', 'danger')
+        return redirect(url_for('appointments.get_appointments'))
+    
     db.session.add(new_appointment)
+    appointment_changed(new_doctor_id=new_appointment.DoctorID, new_date=new_appointment.AppointmentDate)
     db.session.commit()
     
     # Return appropriate response based on request type
     if request.is_json:
-        return jsonify({'message': 'Appointment created!', 'AppointmentID': new_appointment.AppointmentID}), 201
+        return jsonify({
+            'message': 'Appointment created!',
+            'AppointmentID': new_appointment.AppointmentID,
+            'QueueNumber': new_appointment.QueueNumber,
+            'AvailableSlots': new_appointment.AvailableSlots
+        }), 201
     else:
         from flask import flash, redirect, url_for
         flash('Appointment added successfully', 'success')
         return redirect(url_for('appointments.get_appointments'))
 
+def _doctor_id(value):
+    """The id of an existing doctor, or None if value is not one"""
+    try:
+        doctor_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return doctor_id if db.session.get(Doctors, doctor_id) else None
+
 @appointments_bp.route('/<int:appointment_id>', methods=['PUT', 'POST'])
 def update_appointment(appointment_id):
     appointment = Appointments.query.get_or_404(appointment_id)
+    old_doctor_id, old_date = appointment.DoctorID, appointment.AppointmentDate
     
     if request.is_json:
         data = request.json
+        if not isinstance(data, dict):
+            return jsonify({'message': 'Expected a JSON object'}), 400
+        # QueueNumber and AvailableSlots are assigned by queue_allocator.py
+        unknown = sorted(set(data) - {'PatientID', 'DoctorID', 'AppointmentDate'})
+        if unknown:
+            return jsonify({'message': f'Fields cannot be updated: {", ".join(unknown)}'}), 400
+        if data.get('DoctorID') is not None:
+            data['DoctorID'] = _doctor_id(data['DoctorID'])
+            if data['DoctorID'] is None:
+                return jsonify({'message': 'A valid doctor is required'}), 400
         try:
             for key, value in data.items():
                 if key == 'AppointmentDate' and value:
@@ -825,16 +1234,28 @@ def update_appointment(appointment_id):
         # Handle form data
         try:
             appointment.PatientID = request.form.get('patient_id')
-            appointment.DoctorID = request.form.get('doctor_id')
+            appointment.DoctorID = _doctor_id(request.form.get('doctor_id'))
+            if appointment.DoctorID is None:
+                raise ValueError('A valid doctor is required')
             appointment.AppointmentDate = datetime.strptime(request.form.get('date'), '%Y-%m-%dT%H:%M')
-            appointment.QueueNumber = request.form.get('queue_number')
-            appointment.AvailableSlots = request.form.get('available_slots')
         except Exception as e:
             db.session.rollback()
             from flask import flash, redirect, url_for
             flash(f'Error updating appointment: {str(e)}', 'danger')
             return redirect(url_for('appointments.get_appointments'))
     
+    # Moving to another doctor or day takes a number from that queue
+    try:
+        reallocate_if_moved(appointment, old_doctor_id, old_date)
+    except NoSlotsAvailable as e:
+        db.session.rollback()
+        if request.is_json:
+            return jsonify({'message': str(e)}), 409
+        flash(f'Error updating appointment: {str(e)}', 'danger')
+        return redirect(url_for('appointments.get_appointments'))
+    
+    if (appointment.DoctorID, appointment.AppointmentDate) != (old_doctor_id, old_date):
+        appointment_changed(old_doctor_id, old_date, appointment.DoctorID, appointment.AppointmentDate)
     db.session.commit()
     
     if request.is_json:
@@ -851,6 +1272,8 @@ def delete_appointment(appointment_id):
        
     try:
         db.session.delete(appointment)
+        release_queue_number(appointment.DoctorID, appointment.AppointmentDate, appointment.QueueNumber)
+        appointment_changed(old_doctor_id=appointment.DoctorID, old_date=appointment.AppointmentDate)
         db.session.commit()
         
         from flask import flash, redirect, url_for
@@ -861,3 +1284,16 @@ def delete_appointment(appointment_id):
         from flask import flash, redirect, url_for
         flash(f'Error deleting appointment: {str(e)}', 'danger')
     return redirect(url_for('appointments.get_appointments'))
+
+# Catalog Routes
+@catalog_bp.route('/<catalog>/autocomplete', methods=['GET'])
+@query_budget(2)
+def autocomplete_catalog(catalog):
+    # Typeahead for the doctor-orders form: /api/catalog/pharmacy/autocomplete?q=para
+    if catalog not in AUTOCOMPLETE_CATALOGS:
+        return jsonify({'message': f'Unknown catalog: {catalog}'}), 404
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'message': 'limit must be an integer'}), 400
+    return jsonify({'items': suggest(catalog, request.args.get('q', ''), limit)})
@@ -1,6 +1,6 @@
 -- Create enum types
 CREATE TYPE gender_enum AS ENUM ('Male', 'Female');
-CREATE TYPE role_enum AS ENUM ('Receptionist', 'Nurse', 'Doctor', 'Admin', 'Chemist', 'Radiologist', 'Pharmacist');
+CREATE TYPE role_enum AS ENUM ('Receptionist', 'Nurse', 'Doctor', 'Admin', 'Chemist', 'Radiologist', 'Pharmacist', 'Patient');
 
 -- Create Departments table
 CREATE TABLE "Departments" (
@@ -79,6 +79,9 @@ CREATE TABLE "Patients" (
     "MedicalHistory" TEXT
 );
 
+-- Patient record of a Patient-role login
+ALTER TABLE "Users" ADD COLUMN "PatientID" INTEGER REFERENCES "Patients"("PatientID");
+
 -- Create Appointments table
 CREATE TABLE "Appointments" (
     "AppointmentID" SERIAL PRIMARY KEY,
@@ -89,15 +92,15 @@ CREATE TABLE "Appointments" (
     "AvailableSlots" INTEGER
 );
 
--- Create Patient_MedicineUsage table (many-to-many relationship)
+-- Create Patient_MedicineUsage table (one row per dispense)
 CREATE TABLE "Patient_MedicineUsage" (
-    "PatientID" INTEGER REFERENCES "Patients"("PatientID"),
-    "MedicineID" INTEGER REFERENCES "Pharmacy"("MedicineID"),
-    "Dosage" VARCHAR(100),
-    "Frequency" VARCHAR(100),
-    "StartDate" TIMESTAMP,
-    "EndDate" TIMESTAMP,
-    PRIMARY KEY ("PatientID", "MedicineID")
+    "UsageID" SERIAL PRIMARY KEY,
+    "PatientID" INTEGER NOT NULL REFERENCES "Patients"("PatientID"),
+    "MedicineID" INTEGER NOT NULL REFERENCES "Pharmacy"("MedicineID"),
+    "UsageDate" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "QuantityUsed" INTEGER NOT NULL DEFAULT 1,
+    "DoctorID" INTEGER REFERENCES "Doctors"("DoctorID"),
+    "Notes" TEXT
 );
 
 -- Create Patient_Supplies table (many-to-many relationship)
@@ -109,12 +112,117 @@ CREATE TABLE "Patient_Supplies" (
     PRIMARY KEY ("PatientID", "SupplyID")
 );
 
+-- Create Patient_Orders table (normalized copy of Patients.DoctorOrders)
+CREATE TABLE "Patient_Orders" (
+    "PatientID" INTEGER REFERENCES "Patients"("PatientID"),
+    "ItemType" VARCHAR(20),
+    "ItemID" INTEGER,
+    PRIMARY KEY ("PatientID", "ItemType", "ItemID")
+);
+
+-- Create DoctorDayQueues table (per-doctor, per-day appointment queue counter)
+CREATE TABLE "DoctorDayQueues" (
+    "DoctorID" INTEGER REFERENCES "Doctors"("DoctorID"),
+    "QueueDate" DATE,
+    "LastQueueNumber" INTEGER NOT NULL DEFAULT 0,
+    "Booked" INTEGER NOT NULL DEFAULT 0,
+    "Capacity" INTEGER NOT NULL,
+    PRIMARY KEY ("DoctorID", "QueueDate")
+);
+
+-- Create SupplyUsage table (append-only supply consumption ledger)
+CREATE TABLE "SupplyUsage" (
+    "UsageID" SERIAL PRIMARY KEY,
+    "PatientID" INTEGER REFERENCES "Patients"("PatientID"),
+    "SupplyID" INTEGER REFERENCES "Supplies"("SupplyID"),
+    "QuantityUsed" INTEGER NOT NULL,
+    "DoctorID" INTEGER REFERENCES "Doctors"("DoctorID"),
+    "DateUsed" TIMESTAMP
+);
+
+-- Create SupplyUsageTotals table (running usage totals per supply)
+CREATE TABLE "SupplyUsageTotals" (
+    "SupplyID" INTEGER PRIMARY KEY REFERENCES "Supplies"("SupplyID"),
+    "QuantityUsed" INTEGER NOT NULL DEFAULT 0,
+    "PatientCount" INTEGER NOT NULL DEFAULT 0,
+    "LastUsed" TIMESTAMP
+);
+
+-- Create InventorySummary table (running stock totals per inventory, sharded)
+CREATE TABLE "InventorySummary" (
+    "Inventory" VARCHAR(20),
+    "Shard" INTEGER NOT NULL DEFAULT 0,
+    "ItemCount" INTEGER NOT NULL DEFAULT 0,
+    "TotalQuantity" INTEGER NOT NULL DEFAULT 0,
+    "TotalValue" FLOAT NOT NULL DEFAULT 0,
+    "LowStockCount" INTEGER NOT NULL DEFAULT 0,
+    "LowStockThreshold" INTEGER NOT NULL,
+    "UpdatedAt" TIMESTAMP,
+    PRIMARY KEY ("Inventory", "Shard")
+);
+
+-- Create InventoryDailyUsage table (stock consumed per inventory per day)
+CREATE TABLE "InventoryDailyUsage" (
+    "Inventory" VARCHAR(20),
+    "UsageDate" DATE,
+    "Shard" INTEGER NOT NULL DEFAULT 0,
+    "QuantityUsed" INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY ("Inventory", "UsageDate", "Shard")
+);
+
+-- Create PatientChanges table (change feed for the in-process patient search index)
+CREATE TABLE "PatientChanges" (
+    "Seq" SERIAL PRIMARY KEY,
+    "PatientID" INTEGER NOT NULL,
+    "ChangedAt" TIMESTAMP NOT NULL
+);
+
+-- Create DashboardCounters table (running counts for the role dashboards)
+CREATE TABLE "DashboardCounters" (
+    "Name" VARCHAR(80),
+    "Shard" INTEGER NOT NULL DEFAULT 0,
+    "Value" INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY ("Name", "Shard")
+);
+
+-- Create CatalogVersions table (version per cached reference catalog)
+CREATE TABLE "CatalogVersions" (
+    "Name" VARCHAR(50) PRIMARY KEY,
+    "Version" INTEGER NOT NULL DEFAULT 0
+);
+
+-- Create RevokedTokens table (API tokens revoked before they expire)
+CREATE TABLE "RevokedTokens" (
+    "JTI" VARCHAR(32) PRIMARY KEY,
+    "ExpiresAt" TIMESTAMP NOT NULL
+);
+
 -- Create indexes for better performance
 CREATE INDEX idx_doctors_department ON "Doctors"("DepartmentID");
 CREATE INDEX idx_patients_doctor ON "Patients"("Doctor");
 CREATE INDEX idx_appointments_patient ON "Appointments"("PatientID");
 CREATE INDEX idx_appointments_doctor ON "Appointments"("DoctorID");
-CREATE INDEX idx_patient_medicine_patient ON "Patient_MedicineUsage"("PatientID");
+CREATE INDEX idx_appointments_patient_date ON "Appointments"("PatientID", "AppointmentDate");
+CREATE INDEX idx_users_patient ON "Users"("PatientID");
+CREATE INDEX idx_users_email ON "Users"("Email");
+CREATE INDEX idx_patients_email ON "Patients"("Email");
+CREATE INDEX idx_patients_admission ON "Patients"("Date_admission");
+CREATE INDEX idx_patients_discharge ON "Patients"("Date_discharge");
+CREATE INDEX idx_appointments_date ON "Appointments"("AppointmentDate");
+CREATE INDEX idx_medicine_usage_patient_date ON "Patient_MedicineUsage"("PatientID", "UsageDate");
 CREATE INDEX idx_patient_medicine_medicine ON "Patient_MedicineUsage"("MedicineID");
 CREATE INDEX idx_patient_supplies_patient ON "Patient_Supplies"("PatientID");
-CREATE INDEX idx_patient_supplies_supply ON "Patient_Supplies"("SupplyID");
\ No newline at end of file
+CREATE INDEX idx_patient_supplies_supply ON "Patient_Supplies"("SupplyID");
+CREATE INDEX idx_patient_orders_item ON "Patient_Orders"("ItemType", "ItemID", "PatientID");
+CREATE INDEX idx_supply_usage_patient ON "SupplyUsage"("PatientID");
+CREATE INDEX idx_supply_usage_supply ON "SupplyUsage"("SupplyID");
+CREATE INDEX idx_supply_usage_date ON "SupplyUsage"("DateUsed");
+CREATE INDEX idx_patient_changes_changed_at ON "PatientChanges"("ChangedAt");
+CREATE INDEX idx_revoked_tokens_expires ON "RevokedTokens"("ExpiresAt");
+
+-- Trigram indexes for /api/patients/search (pg_trgm)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX idx_patients_name_trgm ON "Patients" USING gin ("Name" gin_trgm_ops);
+CREATE INDEX idx_patients_national_id_trgm ON "Patients" USING gin ("NationalID" gin_trgm_ops);
+CREATE INDEX idx_patients_phone_trgm ON "Patients" USING gin ("Phone" gin_trgm_ops);
+CREATE INDEX idx_patients_email_trgm ON "Patients" USING gin ("Email" gin_trgm_ops);
\ No newline at end of file
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from flask import request, has_request_context
+from sqlalchemy import event
+
+# Slow-query log.
+# Statements slower than SLOW_QUERY_MS are logged as one JSON object per line
+# with the Flask endpoint and the app.py/routes.py line that issued them: to
+# app.logger, or with SLOW_QUERY_LOG_PATH set to that file, rotated at
+# SLOW_QUERY_LOG_MAX_BYTES. Bound values are
+# never logged, only their shape, as they hold patient data. With
+# SLOW_QUERY_EXPLAIN the plan of each distinct slow SELECT is captured once.
+DEFAULT_THRESHOLD_MS = 200
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+SQL_MAX_LENGTH = 2000
+RECENT = 200
+SITE_FILES = ('app.py', 'routes.py')
+ROOT = os.path.dirname(os.path.abspath(__file__)) + os.sep
+MAX_EXPLAINED = 1000
+EXPLAIN_PREFIX = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN ', 'mysql': 'EXPLAIN '}
+WHITESPACE = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_recent = deque(maxlen=RECENT)
+
+def recent_slow_queries():
+    """The latest slow queries of this worker, newest first"""
+    with _lock:
+        return list(reversed(_recent))
+
+def parameter_shape(parameters):
+    """Type names in place of the bound values"""
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+def _call_site():
+    """file:line function of the innermost app.py/routes.py frame, else of the app's own code"""
+    fallback = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(ROOT) and filename != __file__ and os.sep + 'benchmarks' + os.sep not in filename:
+            site = f'{os.path.basename(filename)}:{frame.f_lineno} {frame.f_code.co_name}'
+            if os.path.basename(filename) in SITE_FILES:
+                return site
+            fallback = fallback or site
+        frame = frame.f_back
+    return fallback
+
+def explain(conn, statement, parameters):
+    """Plan lines of a statement as the database would run it, None if unsupported"""
+    prefix = EXPLAIN_PREFIX.get(conn.dialect.name)
+    if prefix is None:
+        return None
+    # A raw DBAPI cursor, so the EXPLAIN itself is neither timed nor logged
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        rows = cursor.fetchall()
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+    finally:
+        cursor.close()
+    # SQLite: (id, parent, notused, detail); PostgreSQL/MySQL: plan text columns
+    if conn.dialect.name == 'sqlite':
+        return [row[-1] for row in rows]
+    return [' '.join(str(column) for column in row if column is not None) for row in rows]
+
+class SlowQueryLog:
+    """Cursor listeners of one app's engines"""
+
+    def __init__(self, app):
+        self.threshold = app.config.get('SLOW_QUERY_MS', DEFAULT_THRESHOLD_MS) / 1000
+        self.explain = app.config.get('SLOW_QUERY_EXPLAIN', False)
+        self.explained = set()
+        path = app.config.get('SLOW_QUERY_LOG_PATH')
+        if not path:
+            self.logger = app.logger
+            return
+        self.logger = logging.getLogger(f'{app.import_name}.slow_queries')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        if not any(getattr(handler, 'baseFilename', None) == os.path.abspath(path)
+                   for handler in self.logger.handlers):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=app.config.get('SLOW_QUERY_LOG_MAX_BYTES', DEFAULT_MAX_BYTES),
+                                          backupCount=app.config.get('SLOW_QUERY_LOG_BACKUPS', DEFAULT_BACKUPS),
+                                          delay=True)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+
+    def listen(self, engine):
+        event.listen(engine, 'before_cursor_execute', self.before)
+        event.listen(engine, 'after_cursor_execute', self.after)
+
+    # The start time is kept on the execution context, which is dropped with
+    # the statement, so one that raises leaves nothing behind
+    def before(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_started = time.perf_counter()
+
+    def after(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_slow_query_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed < self.threshold:
+            return
+        sql = WHITESPACE.sub(' ', statement).strip()
+        entry = {
+            'at': datetime.now().isoformat(timespec='milliseconds'),
+            'ms': round(elapsed * 1000, 1),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'site': _call_site(),
+            'sql': sql[:SQL_MAX_LENGTH],
+            'params': parameter_shape(parameters[0] if executemany and parameters else parameters),
+            'rows': cursor.rowcount if cursor.rowcount >= 0 else None,
+        }
+        if executemany:
+            entry['executemany'] = len(parameters)
+        if self.explain and not executemany and sql.upper().startswith(('SELECT', 'WITH')) \
+                and sql not in self.explained and len(self.explained) < MAX_EXPLAINED:
+            self.explained.add(sql)
+            entry['plan'] = explain(conn, statement, parameters)
+        with _lock:
+            _recent.append(entry)
+        self.logger.warning(json.dumps(entry, separators=(',', ':'), default=str))
+
+def init_slow_query_log(app, engines):
+    """Log slow statements of the app's engines; SLOW_QUERY_MS = None turns it off"""
+    if app.config.get('SLOW_QUERY_MS', DEFAULT_THRESHOLD_MS) is None:
+        return
+    log = SlowQueryLog(app)
+    for engine in engines:
+        log.listen(engine)
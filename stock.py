@@ -0,0 +1,398 @@
+import random
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, case, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from extensions import db
+from tracking import track_history, committed_value
+from models import (Pharmacy, Patient_MedicineUsage, Supplies, Patient_Supplies, SupplyUsage, SupplyUsageTotals,
+                    InventorySummary, InventoryDailyUsage)
+
+# Inventory summaries
+# Every stock change becomes a delta: ORM edits of Pharmacy/Supplies rows are
+# collected in before_flush, take_stock() records its own. Just before commit
+# the deltas are added to one of INVENTORY_SUMMARY_SHARDS InventorySummary
+# rows, picked at random, so concurrent commits rarely wait on the same row
+# lock; dashboards sum the shards instead of scanning the tables. Items that
+# cross LOW_STOCK_THRESHOLD are passed to the on_low_stock() listeners once
+# the commit succeeds.
+DEFAULT_LOW_STOCK_THRESHOLD = 10
+DEFAULT_USAGE_WINDOW_DAYS = 14
+DEFAULT_SUMMARY_SHARDS = 8
+
+INVENTORIES = {
+    'pharmacy': (Pharmacy, Pharmacy.MedicineID, Pharmacy.Quantity, Pharmacy.UnitPrice),
+    'supplies': (Supplies, Supplies.SupplyID, Supplies.Quantity, Supplies.UnitPrice),
+}
+_inventory_of = {spec[0]: name for name, spec in INVENTORIES.items()}
+track_history(*[column for spec in INVENTORIES.values() for column in spec[2:]])
+_low_stock_listeners = []
+
+class InsufficientStock(Exception):
+    """Raised when an item does not have enough stock left"""
+    def __init__(self, item_id, requested):
+        super().__init__(f'Not enough stock for item {item_id} (requested {requested})')
+        self.item_id = item_id
+        self.requested = requested
+
+def merge_items(items, id_key):
+    """Sum quantities per item id; sorted so concurrent batches lock rows in the same order"""
+    totals = {}
+    for item in items:
+        item_id = int(item[id_key])
+        quantity = int(item.get('Quantity', 1))
+        if quantity <= 0:
+            raise ValueError(f'Quantity for item {item_id} must be positive')
+        totals[item_id] = totals.get(item_id, 0) + quantity
+    return sorted(totals.items())
+
+def take_stock(model, id_column, quantity_column, items):
+    """Atomically decrement stock for (item id, quantity) pairs if enough is left.
+
+    Issues UPDATE ... SET q = q - n WHERE id = :id AND q >= n per item, so there
+    is no read-modify-write window; raises InsufficientStock when no row matched.
+    """
+    for item_id, quantity in items:
+        taken = (db.session.query(model)
+                 .filter(id_column == item_id, quantity_column >= quantity)
+                 .update({quantity_column: quantity_column - quantity}, synchronize_session=False))
+        if not taken:
+            raise InsufficientStock(item_id, quantity)
+
+    inventory = _inventory_of.get(model)
+    if inventory and items:
+        price_column = INVENTORIES[inventory][3]
+        # The rows are locked by the UPDATEs above, so these are the values we left
+        rows = {item_id: (remaining, _as_number(price, float)) for item_id, remaining, price in
+                db.session.query(id_column, quantity_column, price_column)
+                .filter(id_column.in_([item_id for item_id, _ in items]))}
+        for item_id, quantity in items:
+            remaining, price = rows[item_id]
+            _record_change(db.session, inventory, item_id,
+                           (remaining + quantity, price), (remaining, price), used=quantity)
+
+def dispense_medicines(patient_id, doctor_id, items, notes=None):
+    """Record medicine usage and decrement Pharmacy stock in the caller's transaction.
+
+    items is a list of {'MedicineID': ..., 'Quantity': ...}. Either every
+    item is dispensed or InsufficientStock is raised; the caller commits
+    or rolls back.
+    """
+    now = datetime.utcnow()
+    patient_id = int(patient_id)
+    doctor_id = int(doctor_id) if doctor_id is not None else None
+    merged = merge_items(items, 'MedicineID')
+    take_stock(Pharmacy, Pharmacy.MedicineID, Pharmacy.Quantity, merged)
+
+    db.session.execute(Patient_MedicineUsage.__table__.insert(), [
+        {
+            'PatientID': patient_id,
+            'MedicineID': medicine_id,
+            'UsageDate': now,
+            'QuantityUsed': quantity,
+            'DoctorID': doctor_id,
+            'Notes': notes
+        }
+        for medicine_id, quantity in merged
+    ])
+    return merged
+
+def add_to_total(model, key, values, defaults):
+    """Increment a running-total row, creating it on first use.
+
+    Returns True if this call created the row.
+    """
+    def increment():
+        return (db.session.query(model).filter_by(**key)
+                .update(values, synchronize_session=False))
+    if increment():
+        return False
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(**key, **defaults))
+        return True
+    except IntegrityError:
+        # Another transaction created it first
+        increment()
+        return False
+
+def use_supplies(patient_id, doctor_id, items):
+    """Record supply usage for a patient in the caller's transaction.
+
+    Decrements Supplies stock, appends to the SupplyUsage ledger and bumps
+    the per-patient (Patient_Supplies) and per-supply (SupplyUsageTotals)
+    totals. Either every item is recorded or InsufficientStock is raised.
+    """
+    now = datetime.utcnow()
+    patient_id = int(patient_id)
+    doctor_id = int(doctor_id) if doctor_id is not None else None
+    merged = merge_items(items, 'SupplyID')
+    take_stock(Supplies, Supplies.SupplyID, Supplies.Quantity, merged)
+
+    db.session.execute(SupplyUsage.__table__.insert(), [
+        {
+            'PatientID': patient_id,
+            'SupplyID': supply_id,
+            'QuantityUsed': quantity,
+            'DoctorID': doctor_id,
+            'DateUsed': now
+        }
+        for supply_id, quantity in merged
+    ])
+
+    for supply_id, quantity in merged:
+        new_patient = add_to_total(
+            Patient_Supplies,
+            {'PatientID': patient_id, 'SupplyID': supply_id},
+            {Patient_Supplies.QuantityUsed: func.coalesce(Patient_Supplies.QuantityUsed, 0) + quantity,
+             Patient_Supplies.DoctorID: doctor_id,
+             Patient_Supplies.DateUsed: now},
+            {'QuantityUsed': quantity, 'DoctorID': doctor_id, 'DateUsed': now})
+        add_to_total(
+            SupplyUsageTotals,
+            {'SupplyID': supply_id},
+            {SupplyUsageTotals.QuantityUsed: SupplyUsageTotals.QuantityUsed + quantity,
+             SupplyUsageTotals.PatientCount: SupplyUsageTotals.PatientCount + (1 if new_patient else 0),
+             SupplyUsageTotals.LastUsed: now},
+            {'QuantityUsed': quantity, 'PatientCount': 1 if new_patient else 0, 'LastUsed': now})
+    return merged
+
+def rebuild_supply_totals():
+    """Recompute SupplyUsageTotals from Patient_Supplies (backfill or repair)"""
+    rows = (db.session.query(Patient_Supplies.SupplyID,
+                             func.coalesce(func.sum(Patient_Supplies.QuantityUsed), 0),
+                             func.count(Patient_Supplies.PatientID),
+                             func.max(Patient_Supplies.DateUsed))
+            .group_by(Patient_Supplies.SupplyID)
+            .all())
+    SupplyUsageTotals.query.delete(synchronize_session=False)
+    if rows:
+        db.session.execute(SupplyUsageTotals.__table__.insert(), [
+            {'SupplyID': supply_id, 'QuantityUsed': int(used), 'PatientCount': patients, 'LastUsed': last_used}
+            for supply_id, used, patients, last_used in rows
+        ])
+    db.session.commit()
+    return len(rows)
+
+def on_low_stock(listener):
+    """Register listener(crossing) for low-stock threshold crossings; usable as a decorator.
+
+    crossing is a dict with Inventory, ItemID, Quantity, Threshold and Low
+    (True when the item dropped below the threshold, False when restocked).
+    """
+    _low_stock_listeners.append(listener)
+    return listener
+
+@on_low_stock
+def _log_low_stock(crossing):
+    if crossing['Low']:
+        current_app.logger.warning('Low stock: %s item %s has %s left (threshold %s)',
+                                   crossing['Inventory'], crossing['ItemID'], crossing['Quantity'], crossing['Threshold'])
+
+def _threshold():
+    return current_app.config.get('LOW_STOCK_THRESHOLD', DEFAULT_LOW_STOCK_THRESHOLD)
+
+def _shards():
+    return max(1, current_app.config.get('INVENTORY_SUMMARY_SHARDS', DEFAULT_SUMMARY_SHARDS))
+
+def _as_number(value, kind):
+    # Form posts assign strings to Quantity/UnitPrice
+    try:
+        return kind(value or 0)
+    except (TypeError, ValueError):
+        return kind(0)
+
+def _record_change(session, inventory, item_id, old, new, used=0):
+    """Queue one item's (quantity, price) change; old is None on create, new on delete"""
+    pending = session.info.setdefault('inventory_changes', {})
+    delta = pending.setdefault(inventory, {
+        'items': 0, 'quantity': 0, 'value': 0.0, 'low': 0, 'used': 0, 'crossings': []
+    })
+    threshold = _threshold()
+    for sign, state in ((-1, old), (1, new)):
+        if state is None:
+            continue
+        quantity, price = state
+        delta['items'] += sign
+        delta['quantity'] += sign * quantity
+        delta['value'] += sign * quantity * price
+        delta['low'] += sign * (quantity < threshold)
+    delta['used'] += used
+    if old is not None and new is not None and (old[0] < threshold) != (new[0] < threshold):
+        delta['crossings'].append({
+            'Inventory': inventory,
+            'ItemID': item_id,
+            'Quantity': new[0],
+            'Threshold': threshold,
+            'Low': new[0] < threshold
+        })
+
+def _stock_state(obj, inventory, current):
+    quantity_key = INVENTORIES[inventory][2].key
+    price_key = INVENTORIES[inventory][3].key
+    value = getattr if current else committed_value
+    return _as_number(value(obj, quantity_key), int), _as_number(value(obj, price_key), float)
+
+@event.listens_for(Session, 'before_flush')
+def _collect_stock_edits(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        inventory = _inventory_of.get(type(obj))
+        if inventory is None:
+            continue
+        item_id = getattr(obj, INVENTORIES[inventory][1].key)
+        if obj in session.deleted:
+            _record_change(session, inventory, item_id, _stock_state(obj, inventory, False), None)
+        elif obj in session.new:
+            _record_change(session, inventory, item_id, None, _stock_state(obj, inventory, True))
+        else:
+            old, new = _stock_state(obj, inventory, False), _stock_state(obj, inventory, True)
+            if old != new:
+                _record_change(session, inventory, item_id, old, new)
+
+def _summarize(inventory, threshold):
+    model, _, quantity_column, price_column = INVENTORIES[inventory]
+    quantity = func.coalesce(quantity_column, 0)
+    items, total_quantity, total_value, low = db.session.query(
+        func.count(),
+        func.coalesce(func.sum(quantity), 0),
+        func.coalesce(func.sum(quantity * func.coalesce(price_column, 0)), 0),
+        func.coalesce(func.sum(case((quantity < threshold, 1), else_=0)), 0)
+    ).select_from(model).one()
+    return {
+        'ItemCount': items,
+        'TotalQuantity': int(total_quantity),
+        'TotalValue': float(total_value),
+        'LowStockCount': int(low),
+        'LowStockThreshold': threshold,
+        'UpdatedAt': datetime.utcnow()
+    }
+
+def _store_shard(inventory, shard, values):
+    def overwrite():
+        return (InventorySummary.query.filter_by(Inventory=inventory, Shard=shard)
+                .update(values, synchronize_session=False))
+    if overwrite():
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(InventorySummary(Inventory=inventory, Shard=shard, **values))
+    except IntegrityError:
+        overwrite()
+
+def _store_summary(inventory, values):
+    # The totals go in shard 0; the other shards restart from zero
+    shards = _shards()
+    (InventorySummary.query
+     .filter(InventorySummary.Inventory == inventory, InventorySummary.Shard >= shards)
+     .delete(synchronize_session=False))
+    empty = dict(values, ItemCount=0, TotalQuantity=0, TotalValue=0.0, LowStockCount=0)
+    for shard in range(shards):
+        _store_shard(inventory, shard, values if shard == 0 else empty)
+
+def _apply_delta(inventory, delta):
+    threshold = _threshold()
+    now = datetime.utcnow()
+    shard = random.randrange(_shards())
+    updated = (InventorySummary.query
+               .filter_by(Inventory=inventory, Shard=shard, LowStockThreshold=threshold)
+               .update({
+                   InventorySummary.ItemCount: InventorySummary.ItemCount + delta['items'],
+                   InventorySummary.TotalQuantity: InventorySummary.TotalQuantity + delta['quantity'],
+                   InventorySummary.TotalValue: InventorySummary.TotalValue + delta['value'],
+                   InventorySummary.LowStockCount: InventorySummary.LowStockCount + delta['low'],
+                   InventorySummary.UpdatedAt: now
+               }, synchronize_session=False))
+    if not updated:
+        # Missing, or built with another threshold or shard count: rebuild
+        # from the table, which already includes this transaction's changes
+        _store_summary(inventory, _summarize(inventory, threshold))
+
+    if delta['used']:
+        add_to_total(
+            InventoryDailyUsage,
+            {'Inventory': inventory, 'UsageDate': now.date(), 'Shard': shard},
+            {InventoryDailyUsage.QuantityUsed: InventoryDailyUsage.QuantityUsed + delta['used']},
+            {'QuantityUsed': delta['used']})
+
+@event.listens_for(Session, 'before_commit')
+def _apply_stock_changes(session):
+    # Savepoint commits fire this event too; only act on the real commit
+    if session.in_nested_transaction() or session.info.get('applying_inventory_changes'):
+        return
+    session.flush()
+    pending = session.info.pop('inventory_changes', None)
+    if not pending:
+        return
+    session.info['applying_inventory_changes'] = True
+    try:
+        for inventory, delta in pending.items():
+            _apply_delta(inventory, delta)
+            session.info.setdefault('low_stock_events', []).extend(delta['crossings'])
+    finally:
+        session.info.pop('applying_inventory_changes', None)
+
+@event.listens_for(Session, 'after_commit')
+def _fire_low_stock(session):
+    if session.in_nested_transaction():
+        return
+    for crossing in session.info.pop('low_stock_events', None) or []:
+        for listener in _low_stock_listeners:
+            try:
+                listener(crossing)
+            except Exception:
+                current_app.logger.exception('Low-stock listener failed')
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stock_changes(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('inventory_changes', None)
+    session.info.pop('low_stock_events', None)
+
+def inventory_summary(inventory):
+    """Dashboard figures for 'pharmacy' or 'supplies' without scanning the items table"""
+    threshold = _threshold()
+    shards = InventorySummary.query.filter_by(Inventory=inventory).all()
+    if shards and all(shard.LowStockThreshold == threshold for shard in shards):
+        totals = {
+            'ItemCount': sum(shard.ItemCount for shard in shards),
+            'TotalQuantity': sum(shard.TotalQuantity for shard in shards),
+            'TotalValue': sum(shard.TotalValue for shard in shards),
+            'LowStockCount': sum(shard.LowStockCount for shard in shards),
+            'UpdatedAt': max((shard.UpdatedAt for shard in shards if shard.UpdatedAt), default=None)
+        }
+    else:
+        # Missing or built with another threshold: scan without storing, the
+        # next stock change (or flask rebuild-inventory-summary) rebuilds it
+        totals = _summarize(inventory, threshold)
+    total_quantity = totals['TotalQuantity']
+    updated_at = totals['UpdatedAt']
+
+    window = current_app.config.get('INVENTORY_USAGE_WINDOW_DAYS', DEFAULT_USAGE_WINDOW_DAYS)
+    # UsageDate keys are UTC days (_apply_delta), so the window is too
+    today = datetime.utcnow().date()
+    used = (db.session.query(func.coalesce(func.sum(InventoryDailyUsage.QuantityUsed), 0))
+            .filter(InventoryDailyUsage.Inventory == inventory,
+                    InventoryDailyUsage.UsageDate > today - timedelta(days=window))
+            .scalar())
+    daily_usage = int(used) / window
+    return {
+        'Inventory': inventory,
+        'ItemCount': totals['ItemCount'],
+        'TotalQuantity': total_quantity,
+        'TotalValue': round(totals['TotalValue'], 2),
+        'LowStockCount': totals['LowStockCount'],
+        'LowStockThreshold': threshold,
+        'DailyUsage': round(daily_usage, 2),
+        'DaysOfCover': round(total_quantity / daily_usage, 1) if daily_usage else None,
+        'UpdatedAt': updated_at.isoformat() if updated_at else None
+    }
+
+def rebuild_inventory_summary(inventory=None):
+    """Recompute InventorySummary rows from the items tables (backfill or repair)"""
+    names = [inventory] if inventory else list(INVENTORIES)
+    for name in names:
+        _store_summary(name, _summarize(name, _threshold()))
+    db.session.commit()
+    return names
@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from extensions import db
+from query_budget import api_app, STEADY_CONFIG
+from seed import seed, seed_users
+
+@pytest.fixture
+def make_app():
+    """make_app(scale, **config) -> (app, {role: UserID}): the routes.py blueprints on in-memory SQLite"""
+    def make(scale=0, **config):
+        app = api_app()
+        app.config['TESTING'] = True
+        app.config.update(STEADY_CONFIG, **config)
+        with app.app_context():
+            db.create_all()
+            users = seed_users()
+            if scale:
+                seed(scale)
+        return app, users
+    return make
+
+@pytest.fixture
+def login():
+    """login(client, users, role): put a user of that role in the client's session"""
+    def log_in(client, users, role):
+        with client.session_transaction() as session:
+            session.update(user_id=users[role], user_role=role, user_name=f'Bench {role}')
+    return log_in
+
+@pytest.fixture
+def count_queries():
+    """with count_queries(engine) as queries: ... -> queries[0] statements ran inside the block"""
+    @contextmanager
+    def counting(engine):
+        queries = [0]
+
+        def count(*args):
+            queries[0] += 1
+
+        event.listen(engine, 'after_cursor_execute', count)
+        try:
+            yield queries
+        finally:
+            event.remove(engine, 'after_cursor_execute', count)
+    return counting
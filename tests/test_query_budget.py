@@ -0,0 +1,6 @@
+from query_budget import check
+
+def test_api_routes_stay_within_query_budgets():
+    # Each scale is measured in a forked process (benchmarks/query_budget.py)
+    failures = [(endpoint, result) for endpoint, *_, result, failed in check(api_only=True) if failed]
+    assert failures == []
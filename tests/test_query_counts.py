@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from extensions import db
+from chart import patient_chart
+from loading import with_loading
+from models import Appointments, Patients, Patient_MedicineUsage
+from patient_portal import dashboard_appointments
+
+SMALL, LARGE = 3, 12
+
+def _appointments_json(make_app, count_queries, scale):
+    """(items returned, statements run) for the JSON appointment list at one seed size"""
+    app, users = make_app(scale)
+    with app.app_context():
+        seeded = Appointments.query.count()
+        engine = db.engine
+
+    # Outside any app context, so the request gets its own session
+    client = app.test_client()
+    with count_queries(engine) as queries:
+        response = client.get('/api/appointments/', headers={'Accept': 'application/json'})
+    assert response.status_code == 200
+    items = response.get_json()['items']
+    assert len(items) == seeded
+    assert all(item['patient'] for item in items)
+    return len(items), queries[0]
+
+def test_appointment_list_query_count_does_not_grow(make_app, count_queries):
+    small_rows, small_queries = _appointments_json(make_app, count_queries, SMALL)
+    large_rows, large_queries = _appointments_json(make_app, count_queries, LARGE)
+    assert large_rows > small_rows
+    assert large_queries == small_queries
+
+def _orm_paths(make_app, count_queries, scale):
+    """Statements run by each with_loading() path at one seed size"""
+    app, users = make_app(scale)
+    counts = {}
+    with app.app_context():
+        # Give the first patient every appointment and dispense, so the chart
+        # and the portal dashboard grow with the scale too
+        patient_id = db.session.query(db.func.min(Patients.PatientID)).scalar()
+        Appointments.query.update({'PatientID': patient_id})
+        Patient_MedicineUsage.query.update({'PatientID': patient_id})
+        db.session.commit()
+        db.session.expunge_all()
+
+        with count_queries(db.engine) as queries:
+            rows = with_loading(Appointments.query, 'appointments.html').all()
+            assert all(row.patient.Name and row.doctor.Name for row in rows)
+        counts['appointments.html'] = queries[0]
+        db.session.expunge_all()
+
+        with count_queries(db.engine) as queries:
+            rows = with_loading(Patients.query, 'patients.dropdown').all()
+            assert all(row.Name for row in rows)
+        counts['patients.dropdown'] = queries[0]
+        db.session.expunge_all()
+
+        with count_queries(db.engine) as queries:
+            chart = patient_chart(patient_id, default_limit=500)
+        assert len(chart['appointments']['items']) == Appointments.query.count()
+        assert all(item['DoctorName'] for item in chart['appointments']['items'])
+        assert all(item['MedicineName'] for item in chart['medicine_usage']['items'])
+        counts['chart'] = queries[0]
+        db.session.expunge_all()
+
+        now = datetime.now()
+        with count_queries(db.engine) as queries:
+            rows = dashboard_appointments(patient_id, now)
+            assert rows and all(appointment.doctor.Name for appointment, status in rows)
+        counts['appointments.patient_dashboard'] = queries[0]
+    return counts
+
+def test_loading_strategies_query_count_does_not_grow(make_app, count_queries):
+    small = _orm_paths(make_app, count_queries, SMALL)
+    large = _orm_paths(make_app, count_queries, LARGE)
+    assert large == small
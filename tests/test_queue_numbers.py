@@ -0,0 +1,38 @@
+from extensions import db
+from models import Appointments, Doctors, Patients
+
+DAY = '2031-03-04'
+
+def _book(client, patient_id, doctor_id, hour):
+    return client.post('/api/appointments/', json={
+        'PatientID': patient_id, 'DoctorID': doctor_id, 'AppointmentDate': f'{DAY} {hour:02d}:00'})
+
+def test_queue_numbers_are_unique_and_reused_within_capacity(make_app, login):
+    app, users = make_app(3, APPOINTMENT_DAILY_SLOTS=3)
+    with app.app_context():
+        patient_id = db.session.query(db.func.min(Patients.PatientID)).scalar()
+        doctor_id = db.session.query(db.func.min(Doctors.DoctorID)).scalar()
+    client = app.test_client()
+    login(client, users, 'Admin')
+
+    booked = [_book(client, patient_id, doctor_id, 9 + i) for i in range(3)]
+    assert [response.status_code for response in booked] == [201] * 3
+    assert _book(client, patient_id, doctor_id, 12).status_code == 409
+
+    # Cancelling the second booking frees its number, and only that one
+    client.post(f"/api/appointments/delete/{booked[1].get_json()['AppointmentID']}")
+    assert _book(client, patient_id, doctor_id, 13).status_code == 201
+    assert _book(client, patient_id, doctor_id, 14).status_code == 409
+
+    with app.app_context():
+        numbers = [number for number, in db.session.query(Appointments.QueueNumber)
+                   .filter(Appointments.DoctorID == doctor_id,
+                           db.func.date(Appointments.AppointmentDate) == DAY)]
+    assert sorted(numbers) == [1, 2, 3]
+
+def test_unknown_doctor_is_rejected(make_app, login):
+    app, users = make_app(3)
+    client = app.test_client()
+    login(client, users, 'Admin')
+    for doctor_id in ('abc', None):
+        assert _book(client, 1, doctor_id, 9).status_code == 400
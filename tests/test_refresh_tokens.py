@@ -0,0 +1,34 @@
+import time
+import auth_tokens
+from auth_tokens import create_tokens
+from extensions import db
+from models import Users
+
+def _refresh(client, token):
+    return client.post('/api/auth/refresh', json={'refresh_token': token})
+
+def test_refresh_token_is_single_use_across_workers(make_app):
+    app, users = make_app()
+    with app.app_context():
+        _, refresh_token = create_tokens(db.session.get(Users, users['Admin']))
+    client = app.test_client()
+
+    response = _refresh(client, refresh_token)
+    assert response.status_code == 200
+    # As another worker whose revocation cache has not caught up yet
+    auth_tokens._revoked.clear()
+    auth_tokens._revoked_checked_at = time.monotonic()
+    assert _refresh(client, refresh_token).status_code == 401
+    assert _refresh(client, response.get_json()['refresh_token']).status_code == 200
+
+def test_revoked_refresh_token_is_rejected(make_app):
+    app, users = make_app()
+    with app.app_context():
+        _, refresh_token = create_tokens(db.session.get(Users, users['Admin']))
+    client = app.test_client()
+    assert client.post('/api/auth/logout', json={'refresh_token': refresh_token}).status_code == 200
+    # Revoking twice, as concurrent logouts on two workers would, is not an error
+    auth_tokens._revoked.clear()
+    auth_tokens._revoked_checked_at = time.monotonic()
+    assert client.post('/api/auth/logout', json={'refresh_token': refresh_token}).status_code == 200
+    assert _refresh(client, refresh_token).status_code == 401
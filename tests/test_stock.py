@@ -0,0 +1,36 @@
+from sqlalchemy import text
+from extensions import db
+from models import Pharmacy, Patients
+
+def _setup(make_app, login):
+    app, users = make_app(3)
+    with app.app_context():
+        # SQLite leaves foreign keys unchecked unless asked; the in-memory
+        # database keeps this one connection for the whole test
+        db.session.execute(text('PRAGMA foreign_keys=ON'))
+        db.session.commit()
+        patient_id = db.session.query(db.func.min(Patients.PatientID)).scalar()
+        medicine = db.session.query(Pharmacy.MedicineID, Pharmacy.Quantity).order_by(Pharmacy.MedicineID).first()
+    client = app.test_client()
+    login(client, users, 'Admin')
+    return app, client, patient_id, medicine
+
+def test_dispensing_never_oversells(make_app, login):
+    app, client, patient_id, (medicine_id, quantity) = _setup(make_app, login)
+    items = [{'MedicineID': medicine_id, 'Quantity': quantity - 1}, {'MedicineID': medicine_id, 'Quantity': 1}]
+    response = client.post('/api/pharmacy/dispense', json={'PatientID': patient_id, 'items': items})
+    assert response.status_code == 201
+    response = client.post('/api/pharmacy/dispense', json={
+        'PatientID': patient_id, 'items': [{'MedicineID': medicine_id, 'Quantity': 1}]})
+    assert response.status_code == 409
+    with app.app_context():
+        assert db.session.get(Pharmacy, medicine_id).Quantity == 0
+
+def test_unknown_patient_or_doctor_is_rejected(make_app, login):
+    app, client, patient_id, (medicine_id, quantity) = _setup(make_app, login)
+    items = [{'MedicineID': medicine_id, 'Quantity': 1}]
+    for body in ({'PatientID': 10**6}, {'PatientID': patient_id, 'DoctorID': 10**6}, {'PatientID': 'x'}):
+        response = client.post('/api/pharmacy/dispense', json=dict(body, items=items))
+        assert response.status_code == 400
+    with app.app_context():
+        assert db.session.get(Pharmacy, medicine_id).Quantity == quantity
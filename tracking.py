@@ -0,0 +1,24 @@
+from sqlalchemy import event, inspect
+
+# Helpers for session listeners that turn ORM edits into deltas
+# (stock.py, autocomplete.py, dashboard_stats.py).
+
+def track_history(*attributes):
+    """Make setting these attributes load the old value first.
+
+    Without this, assigning to an attribute that was expired (e.g. after a
+    commit) records no old value, so a delta cannot be computed.
+    """
+    for attribute in attributes:
+        event.listen(attribute, 'set', lambda target, value, oldvalue, initiator: None,
+                     active_history=True)
+
+def committed_value(obj, key):
+    """Value of an attribute as it is in the database, before pending changes"""
+    history = inspect(obj).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        # Set with no previous value
+        return None
+    return getattr(obj, key)